@@ -0,0 +1,63 @@
+"""WSGI(sync view)와 ASGI(async view) 비교 benchmark
+
+같은 Redis를 사용하는 두 서버를 띄운 뒤 동일한 부하를 보내고 결과를 JSON으로 출력한다.
+
+    gunicorn -w 1 --threads 32 -b 127.0.0.1:8000 faceai_central.wsgi
+    uvicorn --workers 1 --port 8001 faceai_central.asgi:application
+    python -m benchmarks.asgi_vs_wsgi --wsgi http://127.0.0.1:8000 --asgi http://127.0.0.1:8001
+
+시나리오
+    poll:     빈 queue에 대한 /ftp/tasks/ polling (wait=0)
+    longpoll: 빈 queue에 대한 /ftp/tasks/?wait=N long-polling; 동시 connection 수가 thread 수를 넘을 때의 차이를 본다
+    info:     /info/ 조회
+"""
+import argparse
+import asyncio
+import json
+import sys
+import uuid
+
+from benchmarks.loadgen import run_load
+
+
+def scenario_request(name, ftpid, wait):
+    if name == 'poll':
+        path = '/ftp/tasks/?ftpid=%s&limit=10' % ftpid
+    elif name == 'longpoll':
+        path = '/ftp/tasks/?ftpid=%s&limit=10&wait=%s' % (ftpid, wait)
+    else:
+        path = '/info/?token=%s' % uuid.uuid1()
+    return lambda index, seq: ('GET', path, b'')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--wsgi', help='WSGI server base url')
+    parser.add_argument('--asgi', help='ASGI server base url')
+    parser.add_argument('--scenario', default='poll,longpoll,info')
+    parser.add_argument('--concurrency', default='1,64,512')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--wait', type=float, default=1.0, help='longpoll 시나리오의 wait 값(초)')
+    args = parser.parse_args(argv)
+
+    servers = [(name, url) for name, url in (('wsgi', args.wsgi), ('asgi', args.asgi)) if url]
+    if not servers:
+        parser.error('at least one of --wsgi/--asgi is required')
+
+    # 다른 데이터와 섞이지 않도록 benchmark 전용 ftpid 사용
+    ftpid = 'bench%s' % uuid.uuid4().hex[:8]
+    results = []
+    for scenario in args.scenario.split(','):
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            for server, url in servers:
+                stats = asyncio.run(run_load(url, scenario_request(scenario, ftpid, args.wait),
+                                             concurrency, duration=args.duration))
+                stats.update({'server': server, 'scenario': scenario, 'concurrency': concurrency})
+                results.append(stats)
+                print(json.dumps(stats), file=sys.stderr)
+    json.dump({'benchmark': 'asgi_vs_wsgi', 'results': results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""FTP서버용 client(faceai_client)의 end-to-end 확인과 처리량 비교
+
+local Django app을 manage.py serve로 띄우고(benchmarks.serve와 같은 방법) mode마다 --tasks개 task를 업로드한 뒤
+--workers개 worker thread로 모두 처리하고, 모든 task가 COMPLETE가 되었는지 /info/bulk/로 확인한다.
+
+    sdk:   faceai_client.TaskWorker (keep-alive connection pool, 다음 batch prefetch, 결과를 모아서 /metainfo/bulk/)
+    naive: 요청마다 새 connection으로 배분 → 처리 → 결과를 task마다 /metainfo/로 저장 (worker를 직접 구현한 기존 방식)
+
+처리(추론)는 --batch-ms + 이미지당 --infer-ms 동안 sleep해서 흉내낸다. 결과는 mode별 초당 task 수, client가 측정한
+API별 latency(faceai_client.Stats)와 확인 결과를 JSON으로 출력한다. (하나라도 COMPLETE가 아니면 exit code 1)
+
+    python -m benchmarks.client --redis server --tasks 2000 --workers 4 > client.json
+    python -m benchmarks.client --url http://127.0.0.1:8000 --modes sdk     # 이미 떠 있는 server (FLUSHDB 하지 않음)
+
+--redis
+    server: local redis-server를 띄워서 사용 (--redis-server)
+    redis://...: 이미 떠 있는 Redis (mode마다 FLUSHDB 한다)
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from urllib.parse import urlencode
+
+import redis
+
+from benchmarks.lifecycle import BENCH_FTPID_BASE, git_revision, make_imglist
+from benchmarks.serve import start_server, stop_server
+from benchmarks.sharding import start_nodes
+from faceai_client import FaceAIClient, Stats, Task, TaskWorker
+from faceai_client.client import MAX_BULK_INFO
+
+MODES = ('sdk', 'naive')
+COMPLETE = '2'
+
+
+def make_handler(args):
+    """ 추론을 흉내내는 handler: tasks 순서대로 task별 metainfos """
+    def handler(tasks):
+        images = sum(len(task.imglist) for task in tasks)
+        time.sleep((args.batch_ms + args.infer_ms * images) / 1000.0)
+        return [[{'id': img['id'], 'metainfo': {'age': 30, 'gender': 'male', 'emotion': 'neutral'}}
+                 for img in task.imglist] for task in tasks]
+    return handler
+
+
+def upload_tasks(client, args, ftpid):
+    """ Returns: token 리스트 (task마다 이미지 1..--images개) """
+    rng = random.Random(args.seed)
+    batches = [{'ftpid': ftpid, 'imglist': make_imglist(rng.randint(1, args.images))} for _ in range(args.tasks)]
+    tokens = []
+    for i in range(0, len(batches), 100):
+        tokens.extend(client.upload_bulk(batches[i: i + 100]))
+    return tokens
+
+
+def count_complete(client, tokens):
+    complete = 0
+    for i in range(0, len(tokens), MAX_BULK_INFO):
+        statuses = client.info_bulk(tokens[i: i + MAX_BULK_INFO], status_only=True)
+        complete += sum(1 for item in statuses.values() if item['status'] == COMPLETE)
+    return complete
+
+
+def fetch_options(args):
+    return {'limit': args.limit, 'max_images': args.max_images, 'linger': args.linger}
+
+
+def run_sdk(args, base_url, ftpid, total):
+    """ worker thread마다 TaskWorker 하나 (FaceAIClient, Stats는 공유) """
+    client = FaceAIClient(base_url, pool_size=args.workers * 2 + 2)
+    handler = make_handler(args)
+    workers = [TaskWorker(client, ftpid, handler, prefetch=args.prefetch, wait=args.wait,
+                          submit_batch=args.submit_batch, **fetch_options(args)) for _ in range(args.workers)]
+    client.stats.reset()
+    threads = [threading.Thread(target=worker.run) for worker in workers]
+    for thread in threads:
+        thread.start()
+    deadline = time.perf_counter() + args.timeout
+    while client.stats.count('results_saved') < total and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    elapsed = client.stats.report()['elapsed']
+    for worker in workers:
+        worker.stop()
+    for thread in threads:
+        thread.join()
+    for worker in workers:
+        worker.close()
+    client.close()
+    return client.stats, elapsed
+
+
+def naive_request(base_url, stats, method, path, params):
+    """ 요청마다 새 connection (Connection: close) """
+    start = time.perf_counter()
+    data = urlencode(params)
+    if method == 'GET':
+        request = urllib.request.Request(base_url + path + '?' + data)
+    else:
+        request = urllib.request.Request(base_url + path, data=data.encode(), method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            payload = json.loads(response.read())
+    except OSError:
+        stats.record(path, time.perf_counter() - start, ok=False)
+        raise
+    stats.record(path, time.perf_counter() - start, ok=payload.get('code') == 200)
+    return payload.get('data')
+
+
+def run_naive(args, base_url, ftpid, total):
+    stats = Stats()
+    handler = make_handler(args)
+    deadline = time.perf_counter() + args.timeout
+    params = dict({'ftpid': ftpid, 'wait': args.wait}, **{key: value for key, value in fetch_options(args).items()
+                                                            if value})
+
+    def worker():
+        while stats.count('results_saved') < total and time.perf_counter() < deadline:
+            try:
+                items = naive_request(base_url, stats, 'GET', '/ftp/tasks/', params) or []
+            except OSError:
+                continue
+            if not items:
+                continue
+            start = time.perf_counter()
+            results = handler([Task(item['token'], item['imglist'], ftpid) for item in items])
+            stats.record('handler', time.perf_counter() - start)
+            stats.add('tasks_processed', len(items))
+            for item, metainfos in zip(items, results):
+                try:
+                    naive_request(base_url, stats, 'POST', '/metainfo/', {'token': item['token'],
+                                                                          'metainfos': json.dumps(metainfos)})
+                    stats.add('results_saved')
+                except OSError:
+                    stats.add('results_failed')
+
+    threads = [threading.Thread(target=worker) for _ in range(args.workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats, stats.report()['elapsed']
+
+
+def measure(args, mode, base_url, redis_url):
+    if redis_url is not None:
+        redis.Redis.from_url(redis_url).flushdb()
+    ftpid = str(BENCH_FTPID_BASE)
+    client = FaceAIClient(base_url)
+    tokens = upload_tasks(client, args, ftpid)
+    stats, elapsed = (run_sdk if mode == 'sdk' else run_naive)(args, base_url, ftpid, len(tokens))
+    complete = count_complete(client, tokens)
+    client.close()
+    report = stats.report()
+    requests = sum(item['count'] + item['errors'] for name, item in report['latency'].items()
+                   if name.startswith('/'))
+    return {
+        'tasks': len(tokens),
+        'complete': complete,
+        'elapsed': round(elapsed, 3),
+        'tasks_per_sec': round(complete / elapsed, 1) if elapsed > 0 else 0.0,
+        'requests_per_task': round(requests / len(tokens), 2) if tokens else 0.0,
+        'report': report,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='이미 떠 있는 server (지정하면 server와 Redis를 띄우지 않는다)')
+    parser.add_argument('--redis', default='server', help='server 또는 redis:// url')
+    parser.add_argument('--redis-server', default='redis-server', help='--redis server에서 실행할 파일')
+    parser.add_argument('--port', type=int, default=17300, help='--redis server의 port')
+    parser.add_argument('--server-port', type=int, default=18300, help='benchmark server의 port')
+    parser.add_argument('--settings', default='faceai_central.settings_production')
+    parser.add_argument('--interface', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--server-workers', type=int, default=max(1, multiprocessing.cpu_count() // 2))
+    parser.add_argument('--modes', default=','.join(MODES), help=','.join(MODES))
+    parser.add_argument('--tasks', type=int, default=1000)
+    parser.add_argument('--images', type=int, default=8, help='task당 최대 이미지 개수 (1..images)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=4, help='worker thread 수')
+    parser.add_argument('--limit', type=int, default=32, help='/ftp/tasks/의 limit')
+    parser.add_argument('--max-images', type=int, default=0, help='/ftp/tasks/의 max_images')
+    parser.add_argument('--linger', type=float, default=0.0, help='/ftp/tasks/의 linger')
+    parser.add_argument('--wait', type=float, default=1.0, help='/ftp/tasks/의 wait')
+    parser.add_argument('--prefetch', type=int, default=1)
+    parser.add_argument('--submit-batch', type=int, default=100)
+    parser.add_argument('--batch-ms', type=float, default=5.0, help='batch당 처리 시간 (ms)')
+    parser.add_argument('--infer-ms', type=float, default=0.5, help='이미지당 처리 시간 (ms)')
+    parser.add_argument('--timeout', type=float, default=120.0, help='mode별 최대 실행 시간 (초)')
+    parser.add_argument('--verbose', action='store_true', help='server log 출력')
+    args = parser.parse_args(argv)
+
+    modes = args.modes.split(',')
+    for mode in modes:
+        if mode not in MODES:
+            parser.error('unknown mode: %s' % mode)
+
+    nodes = []
+    server = None
+    redis_url = None
+    workdir = tempfile.mkdtemp(prefix='faceai-client-')
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            if args.redis == 'server':
+                if shutil.which(args.redis_server) is None:
+                    parser.error('%s not found; install redis-server or use --redis <url>' % args.redis_server)
+                nodes, urls = start_nodes(1, args.port, args.redis_server, workdir)
+                redis_url = urls[0]
+            else:
+                redis_url = args.redis
+            server = start_server(args, args.interface, args.server_workers, redis_url, workdir)
+            base_url = 'http://127.0.0.1:%d' % args.server_port
+
+        results = {}
+        for mode in modes:
+            stats = measure(args, mode, base_url, redis_url)
+            print(json.dumps(dict({key: value for key, value in stats.items() if key != 'report'}, mode=mode)),
+                  file=sys.stderr)
+            results[mode] = stats
+    finally:
+        if server is not None:
+            stop_server(server)
+        for node in nodes:
+            node.terminate()
+            node.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    json.dump({
+        'benchmark': 'client',
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'cpus': multiprocessing.cpu_count(),
+        'redis': None if args.url else args.redis,
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('url', 'redis_server', 'port', 'server_port', 'verbose')},
+        'client': results,
+    }, sys.stdout, indent=2)
+    print()
+    if any(stats['complete'] != stats['tasks'] for stats in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
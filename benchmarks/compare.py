@@ -0,0 +1,80 @@
+"""두 lifecycle benchmark 결과(JSON) 비교
+
+    python -m benchmarks.compare base.json new.json [--threshold 10]
+
+endpoint별 throughput, p50/p99 latency, 요청당 Redis 왕복/명령 수와 helper별 실행 시간의 변화율(%)을 출력한다.
+(benchmarks.serve 결과는 worker 수별 CPU core당 초당 요청 수와 p99 latency, benchmarks.client 결과는 mode별 초당 task 수)
+--threshold를 지정하면 그 이상 나빠진 항목이 있을 때 exit code 1로 끝난다.
+"""
+import argparse
+import json
+import sys
+
+# 비교할 항목: (section, metric, 값이 클수록 좋으면 True)
+METRICS = [
+    ('lifecycle', 'tasks_per_sec', True),
+    ('endpoints', 'rps', True),
+    ('endpoints', 'p50_ms', False),
+    ('endpoints', 'p99_ms', False),
+    ('endpoints', 'redis_roundtrips_per_request', False),
+    ('endpoints', 'redis_commands_per_request', False),
+    ('micro', 'us_per_op', False),
+    ('micro', 'redis_roundtrips_per_op', False),
+    ('serve', 'rps_per_core', True),
+    ('serve', 'p99_ms', False),
+    ('client', 'tasks_per_sec', True),
+]
+
+
+def items(result, section):
+    """ section의 {name: {metric: value}} (lifecycle은 이름 없는 항목 하나) """
+    if section == 'lifecycle':
+        return {'': result.get('lifecycle', {})}
+    return result.get(section, {})
+
+
+def compare(base, new):
+    """ Returns: [(section, name, metric, base 값, new 값, 변화율(%), 나빠졌으면 변화율 아니면 0), ...] """
+    rows = []
+    for section, metric, higher_is_better in METRICS:
+        base_items, new_items = items(base, section), items(new, section)
+        for name in sorted(set(base_items) & set(new_items)):
+            before, after = base_items[name].get(metric), new_items[name].get(metric)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before * 100 if before else 0.0
+            regression = -change if higher_is_better else change
+            rows.append((section, name, metric, before, after, round(change, 1), max(0.0, round(regression, 1))))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, help='이 비율(%%) 이상 나빠진 항목이 있으면 실패')
+    args = parser.parse_args(argv)
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    if base.get('config') != new.get('config'):
+        print('warning: benchmark config differs', file=sys.stderr)
+
+    rows = compare(base, new)
+    print('%-10s %-24s %-30s %12s %12s %8s' % ('section', 'name', 'metric', base.get('revision'),
+                                                 new.get('revision'), 'change'))
+    for section, name, metric, before, after, change, _ in rows:
+        print('%-10s %-24s %-30s %12s %12s %+7.1f%%' % (section, name, metric, before, after, change))
+
+    if args.threshold is not None:
+        regressions = [row for row in rows if row[6] >= args.threshold]
+        for section, name, metric, _, _, _, regression in regressions:
+            print('regression: %s %s %s %.1f%%' % (section, name, metric, regression), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
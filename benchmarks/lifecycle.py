@@ -0,0 +1,422 @@
+"""task 처리 과정(lifecycle) 부하 테스트와 helper micro-benchmark
+
+worker마다 업로드(/ftp/imginfo/) → 배분(/ftp/tasks/) → 결과 저장(/metainfo/) → 조회(/info/) cycle을 반복하고
+endpoint별 throughput, p50/p99 latency, 요청당 Redis 왕복/명령 수와 helper 함수의 micro-benchmark 결과를 JSON으로
+출력한다. HTTP server 없이 process 안에서 WSGI/ASGI application을 호출하므로(sync: faceai_central.wsgi와 같은
+ApiWSGIApplication, async: AsyncApiApplication) server 설정과 관계없이 commit 간 결과를 비교할 수 있다. Redis 사용량은 image_api.metrics의 RequestTracker로 센다.
+
+    python -m benchmarks.lifecycle --redis fake --workers 8 --images 4 --limit 10 --duration 10 > new.json
+    python -m benchmarks.compare base.json new.json
+
+--redis
+    fake: process 안의 fakeredis (fakeredis 패키지 필요; Redis 처리 시간은 실제와 다르므로 Redis 왕복/명령 수 비교용)
+    server: local redis-server를 띄워서 사용 (--redis-server)
+    redis://...: 이미 떠 있는 Redis (실행 전에 FLUSHDB 한다)
+
+--mode
+    sync: worker마다 thread 하나 (WSGI와 같은 view; --full-stack이면 API 요청도 Django MIDDLEWARE를 거친다)
+    async: worker마다 coroutine 하나 (ASGI의 async view)
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+import redis
+
+from benchmarks.loadgen import summarize
+from benchmarks.sharding import raw_location, start_nodes
+
+try:
+    import fakeredis
+    import fakeredis.aioredis
+except ImportError:
+    fakeredis = None
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'faceai_central.settings')
+
+FAKE_LOCATION = 'redis://fakeredis'
+# worker i는 ftpid BENCH_FTPID_BASE + i의 task만 처리한다 (micro-benchmark는 BENCH_FTPID_BASE - 1)
+BENCH_FTPID_BASE = 9000
+
+
+def configure(url, fake_server=None, result_cache=True, full_stack=False):
+    """ benchmark 전용 CACHES alias로 FACEAI_REDIS_SHARDS를 구성 (django.setup 이후, Redis 사용 전에 호출) """
+    from django.conf import settings
+    from image_api import async_redis, metrics, result_cache as result_cache_module, sharding
+    for alias, location, pool_kwargs in (('bench', url, {'decode_responses': True}),
+                                         ('bench_raw', raw_location(url), {})):
+        if fake_server is not None:
+            # fakeredis 2.21+의 이름 (FakeConnection은 deprecated)
+            pool_kwargs.update(connection_class=getattr(fakeredis, 'FakeRedisConnection', fakeredis.FakeConnection),
+                               server=fake_server)
+        settings.CACHES[alias] = {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': location,
+            'OPTIONS': {'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                        'CONNECTION_POOL_KWARGS': pool_kwargs,
+                        'REDIS_CLIENT_CLASS': 'image_api.metrics.InstrumentedRedis',
+                        'ASYNC_REDIS_CLIENT_CLASS': 'image_api.metrics.InstrumentedAsyncRedis'},
+        }
+        if fake_server is not None:
+            # async connection pool은 fakeredis의 asyncio connection으로 직접 만든다
+            pool = async_redis.aioredis.ConnectionPool.from_url(
+                location, **dict(pool_kwargs, connection_class=getattr(
+                    fakeredis, 'FakeAsyncRedisConnection', fakeredis.aioredis.FakeConnection)))
+            async_redis._clients[alias] = metrics.InstrumentedAsyncRedis(connection_pool=pool)
+    settings.FACEAI_REDIS_SHARDS = [('bench', 'bench_raw')]
+    settings.FACEAI_METRICS = True
+    # 측정 중에는 metrics를 Redis에 쓰지 않는다
+    settings.FACEAI_METRICS_FLUSH_INTERVAL = 24 * 60 * 60
+    if not result_cache:
+        settings.FACEAI_RESULT_CACHE_SIZE = 0
+    if full_stack:
+        settings.FACEAI_WSGI_API = False
+    sharding._shard_ring = None
+    metrics._metrics = None
+    result_cache_module._result_cache = None
+
+
+def make_imglist(images):
+    return [{'path': '/data/ftp/bench/%08d.jpg' % i} for i in range(images)]
+
+
+def make_metainfos(imglist):
+    return json.dumps([{'id': img['id'], 'metainfo': {'age': 30, 'gender': 'male', 'emotion': 'neutral'}}
+                       for img in imglist])
+
+
+def lifecycle(ftpid, imglist, limit, bulk):
+    """ cycle 하나의 요청을 차례로 만드는 generator
+
+    (method, path, params)를 yield하고 응답의 data를 send로 받는다. Returns: 완료한 task 개수
+    """
+    if bulk:
+        data = yield 'POST', '/ftp/imginfo/bulk/', {
+            'batches': json.dumps([{'ftpid': ftpid, 'imglist': imglist}] * limit)}
+        tokens = data['tokens']
+    else:
+        tokens = []
+        for _ in range(limit):
+            data = yield 'POST', '/ftp/imginfo/', {'ftpid': ftpid, 'imglist': json.dumps(imglist)}
+            tokens.append(data['token'])
+
+    tasks = yield 'GET', '/ftp/tasks/', {'ftpid': ftpid, 'limit': limit}
+
+    if bulk:
+        yield 'POST', '/metainfo/bulk/', {'results': json.dumps(
+            [{'token': task['token'], 'metainfos': make_metainfos(task['imglist'])} for task in tasks])}
+        yield 'GET', '/info/bulk/', {'tokens': ','.join(task['token'] for task in tasks)}
+    else:
+        for task in tasks:
+            yield 'POST', '/metainfo/', {'token': task['token'], 'metainfos': make_metainfos(task['imglist'])}
+        for task in tasks:
+            yield 'GET', '/info/', {'token': task['token']}
+    return len(tasks)
+
+
+class Recorder:
+    """ worker 하나의 endpoint별 측정값 """
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.tasks = 0
+
+    def start(self):
+        from image_api.metrics import RequestTracker, get_metrics
+        return RequestTracker(get_metrics())
+
+    def record(self, tracker, method, path, status, body):
+        elapsed = time.perf_counter() - tracker.start
+        endpoint = '%s %s' % (method, path)
+        tracker.finish('benchmark', status)
+        data = json.loads(body) if status == 200 else {}
+        if status != 200 or data.get('code') != 200:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            return None
+        self.samples.setdefault(endpoint, []).append(
+            (elapsed, tracker.redis_roundtrips, tracker.redis_commands, tracker.redis_seconds))
+        return data['data']
+
+
+def wsgi_request(app, method, path, params):
+    """ WSGI application을 직접 호출한다. Returns: (status, body) """
+    query = urlencode(params) if method == 'GET' else ''
+    body = urlencode(params).encode() if method == 'POST' else b''
+    environ = {'REQUEST_METHOD': method, 'PATH_INFO': path, 'SCRIPT_NAME': '', 'QUERY_STRING': query,
+               'SERVER_NAME': 'benchmark', 'SERVER_PORT': '80', 'HTTP_HOST': 'benchmark', 'wsgi.url_scheme': 'http',
+               'wsgi.input': io.BytesIO(body), 'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+               'CONTENT_LENGTH': str(len(body))}
+    status = []
+
+    def start_response(status_line, headers):
+        status.append(int(status_line.split(' ', 1)[0]))
+
+    result = app(environ, start_response)
+    try:
+        return status[0], b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+
+def sync_worker(index, app, args, deadline, recorder):
+    imglist = make_imglist(args.images)
+    cycles = 0
+    while time.perf_counter() < deadline and (args.cycles is None or cycles < args.cycles):
+        steps = lifecycle(str(BENCH_FTPID_BASE + index), imglist, args.limit, args.bulk)
+        data = None
+        try:
+            while True:
+                method, path, params = steps.send(data)
+                tracker = recorder.start()
+                status, body = wsgi_request(app, method, path, params)
+                data = recorder.record(tracker, method, path, status, body)
+                if data is None:
+                    # 요청이 실패하면 이 cycle을 중단한다
+                    steps.close()
+                    break
+        except StopIteration as stop:
+            recorder.tasks += stop.value
+        cycles += 1
+
+
+async def asgi_request(app, method, path, params):
+    """ AsyncApiApplication을 직접 호출한다. Returns: (status, body) """
+    query = urlencode(params).encode() if method == 'GET' else b''
+    body = urlencode(params).encode() if method == 'POST' else b''
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query, 'root_path': '',
+             'headers': [(b'content-type', b'application/x-www-form-urlencoded'),
+                         (b'content-length', str(len(body)).encode())]}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+
+async def async_worker(index, app, args, deadline, recorder):
+    imglist = make_imglist(args.images)
+    cycles = 0
+    while time.perf_counter() < deadline and (args.cycles is None or cycles < args.cycles):
+        steps = lifecycle(str(BENCH_FTPID_BASE + index), imglist, args.limit, args.bulk)
+        data = None
+        try:
+            while True:
+                method, path, params = steps.send(data)
+                tracker = recorder.start()
+                status, body = await asgi_request(app, method, path, params)
+                data = recorder.record(tracker, method, path, status, body)
+                if data is None:
+                    steps.close()
+                    break
+        except StopIteration as stop:
+            recorder.tasks += stop.value
+        cycles += 1
+
+
+def run_lifecycle(args):
+    recorders = [Recorder() for _ in range(args.workers)]
+    start = time.perf_counter()
+    deadline = start + args.duration
+    if args.mode == 'async':
+        from image_api.async_app import AsyncApiApplication
+        app = AsyncApiApplication(None)
+
+        async def main():
+            await asyncio.gather(*[async_worker(i, app, args, deadline, recorder)
+                                   for i, recorder in enumerate(recorders)])
+        asyncio.run(main())
+    else:
+        from django.core.wsgi import get_wsgi_application
+        from image_api.wsgi_app import ApiWSGIApplication
+        app = ApiWSGIApplication(get_wsgi_application())
+        threads = [threading.Thread(target=sync_worker, args=(i, app, args, deadline, recorder))
+                   for i, recorder in enumerate(recorders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    endpoints = {}
+    for endpoint in sorted(set(name for recorder in recorders for name in list(recorder.samples) + list(recorder.errors))):
+        samples = [sample for recorder in recorders for sample in recorder.samples.get(endpoint, [])]
+        stats = summarize([sample[0] for sample in samples],
+                          sum(recorder.errors.get(endpoint, 0) for recorder in recorders), elapsed)
+        count = max(1, len(samples))
+        stats.update({
+            'redis_roundtrips_per_request': round(sum(sample[1] for sample in samples) / count, 3),
+            'redis_commands_per_request': round(sum(sample[2] for sample in samples) / count, 3),
+            'redis_ms_per_request': round(sum(sample[3] for sample in samples) / count * 1000, 3),
+        })
+        endpoints[endpoint] = stats
+    tasks = sum(recorder.tasks for recorder in recorders)
+    return {'elapsed': round(elapsed, 3), 'tasks': tasks,
+            'tasks_per_sec': round(tasks / elapsed, 1) if elapsed > 0 else 0.0}, endpoints
+
+
+def run_micro(args):
+    """ helper 함수별 반복 실행 시간과 호출당 Redis 왕복/명령 수 """
+    from image_api import views
+    from image_api.compression import encode_metainfo, decode_metainfo
+    from image_api.constants import STATUS
+    from image_api.validation import validate_metainfo, validate_upload
+    from image_api.metrics import RequestTracker, get_metrics
+    from image_api.queues import get_task_queue
+    from image_api.sharding import get_shard_ring
+
+    ftpid = str(BENCH_FTPID_BASE - 1)
+    iterations = args.micro_iterations
+    conn = get_shard_ring().for_ftpid(ftpid).conn()
+    queue = get_task_queue()
+    imglist = make_imglist(args.images)
+    imgids = [str(i) for i in range(args.images * args.limit)]
+    uploads = [(ftpid, imglist, None)] * args.limit
+    views.save_uploads(uploads)
+    tasklist = queue.dispatch(conn, ftpid, args.limit)
+    tokens = [token for token, _ in tasklist]
+    metainfos = make_metainfos(tasklist[0][1])
+    stored = encode_metainfo(metainfos)
+    normalized = validate_metainfo({'token': tokens[0], 'metainfos': metainfos})['metainfos']
+    results = [({'token': token, 'metainfos': normalized}, None) for token in tokens]
+    upload = {'ftpid': ftpid, 'imglist': json.dumps(imglist)}
+    statuses = [str(STATUS.COMPLETE.value).encode()] * len(tokens)
+
+    def build_uploads():
+        pipline = conn.pipeline(False)
+        views.queue_uploads(pipline, uploads, imgids)
+        pipline.reset()
+
+    def save_results():
+        pipline = conn.pipeline(False)
+        views.queue_metainfos(pipline, results)
+        pipline.execute()
+        queue.ack(conn, tokens)
+
+    helpers = [
+        ('pack_images', lambda: views.pack_images(imglist, imgids[:args.images])),
+        ('queue_uploads', build_uploads),
+        ('save_uploads', lambda: views.save_uploads(uploads)),
+        # save_uploads에서 쌓인 task를 limit개씩 배분
+        ('dispatch', lambda: queue.dispatch(conn, ftpid, args.limit)),
+        ('validate_upload', lambda: validate_upload(upload)),
+        ('validate_metainfo', lambda: validate_metainfo({'token': tokens[0], 'metainfos': metainfos})),
+        ('encode_metainfo', lambda: encode_metainfo(metainfos)),
+        ('decode_metainfo', lambda: decode_metainfo(stored)),
+        ('queue_metainfos', save_results),
+        ('bulk_info_response', lambda: views.bulk_info_response(tokens, statuses, [stored] * len(tokens), False)),
+    ]
+    report = {}
+    for name, func in helpers:
+        func()
+        tracker = RequestTracker(get_metrics())
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - start
+        tracker.finish('micro', 200)
+        report[name] = {
+            'iterations': iterations,
+            'us_per_op': round(elapsed / iterations * 1e6, 3),
+            'ops_per_sec': round(iterations / elapsed, 1) if elapsed > 0 else 0.0,
+            'redis_roundtrips_per_op': round(tracker.redis_roundtrips / iterations, 3),
+            'redis_commands_per_op': round(tracker.redis_commands / iterations, 3),
+        }
+        print(json.dumps(dict(report[name], helper=name)), file=sys.stderr)
+    return report
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--redis', default='fake', help="fake, server 또는 redis:// url")
+    parser.add_argument('--redis-server', default='redis-server', help='--redis server에서 실행할 파일')
+    parser.add_argument('--port', type=int, default=17100, help='--redis server의 port')
+    parser.add_argument('--mode', choices=('sync', 'async'), default='sync')
+    parser.add_argument('--workers', type=int, default=8, help='동시에 cycle을 반복하는 worker 수')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--cycles', type=int, help='worker당 cycle 수 (지정하면 duration 전에 끝날 수 있다)')
+    parser.add_argument('--images', type=int, default=4, help='task당 이미지 개수')
+    parser.add_argument('--limit', type=int, default=10, help='cycle당 task 개수 (/ftp/tasks/의 limit)')
+    parser.add_argument('--bulk', action='store_true', help='업로드/결과 저장/조회에 bulk API 사용')
+    parser.add_argument('--no-result-cache', action='store_true', help='result cache 없이 /info/ 조회')
+    parser.add_argument('--full-stack', action='store_true',
+                        help='sync mode에서 API 요청도 Django MIDDLEWARE를 거쳐 처리 (FACEAI_WSGI_API = False)')
+    parser.add_argument('--micro-iterations', type=int, default=1000, help='0이면 micro-benchmark를 생략')
+    args = parser.parse_args(argv)
+
+    if args.full_stack and args.mode == 'async':
+        parser.error('--full-stack applies to --mode sync only')
+
+    fake_server = None
+    nodes = []
+    workdir = None
+    if args.redis == 'fake':
+        if fakeredis is None:
+            parser.error('--redis fake requires the fakeredis package')
+        fake_server = fakeredis.FakeServer()
+        url = FAKE_LOCATION
+    elif args.redis == 'server':
+        if shutil.which(args.redis_server) is None:
+            parser.error('%s not found; install redis-server or use --redis <url>' % args.redis_server)
+        workdir = tempfile.mkdtemp(prefix='faceai-bench-')
+        nodes, urls = start_nodes(1, args.port, args.redis_server, workdir)
+        url = urls[0]
+    else:
+        url = args.redis
+        redis.Redis.from_url(url).flushdb()
+
+    import django
+    django.setup()
+    configure(url, fake_server, result_cache=not args.no_result_cache, full_stack=args.full_stack)
+    try:
+        summary, endpoints = run_lifecycle(args)
+        for endpoint, stats in endpoints.items():
+            print(json.dumps(dict(stats, endpoint=endpoint)), file=sys.stderr)
+        micro = run_micro(args) if args.micro_iterations > 0 else {}
+    finally:
+        for node in nodes:
+            node.terminate()
+            node.wait()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    json.dump({
+        'benchmark': 'lifecycle',
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'redis': args.redis,
+        'config': {key: value for key, value in vars(args).items() if key not in ('redis_server', 'port')},
+        'lifecycle': summary,
+        'endpoints': endpoints,
+        'micro': micro,
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
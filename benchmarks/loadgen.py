@@ -0,0 +1,148 @@
+"""asyncio 기반 HTTP/1.1 부하 생성기 (keep-alive, 외부 의존성 없음)
+
+동시 connection 수만큼 coroutine을 띄우고 각 connection에서 요청을 반복하여
+throughput과 latency 분포를 측정한다.
+"""
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    """ latency(초) 리스트로 결과 dict 생성 (ms 단위) """
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+class HttpConnection:
+    """ 단일 keep-alive connection """
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.reader = None
+        self.writer = None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    async def request(self, method, path, body=b'', content_type='application/x-www-form-urlencoded'):
+        """ Returns: (status, body) """
+        if self.writer is None:
+            await self.open()
+        head = '%s %s HTTP/1.1\r\nHost: %s\r\nConnection: keep-alive\r\nContent-Length: %d\r\n' % (
+            method, path, self.host, len(body))
+        if body:
+            head += 'Content-Type: %s\r\n' % content_type
+        self.writer.write(head.encode('latin1') + b'\r\n' + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            self.close()
+            raise ConnectionError('connection closed')
+        status = int(status_line.split()[1])
+        length = None
+        chunked = False
+        close = status_line.startswith(b'HTTP/1.0')
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin1').partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'transfer-encoding' and 'chunked' in value.lower():
+                chunked = True
+            elif name == 'connection':
+                close = value.lower() != 'keep-alive'
+
+        if chunked:
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            data = b''.join(chunks)
+        elif length is not None:
+            data = await self.reader.readexactly(length)
+        else:
+            data = await self.reader.read()
+            close = True
+        if close:
+            self.close()
+        return status, data
+
+
+async def run_load(base_url, make_request, concurrency, duration=None, requests=None):
+    """ concurrency개의 connection으로 duration초 동안(또는 총 requests개) 요청을 보낸다
+
+    Args:
+        base_url: http://host:port
+        make_request: (worker_index, seq) -> (method, path, body) 를 리턴하는 함수
+        concurrency: 동시 connection 수
+        duration: 측정 시간(초)
+        requests: 총 요청 수 (duration 대신 사용)
+
+    Returns: summarize() 결과
+    """
+    latencies = []
+    errors = [0]
+    deadline = time.perf_counter() + duration if duration else None
+    remaining = [requests] if requests else None
+
+    async def worker(index):
+        conn = HttpConnection(base_url)
+        seq = 0
+        try:
+            while True:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                if remaining is not None:
+                    if remaining[0] <= 0:
+                        break
+                    remaining[0] -= 1
+                method, path, body = make_request(index, seq)
+                seq += 1
+                start = time.perf_counter()
+                try:
+                    status, _ = await conn.request(method, path, body)
+                    if status >= 400:
+                        errors[0] += 1
+                except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                    errors[0] += 1
+                    conn.close()
+                    continue
+                latencies.append(time.perf_counter() - start)
+        finally:
+            conn.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(i) for i in range(concurrency)])
+    return summarize(latencies, errors[0], time.perf_counter() - start)
@@ -0,0 +1,236 @@
+"""운영 server(manage.py serve)의 worker 수별 throughput benchmark
+
+worker 수마다 server를 새로 띄우고 HTTP keep-alive 부하를 보낸 뒤 초당 요청 수와 server process(master, worker)가
+사용한 CPU core당 초당 요청 수를 JSON으로 출력한다. 부하 생성기는 별도 process에서 실행되므로 CPU 사용량은
+/proc에서 server process tree만 센다. (/proc이 없으면 core 수 대신 worker 수로 나눈다)
+
+    python -m benchmarks.serve --redis server --workers 1,2,4 --interface wsgi,asgi > serve.json
+    python -m benchmarks.compare base.json serve.json
+
+--redis
+    server: local redis-server를 띄워서 사용 (--redis-server)
+    redis://...: 이미 떠 있는 Redis (실행 전에 FLUSHDB 한다)
+server는 --settings(기본값 faceai_central.settings_production)로 실행되고 Redis 주소는 FACEAI_REDIS_URL로 넘긴다.
+
+시나리오
+    poll:   빈 queue에 대한 /ftp/tasks/ polling
+    upload: /ftp/imginfo/ 업로드 (이미지 --images개)
+    info:   없는 token의 /info/ 조회
+    mix:    upload, poll, info를 차례로
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from urllib.parse import urlencode
+
+import redis
+
+from benchmarks.lifecycle import BENCH_FTPID_BASE, git_revision, make_imglist
+from benchmarks.loadgen import run_load
+from benchmarks.sharding import start_nodes
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ('poll', 'upload', 'info', 'mix')
+
+
+def scenario_request(name, images):
+    """ Returns: loadgen.run_load의 make_request (connection마다 다른 ftpid) """
+    imglist = json.dumps(make_imglist(images))
+    token = str(uuid.uuid1())
+
+    def make_request(index, seq):
+        ftpid = str(BENCH_FTPID_BASE + index)
+        step = name if name != 'mix' else ('upload', 'poll', 'info')[seq % 3]
+        if step == 'upload':
+            return 'POST', '/ftp/imginfo/', urlencode({'ftpid': ftpid, 'imglist': imglist}).encode()
+        if step == 'poll':
+            return 'GET', '/ftp/tasks/?ftpid=%s&limit=10' % ftpid, b''
+        return 'GET', '/info/?token=%s' % token, b''
+    return make_request
+
+
+def clock_ticks(pid):
+    """ process와 자식 process tree의 utime + stime (clock tick), 읽을 수 없으면 None """
+    try:
+        with open('/proc/%d/stat' % pid) as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        ticks = int(fields[11]) + int(fields[12])
+        with open('/proc/%d/task/%d/children' % (pid, pid)) as f:
+            children = [int(child) for child in f.read().split()]
+    except (OSError, ValueError, IndexError):
+        return None
+    for child in children:
+        ticks += clock_ticks(child) or 0
+    return ticks
+
+
+def server_cpu_seconds(pid):
+    ticks = clock_ticks(pid)
+    return None if ticks is None else ticks / os.sysconf('SC_CLK_TCK')
+
+
+def wait_port(port, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('server exited with code %s' % process.returncode)
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start on port %s' % port)
+
+
+def start_server(args, interface, workers, redis_url, log_dir):
+    env = dict(os.environ, FACEAI_REDIS_URL=redis_url, FACEAI_REDIS_PASSWORD='', FACEAI_LOG_DIR=log_dir,
+               DJANGO_SETTINGS_MODULE=args.settings)
+    command = [sys.executable, os.path.join(BASE_DIR, 'manage.py'), 'serve', '--%s' % interface,
+               '--workers', str(workers), '--bind', '127.0.0.1:%d' % args.server_port, '--no-reaper']
+    process = subprocess.Popen(command, env=env, cwd=BASE_DIR, stdout=subprocess.DEVNULL,
+                               stderr=None if args.verbose else subprocess.DEVNULL)
+    wait_port(args.server_port, process)
+    return process
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def load_process(base_url, scenario, images, concurrency, duration, offset, queue):
+    make_request = scenario_request(scenario, images)
+    queue.put(asyncio.run(run_load(base_url, lambda index, seq: make_request(offset + index, seq),
+                                   concurrency, duration=duration)))
+
+
+def run_load_processes(args, scenario):
+    """ --load-processes개 process로 --concurrency개 connection의 부하를 나눠 보낸다 """
+    base_url = 'http://127.0.0.1:%d' % args.server_port
+    counts = [args.concurrency // args.load_processes + (1 if i < args.concurrency % args.load_processes else 0)
+              for i in range(args.load_processes)]
+    queue = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=load_process, args=(
+        base_url, scenario, args.images, count, args.duration, sum(counts[:i]), queue))
+        for i, count in enumerate(counts) if count > 0]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    requests = sum(result['requests'] for result in results)
+    elapsed = max(result['elapsed'] for result in results)
+    return {
+        'requests': requests,
+        'errors': sum(result['errors'] for result in results),
+        'elapsed': elapsed,
+        'rps': round(requests / elapsed, 1) if elapsed > 0 else 0.0,
+        # process별 분포를 합치지 않으므로 가장 나쁜 process의 값
+        'p50_ms': max(result['p50_ms'] for result in results),
+        'p99_ms': max(result['p99_ms'] for result in results),
+        'max_ms': max(result['max_ms'] for result in results),
+    }
+
+
+def measure(args, interface, workers, scenario, redis_url, log_dir):
+    process = start_server(args, interface, workers, redis_url, log_dir)
+    try:
+        # worker 시작 직후의 import, connection 생성 시간은 제외
+        asyncio.run(run_load('http://127.0.0.1:%d' % args.server_port, scenario_request(scenario, args.images),
+                             workers, duration=args.warmup))
+        cpu_before = server_cpu_seconds(process.pid)
+        stats = run_load_processes(args, scenario)
+        cpu_after = server_cpu_seconds(process.pid)
+    finally:
+        stop_server(process)
+    if cpu_before is not None and cpu_after is not None and cpu_after > cpu_before:
+        cores = (cpu_after - cpu_before) / stats['elapsed']
+    else:
+        cores = float(workers)
+    stats.update({
+        'interface': interface, 'workers': workers, 'scenario': scenario,
+        'server_cores': round(cores, 2),
+        'rps_per_core': round(stats['rps'] / cores, 1) if cores > 0 else 0.0,
+    })
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--redis', default='server', help='server 또는 redis:// url')
+    parser.add_argument('--redis-server', default='redis-server', help='--redis server에서 실행할 파일')
+    parser.add_argument('--port', type=int, default=17200, help='--redis server의 port')
+    parser.add_argument('--server-port', type=int, default=18200, help='benchmark server의 port')
+    parser.add_argument('--settings', default='faceai_central.settings_production')
+    parser.add_argument('--interface', default='wsgi', help='wsgi,asgi')
+    parser.add_argument('--workers', default='1,2,4', help='비교할 worker 수 (,로 구분)')
+    parser.add_argument('--scenario', default='mix', help=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=64, help='동시 connection 수')
+    parser.add_argument('--load-processes', type=int, default=max(1, multiprocessing.cpu_count() // 2),
+                        help='부하 생성 process 수')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=1.0)
+    parser.add_argument('--images', type=int, default=4, help='upload 시나리오의 이미지 개수')
+    parser.add_argument('--verbose', action='store_true', help='server log 출력')
+    args = parser.parse_args(argv)
+
+    interfaces = args.interface.split(',')
+    scenarios = args.scenario.split(',')
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error('unknown scenario: %s' % scenario)
+
+    nodes = []
+    workdir = tempfile.mkdtemp(prefix='faceai-serve-')
+    if args.redis == 'server':
+        if shutil.which(args.redis_server) is None:
+            parser.error('%s not found; install redis-server or use --redis <url>' % args.redis_server)
+        nodes, urls = start_nodes(1, args.port, args.redis_server, workdir)
+        redis_url = urls[0]
+    else:
+        redis_url = args.redis
+
+    results = {}
+    try:
+        for interface in interfaces:
+            for scenario in scenarios:
+                for workers in [int(count) for count in args.workers.split(',')]:
+                    redis.Redis.from_url(redis_url).flushdb()
+                    stats = measure(args, interface, workers, scenario, redis_url, workdir)
+                    print(json.dumps(stats), file=sys.stderr)
+                    results['%s %s workers=%s' % (interface, scenario, workers)] = stats
+    finally:
+        for node in nodes:
+            node.terminate()
+            node.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    json.dump({
+        'benchmark': 'serve',
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'cpus': multiprocessing.cpu_count(),
+        'redis': args.redis,
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('redis_server', 'port', 'server_port', 'verbose')},
+        'serve': results,
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
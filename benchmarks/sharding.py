@@ -0,0 +1,168 @@
+"""Redis node 개수별 처리량 benchmark (sharding)
+
+node 개수마다 local redis-server를 띄우고(--redis-server) 여러 process에서 업로드 → 배분 → 결과 저장 cycle을
+반복하여 초당 완료된 task 수를 비교한다. 결과는 JSON으로 출력한다.
+
+    python -m benchmarks.sharding --nodes 1,2,4 --processes 8 --duration 10
+
+이미 떠 있는 node를 사용하려면 --urls로 지정한다. (node 개수별로 앞에서부터 사용, 실행 전에 FLUSHALL 한다)
+
+    python -m benchmarks.sharding --urls redis://10.0.0.1:6379,redis://10.0.0.2:6379 --nodes 1,2
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+import redis
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'faceai_central.settings')
+
+
+def start_nodes(count, port_base, redis_server, workdir):
+    nodes = []
+    for i in range(count):
+        port = port_base + i
+        nodes.append(subprocess.Popen(
+            [redis_server, '--port', str(port), '--save', '', '--appendonly', 'no', '--dir', workdir],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    urls = ['redis://127.0.0.1:%s' % (port_base + i) for i in range(count)]
+    deadline = time.time() + 10
+    for url in urls:
+        while True:
+            try:
+                redis.Redis.from_url(url).ping()
+                break
+            except redis.ConnectionError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.05)
+    return nodes, urls
+
+
+def raw_location(url):
+    """ django_redis는 LOCATION 문자열별로 connection pool을 공유하므로 raw alias에는 같은 db를 가리키는 다른 문자열을 사용 """
+    if not urlsplit(url).path.strip('/'):
+        return url.rstrip('/') + '/0'
+    return url + ('&' if '?' in url else '?')
+
+
+def configure(urls):
+    """ benchmark 전용 CACHES alias로 FACEAI_REDIS_SHARDS를 구성 (django.setup 이후, Redis 사용 전에 호출) """
+    from django.conf import settings
+    from image_api import sharding
+    shards = []
+    for i, url in enumerate(urls):
+        for alias, location, pool_kwargs in (('bench%s' % i, url, {'decode_responses': True}),
+                                             ('bench%s_raw' % i, raw_location(url), {})):
+            settings.CACHES[alias] = {
+                'BACKEND': 'django_redis.cache.RedisCache',
+                'LOCATION': location,
+                'OPTIONS': {'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                            'CONNECTION_POOL_KWARGS': pool_kwargs},
+            }
+        shards.append(('bench%s' % i, 'bench%s_raw' % i))
+    settings.FACEAI_REDIS_SHARDS = shards
+    settings.FACEAI_RESULT_CACHE_SIZE = 0
+    sharding._shard_ring = None
+
+
+def worker(index, urls, duration, ftpids, batch, images, results):
+    import django
+    django.setup()
+    configure(urls)
+    from image_api.queues import get_task_queue
+    from image_api.sharding import get_shard_ring
+    from image_api.views import save_uploads, group_valid_results, queue_metainfos
+
+    ring = get_shard_ring()
+    queue = get_task_queue()
+    ftpids = ['bench%s-%s' % (index, i) for i in range(ftpids)]
+    imglist = [{'path': '/data/ftp/bench/%08d.jpg' % i} for i in range(images)]
+    completed = 0
+    deadline = time.time() + duration
+    seq = 0
+    while time.time() < deadline:
+        uploads = [(ftpids[(seq + i) % len(ftpids)], imglist, None) for i in range(batch)]
+        seq += batch
+        save_uploads(uploads)
+        dispatched = []
+        for ftpid in set(upload[0] for upload in uploads):
+            dispatched.extend(queue.dispatch(ring.for_ftpid(ftpid).conn(), ftpid, batch))
+        items = [({'token': token, 'metainfos': '[{"id": "%s"}]' % token}, None) for token, _ in dispatched]
+        for shard, shard_items in group_valid_results(items):
+            conn = shard.conn()
+            pipline = conn.pipeline(False)
+            tokens = queue_metainfos(pipline, shard_items)
+            pipline.execute()
+            queue.ack(conn, tokens)
+        completed += len(items)
+    results.put(completed)
+
+
+def run(urls, processes, duration, ftpids, batch, images):
+    for url in urls:
+        redis.Redis.from_url(url).flushall()
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=worker, args=(i, urls, duration, ftpids, batch, images, results))
+               for i in range(processes)]
+    start = time.time()
+    for process in workers:
+        process.start()
+    completed = sum(results.get() for _ in workers)
+    for process in workers:
+        process.join()
+    elapsed = time.time() - start
+    return {'nodes': len(urls), 'processes': processes, 'tasks': completed,
+            'tasks_per_sec': round(completed / duration, 1), 'elapsed': round(elapsed, 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', default='1,2,4', help='측정할 node 개수 목록')
+    parser.add_argument('--urls', help='이미 떠 있는 node url 목록 (콤마 구분)')
+    parser.add_argument('--redis-server', default='redis-server', help='redis-server 실행 파일')
+    parser.add_argument('--port-base', type=int, default=17000)
+    parser.add_argument('--processes', type=int, default=8, help='부하를 만드는 process 수')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--ftpids', type=int, default=16, help='process당 ftpid 개수')
+    parser.add_argument('--batch', type=int, default=50, help='cycle당 task 개수')
+    parser.add_argument('--images', type=int, default=4, help='task당 이미지 개수')
+    args = parser.parse_args(argv)
+
+    node_counts = [int(n) for n in args.nodes.split(',')]
+    external = args.urls.split(',') if args.urls else None
+    if external is None and shutil.which(args.redis_server) is None:
+        parser.error('%s not found; install redis-server or use --urls' % args.redis_server)
+    if external is not None and max(node_counts) > len(external):
+        parser.error('--nodes needs up to %s urls' % max(node_counts))
+
+    results = []
+    for count in node_counts:
+        nodes = []
+        workdir = tempfile.mkdtemp(prefix='faceai-bench-')
+        try:
+            if external is None:
+                nodes, urls = start_nodes(count, args.port_base, args.redis_server, workdir)
+            else:
+                urls = external[:count]
+            stats = run(urls, args.processes, args.duration, args.ftpids, args.batch, args.images)
+        finally:
+            for node in nodes:
+                node.terminate()
+                node.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+        results.append(stats)
+        print(json.dumps(stats), file=sys.stderr)
+    json.dump({'benchmark': 'sharding', 'results': results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'faceai_central.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# image_api의 API 경로는 async view로 직접 처리 (image_api.async_app 참고)
+from image_api.async_app import AsyncApiApplication
+
+application = AsyncApiApplication(django_application)
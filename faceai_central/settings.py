@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'image_api.metrics.MetricsMiddleware',  # 요청 처리 시간/Redis 사용량 (/metrics)
     'corsheaders.middleware.CorsMiddleware', #cross domain관련 설정
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -141,6 +142,23 @@ CACHES = {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
             "CONNECTION_POOL_KWARGS": {"max_connections": 100, "decode_responses": True},
             "PASSWORD": "svc25bm",
+            # Redis 명령별 왕복 시간 측정 (image_api.metrics)
+            "REDIS_CLIENT_CLASS": "image_api.metrics.InstrumentedRedis",
+            "ASYNC_REDIS_CLIENT_CLASS": "image_api.metrics.InstrumentedAsyncRedis",
+        }
+    },
+    # 압축된 metainfo 등 binary 값 조회용 (decode_responses 없음)
+    # django_redis는 LOCATION 문자열별로 connection pool을 공유하므로 같은 Redis(db)를 다른 문자열로 지정한다
+    "raw": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/0",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "CONNECTION_POOL_KWARGS": {"max_connections": 100},
+            "PASSWORD": "svc25bm",
+            # Redis 명령별 왕복 시간 측정 (image_api.metrics)
+            "REDIS_CLIENT_CLASS": "image_api.metrics.InstrumentedRedis",
+            "ASYNC_REDIS_CLIENT_CLASS": "image_api.metrics.InstrumentedAsyncRedis",
         }
     }
 }
@@ -227,4 +245,102 @@ LOGGING = {
         }
     }
 }
-#django.db.backends
\ No newline at end of file
+#django.db.backends
+
+# Task queue backend
+#   'list': ftpid별 Redis List + pedding ZSET (default)
+#   'stream': ftpid별 Redis Stream + consumer group
+FACEAI_TASK_QUEUE_BACKEND = 'list'
+
+# ASGI(faceai_central.asgi)로 실행할 때 image_api의 API를 async view로 처리할지 여부
+FACEAI_ASYNC_API = True
+
+# WSGI(faceai_central.wsgi)로 실행할 때 image_api의 API를 MIDDLEWARE 없이 처리할지 여부 (False이면 모든 요청에 MIDDLEWARE 적용)
+#   /ftp/*, /metainfo*는 MIDDLEWARE 없이, /info*는 CorsMiddleware만 적용 (image_api.wsgi_app 참고)
+FACEAI_WSGI_API = True
+
+# 업로드 admission control (image_api.admission); 제한을 넘은 업로드는 HTTP 429 + Retry-After
+#   rate: 초당 이미지 수, burst: 한 번에 받을 수 있는 이미지 수 (0이면 rate), max_queue: 배분 대기 task 개수 상한
+#   0이면 제한 없음. FACEAI_INGEST_LIMITS로 ftpid별 값 지정 (예: {'2': {'rate': 200, 'max_queue': 50000}})
+#   client는 REMOTE_ADDR; proxy 뒤에서는 FACEAI_CLIENT_ID_HEADER에 META key 지정 (예: 'HTTP_X_FORWARDED_FOR')
+FACEAI_INGEST_LIMIT = {'rate': 0, 'burst': 0, 'max_queue': 0}
+FACEAI_INGEST_LIMITS = {}
+FACEAI_CLIENT_INGEST_LIMIT = {'rate': 0, 'burst': 0}
+FACEAI_CLIENT_ID_HEADER = None
+
+# 업로드/metainfo 멱등성 (image_api.idempotency); Idempotency-Key header가 있으면 FACEAI_IDEMPOTENCY_TTL초 동안
+# 같은 key의 재시도는 다시 저장하지 않고 처음 요청의 token을 돌려준다 (metainfo는 저장하지 않고 성공)
+#   FACEAI_IDEMPOTENCY_CONTENT_HASH = True 이면 header가 없는 요청도 imglist/metainfos 내용의 hash로 중복을 판단
+FACEAI_IDEMPOTENCY_TTL = 60 * 60
+FACEAI_IDEMPOTENCY_CONTENT_HASH = False
+
+# ftpid별 task 처리 기한 (초); 지정하지 않은 ftpid는 PEDDING_TASK_AGE(20분)
+# 예: {'1': 60 * 20, '2': 60 * 60}
+FACEAI_VISIBILITY_TIMEOUT = {}
+# task 최대 시도 횟수; 처리 기한 안에 결과가 오지 않으면 다시 queue에 넣고, 넘으면 dead letter queue로 이동
+FACEAI_MAX_TASK_ATTEMPTS = 3
+
+# priority/tenant lane: 업로드 시 priority, tenant를 지정하면 ftpid 안에서 lane별 queue에 넣고,
+# task_provider는 priority weight 비율로 lane을 고르고 같은 priority의 tenant끼리는 같은 비율로 나눈다
+#   WEIGHTS: priority별 weight (0이면 다른 lane이 비었을 때만 배분)
+#   MAX_WAIT: 이 시간(초) 이상 배분되지 않은 lane은 weight와 관계없이 먼저 배분 (anti-starvation)
+FACEAI_LANE_WEIGHTS = {'high': 8, 'normal': 4, 'low': 1}
+FACEAI_LANE_MAX_WAIT = 30
+
+# work stealing (opt-in): ftpid별로 이미지에 접근할 수 있는 다른 ftpid 목록; 자기 queue가 비면 그 ftpid들의
+# queue 중 대기 task가 많은 queue에서 (queue마다 최대 절반) 가져간다. 대기 task가 MIN_BACKLOG 미만인 queue는 제외
+# 예: {'2': ['1', '3'], '3': ['1']}
+FACEAI_WORK_STEALING = {}
+FACEAI_STEAL_MIN_BACKLOG = 10
+
+# task / 이미지 정보 저장 형식 (API 응답은 동일)
+#   'hash': 이미지마다 ftp_img:<id> hash + taskinfo의 imgstr (default)
+#   'packed': 이미지 목록을 taskinfo의 imgs 필드 하나에 저장 (이미지별 key가 없어 Redis 메모리 절약)
+# 배분 시에는 두 형식을 모두 읽으므로 운영 중에 바꿔도 된다. 기존 task 변환: python manage.py taskstorage --migrate
+FACEAI_TASK_STORAGE = 'hash'
+
+# metainfo 압축: 정규화된 JSON이 FACEAI_METAINFO_COMPRESS_MIN bytes 이상이면 압축해서 저장
+#   'zlib' (default) 또는 'zstd' (zstandard 패키지 필요)
+FACEAI_METAINFO_CODEC = 'zlib'
+FACEAI_METAINFO_COMPRESS_MIN = 1024
+
+# 응답 JSON encoder: 'auto' (orjson 패키지가 있으면 orjson, 없으면 json), 'orjson', 'json'
+# FACEAI_JSON_STREAM_MIN: /ftp/tasks/ 등 list 응답의 item이 이 개수 이상이면 streaming으로 전송 (0이면 사용하지 않음)
+FACEAI_JSON_BACKEND = 'auto'
+FACEAI_JSON_STREAM_MIN = 0
+
+# COMPLETE된 token의 meta 정보를 process 안에 보관하는 LRU cache (image_api.result_cache)
+#   SIZE: 최대 token 개수 (0이면 사용하지 않음), TTL: 최대 보관 시간 (초)
+#   INVALIDATION: metainfo를 다시 저장하면 pub/sub으로 다른 process의 cache에서 삭제
+FACEAI_RESULT_CACHE_SIZE = 10000
+FACEAI_RESULT_CACHE_TTL = 60 * 10
+FACEAI_RESULT_CACHE_INVALIDATION = True
+
+# Redis sharding: (CACHES alias, raw CACHES alias) 목록; task/metainfo는 token, queue는 ftpid 기준으로 나눈다
+# node를 추가할 때는 CACHES에 alias 두 개(decode_responses 사용/미사용, LOCATION 문자열은 서로 다르게)를 추가하고 목록 끝에 붙인다
+# 예: [('default', 'raw'), ('shard1', 'shard1_raw'), ('shard2', 'shard2_raw')]
+FACEAI_REDIS_SHARDS = [('default', 'raw')]
+
+# Prometheus 형식 metrics (/metrics, image_api.metrics)
+#   FLUSH_INTERVAL: process에서 누적한 counter/histogram을 Redis(control node)에 더하는 주기 (초)
+#   SAMPLE_INTERVAL: queue 길이, pending 개수 등 gauge를 Redis에서 다시 조회하는 최소 간격 (초)
+# Redis 명령 측정은 CACHES OPTIONS의 REDIS_CLIENT_CLASS / ASYNC_REDIS_CLIENT_CLASS로 지정한다 (shard alias 포함)
+FACEAI_METRICS = True
+FACEAI_METRICS_FLUSH_INTERVAL = 10
+FACEAI_METRICS_SAMPLE_INTERVAL = 15
+
+# 운영 server (python manage.py serve, image_api.server); 명령행 옵션이 있으면 옵션이 우선
+#   interface: 'wsgi' (gthread worker, worker당 threads개 thread) 또는 'asgi' (uvicorn worker, uvicorn-worker package 필요)
+#   workers: worker process 수 (0이면 CPU 수), keepalive: idle keep-alive connection 유지 시간 (초)
+#   max_requests(+jitter): 이 개수만큼 처리한 worker는 새 worker로 교체, reaper: master가 reaper process 하나를 띄움
+FACEAI_SERVER = {
+    'bind': '0.0.0.0:8000',
+    'interface': 'wsgi',
+    'workers': 0,
+    'threads': 8,
+    'keepalive': 30,
+    'max_requests': 10000,
+    'max_requests_jitter': 1000,
+    'preload': True,
+    'reaper': True,
+}
@@ -0,0 +1,34 @@
+"""
+운영 settings (python manage.py serve --settings=faceai_central.settings_production)
+
+faceai_central.settings에서 DEBUG를 끄고 (요청별 SQL/template 기록 등 debug용 memory 사용 없음)
+비밀 값, Redis 주소, log 경로는 환경 변수로 받는다.
+
+    FACEAI_SECRET_KEY, FACEAI_ALLOWED_HOSTS (,로 구분)
+    FACEAI_REDIS_URL, FACEAI_REDIS_PASSWORD: default/raw alias의 Redis
+    FACEAI_LOG_DIR: log 파일 directory (기본값 /svc/api_log, access log는 /svc/accesslog)
+    FACEAI_WORKERS: worker process 수 (기본값 CPU 수)
+"""
+
+from faceai_central.settings import *
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('FACEAI_SECRET_KEY', SECRET_KEY)
+ALLOWED_HOSTS = os.environ.get('FACEAI_ALLOWED_HOSTS', '*').split(',')
+
+if os.environ.get('FACEAI_REDIS_URL'):
+    redis_url = os.environ['FACEAI_REDIS_URL']
+    CACHES['default']['LOCATION'] = redis_url
+    # raw alias는 같은 Redis를 다른 LOCATION 문자열로 지정 (django_redis는 LOCATION별로 connection pool 공유)
+    CACHES['raw']['LOCATION'] = redis_url + ('&' if '?' in redis_url else '?')
+if 'FACEAI_REDIS_PASSWORD' in os.environ:
+    for alias in ('default', 'raw'):
+        CACHES[alias]['OPTIONS']['PASSWORD'] = os.environ['FACEAI_REDIS_PASSWORD'] or None
+
+if os.environ.get('FACEAI_LOG_DIR'):
+    for handler in LOGGING['handlers'].values():
+        if 'filename' in handler:
+            handler['filename'] = os.path.join(os.environ['FACEAI_LOG_DIR'], os.path.basename(handler['filename']))
+
+FACEAI_SERVER = dict(FACEAI_SERVER, workers=int(os.environ.get('FACEAI_WORKERS', FACEAI_SERVER['workers'])))
@@ -29,9 +29,15 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('admin/', admin.site.urls),
     url(r'^ftp/imginfo/$', views.create_ftpimginfo),
+    url(r'^ftp/imginfo/bulk/$', views.create_ftpimginfos),
     url(r'^ftp/tasks/$', views.task_provider),
     url(r'^ftp/peddingtasks/$', views.get_peddingtasks),
+    url(r'^ftp/deadtasks/$', views.dead_tasks),
     url(r'^info/$', views.info),
+    url(r'^info/bulk/$', views.info_bulk),
+    url(r'^info/events/$', views.info_events),
     url(r'^metainfo/$', views.metainfo),
+    url(r'^metainfo/bulk/$', views.metainfo_bulk),
+    url(r'^metrics/?$', views.prometheus_metrics),
     #url(r'^swagger/$',),
 ]
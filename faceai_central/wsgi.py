@@ -13,4 +13,9 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'faceai_central.settings')
 
-application = get_wsgi_application()
+django_application = get_wsgi_application()
+
+# image_api의 API 경로는 middleware 없이 view를 직접 호출 (image_api.wsgi_app 참고)
+from image_api.wsgi_app import ApiWSGIApplication
+
+application = ApiWSGIApplication(django_application)
@@ -0,0 +1,19 @@
+"""FTP서버(worker)용 FaceAI API client
+
+/ftp/tasks/ polling과 /metainfo/ 결과 저장을 직접 구현하지 않고 사용하는 client. 표준 라이브러리만 사용하므로
+Django나 이 project의 다른 package 없이 FTP서버에 복사해서 사용할 수 있다.
+
+    - FaceAIClient: keep-alive connection pool을 공유하는 API client (thread safe)
+    - TaskWorker: 다음 batch를 background에서 미리 가져오고(prefetch), 결과는 모아서 /metainfo/bulk/로 보내는 worker loop
+    - ResultSubmitter: 크기 제한이 있는 buffer + Idempotency-Key 재시도로 결과를 batch 전송
+    - Stats: API별 latency와 처리량 (client.stats.format_report())
+
+local Django app에 대한 end-to-end 확인과 기존 방식(요청마다 새 connection, 결과를 하나씩 저장)과의 비교는
+python -m benchmarks.client 로 실행한다.
+"""
+from faceai_client.client import FaceAIClient, Task
+from faceai_client.http import ApiError
+from faceai_client.stats import Stats
+from faceai_client.worker import Prefetcher, ResultSubmitter, TaskWorker
+
+__all__ = ['FaceAIClient', 'Task', 'ApiError', 'Stats', 'Prefetcher', 'ResultSubmitter', 'TaskWorker']
@@ -0,0 +1,116 @@
+"""FaceAI API client"""
+import json
+import time
+from collections import namedtuple
+from faceai_client.http import ConnectionPool, parse_response
+from faceai_client.stats import Stats
+
+# server의 image_api.constants와 같은 값
+MAX_BULK_RESULTS = 1000
+MAX_BULK_INFO = 1000
+MAX_POLL_WAIT = 30
+
+# /ftp/tasks/로 배분받은 task (ftpid: work stealing으로 다른 ftpid에서 가져온 task이면 원래 ftpid)
+Task = namedtuple('Task', 'token imglist ftpid')
+
+
+def _metainfos_value(metainfos):
+    return metainfos if isinstance(metainfos, str) else json.dumps(metainfos)
+
+
+class FaceAIClient:
+    """ FaceAI API client (thread safe; 모든 thread가 connection pool 하나를 같이 사용)
+
+    API가 code 200이 아닌 응답을 리턴하면 ApiError, 전송 오류는 OSError / http.client.HTTPException을 raise한다.
+    API 호출마다 latency를 stats에 path별로 기록한다.
+
+        client = FaceAIClient('http://faceai:8000', pool_size=8)
+        tasks = client.fetch_tasks('2', limit=100, wait=10, max_images=64)
+        client.submit_results([(task.token, infer(task)) for task in tasks])
+    """
+
+    def __init__(self, base_url, pool_size=8, timeout=MAX_POLL_WAIT * 2, stats=None):
+        self.pool = ConnectionPool(base_url, pool_size, timeout)
+        self.stats = stats if stats is not None else Stats()
+
+    def call(self, method, path, params=None, headers=None):
+        """ Returns: 응답 전체 ({"code", "msg", "data", ...}) """
+        start = time.perf_counter()
+        try:
+            payload = parse_response(*self.pool.request(method, path, params, headers))
+        except Exception:
+            self.stats.record(path, time.perf_counter() - start, ok=False)
+            raise
+        self.stats.record(path, time.perf_counter() - start)
+        return payload
+
+    def fetch_tasks(self, ftpid, limit=100, wait=0, max_images=0, max_bytes=0, linger=0, consumer=None,
+                    steal=True):
+        """ IF-FACEAI-002: 처리할 task를 배분받는다 (파라미터는 image_api.views.task_provider 참고)
+
+        Returns: [Task, ...]
+        """
+        params = {'ftpid': ftpid, 'limit': limit}
+        for name, value in (('wait', min(wait, MAX_POLL_WAIT)), ('max_images', max_images),
+                            ('max_bytes', max_bytes), ('linger', linger), ('consumer', consumer)):
+            if value:
+                params[name] = value
+        if not steal:
+            params['steal'] = 0
+        data = self.call('GET', '/ftp/tasks/', params)['data']
+        return [Task(item['token'], item['imglist'], str(item.get('ftpid', ftpid))) for item in data]
+
+    def submit_result(self, token, metainfos, idempotency_key=None):
+        """ IF-FACEAI-004: task 하나의 처리 결과 저장 (metainfos: json으로 보낼 값 또는 json 문자열) """
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else None
+        self.call('POST', '/metainfo/', {'token': token, 'metainfos': _metainfos_value(metainfos)}, headers)
+
+    def submit_results(self, results, idempotency_key=None):
+        """ IF-FACEAI-009: 여러 task의 처리 결과를 한 번에 저장 (최대 MAX_BULK_RESULTS개)
+
+        Args:
+            results: [(token, metainfos), ...]
+            idempotency_key: 같은 key로 다시 보내면 이미 저장된 item은 다시 저장하지 않는다
+
+        Returns: item 순서대로 [{'token', 'saved', 'errors'(실패 시), 'duplicate'(이미 저장된 재시도)}, ...]
+        """
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else None
+        # bulk API는 metainfos를 json 값 그대로 받는다
+        items = [{'token': token, 'metainfos': metainfos} for token, metainfos in results]
+        return self.call('POST', '/metainfo/bulk/', {'results': json.dumps(items)}, headers)['data']['results']
+
+    def upload(self, ftpid, imglist, priority=None, tenant=None, idempotency_key=None):
+        """ IF-FACEAI-001: 업로드한 이미지 정보 전달 (imglist: [{'path': ...}, ...])
+
+        Returns: token
+        """
+        params = {'ftpid': ftpid, 'imglist': json.dumps(imglist)}
+        if priority:
+            params['priority'] = priority
+        if tenant:
+            params['tenant'] = tenant
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else None
+        return self.call('POST', '/ftp/imginfo/', params, headers)['data']['token']
+
+    def upload_bulk(self, batches, idempotency_key=None):
+        """ IF-FACEAI-006: 여러 업로드 batch 전달 (batches: [{'ftpid', 'imglist', 'priority', 'tenant'}, ...])
+
+        Returns: batch 순서대로 token 리스트
+        """
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else None
+        return self.call('POST', '/ftp/imginfo/bulk/', {'batches': json.dumps(batches)}, headers)['data']['tokens']
+
+    def info(self, token):
+        """ IF-FACEAI-005: Returns: (status, meta 정보) """
+        payload = self.call('GET', '/info/', {'token': token})
+        return payload.get('status'), payload['data']
+
+    def info_bulk(self, tokens, status_only=False):
+        """ IF-FACEAI-010: Returns: {token: {'status', 'data'}} (최대 MAX_BULK_INFO개) """
+        params = {'tokens': ','.join(tokens)}
+        if status_only:
+            params['status_only'] = 'true'
+        return self.call('POST', '/info/bulk/', params)['data']
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,121 @@
+"""keep-alive HTTP connection pool (표준 라이브러리 http.client만 사용)"""
+import http.client
+import json
+import queue
+from urllib.parse import urlencode, urlsplit
+
+# keep-alive connection이 server에서 이미 닫혔을 때 나는 오류 (재사용한 connection이면 새 connection으로 한 번 다시 보낸다)
+STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError, BrokenPipeError)
+# 다시 보내면 성공할 수 있는 전송 오류
+TRANSPORT_ERRORS = (OSError, http.client.HTTPException)
+
+
+class ApiError(Exception):
+    """ API가 code 200이 아닌 응답을 리턴
+
+    code: 응답의 code (HTTP status가 200이어도 응답의 code가 422 등일 수 있다)
+    data: 응답의 data (422이면 field별 오류)
+    retry_after: 429 응답의 Retry-After(초), 없으면 None
+    """
+
+    def __init__(self, code, msg, data=None, retry_after=None):
+        super().__init__('%s %s' % (code, msg))
+        self.code = code
+        self.msg = msg
+        self.data = data
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        """ 같은 요청을 다시 보내면 성공할 수 있는 오류 (429, 5xx) """
+        return self.code == 429 or self.code >= 500
+
+
+def parse_response(status, headers, body):
+    """ {"code", "msg", "data", ...} 응답을 parse
+
+    Returns: 응답 전체 (dict), code가 200이 아니면 ApiError
+    """
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise ApiError(status, 'invalid response', body[:200])
+    code = payload.get('code', status) if isinstance(payload, dict) else status
+    if status != 200 or code != 200:
+        retry_after = headers.get('retry-after')
+        raise ApiError(code if status == 200 else status, payload.get('msg', '') if isinstance(payload, dict) else '',
+                       payload.get('data') if isinstance(payload, dict) else None,
+                       float(retry_after) if retry_after else None)
+    return payload
+
+
+class ConnectionPool:
+    """ server 하나에 대한 keep-alive connection pool (thread safe)
+
+    요청마다 쉬고 있는 connection을 꺼내 쓰고 돌려준다. 쉬고 있는 connection이 없으면 새로 만들고,
+    maxsize개보다 많은 connection은 돌려줄 때 닫는다. timeout은 long-poll(wait)보다 길어야 한다.
+    """
+
+    def __init__(self, base_url, maxsize=8, timeout=60):
+        parts = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize)
+
+    def _get(self):
+        """ Returns: (connection, 재사용한 connection이면 True) """
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self.connection_class(self.host, self.port, timeout=self.timeout), False
+
+    def _put(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, method, path, params=None, headers=None):
+        """ params는 GET이면 query string, 아니면 form(application/x-www-form-urlencoded) body로 보낸다
+
+        Returns: (HTTP status, {소문자 header 이름: 값}, body)
+        """
+        headers = dict(headers or {})
+        body = None
+        if params:
+            encoded = urlencode(params)
+            if method == 'GET':
+                path += '?' + encoded
+            else:
+                body = encoded.encode()
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        path = self.prefix + path
+        while True:
+            conn, reused = self._get()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except STALE_ERRORS:
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._put(conn)
+            return response.status, {name.lower(): value for name, value in response.getheaders()}, data
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,87 @@
+"""client 측 throughput/latency 집계"""
+import collections
+import threading
+import time
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+class Stats:
+    """ 이름별 latency와 개수 (thread safe)
+
+    - record(name, seconds, ok): API 호출, handler 실행 등의 latency (이름별로 최근 max_samples개만 보관)
+    - add(name, count): 처리한 task/이미지/결과 개수, 재시도 횟수 등
+    """
+
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.perf_counter()
+            self._samples = {}
+            self._errors = collections.Counter()
+            self._counters = collections.Counter()
+
+    def record(self, name, seconds, ok=True):
+        with self._lock:
+            if not ok:
+                self._errors[name] += 1
+                return
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = collections.deque(maxlen=self.max_samples)
+            samples.append(seconds)
+
+    def add(self, name, count=1):
+        with self._lock:
+            self._counters[name] += count
+
+    def count(self, name):
+        with self._lock:
+            return self._counters[name]
+
+    def report(self):
+        """ Returns: {'elapsed', 'counters': {name: {'total', 'per_sec'}},
+                      'latency': {name: {'count', 'errors', 'p50_ms', 'p99_ms', 'max_ms'}}} """
+        with self._lock:
+            elapsed = time.perf_counter() - self.started
+            samples = {name: list(values) for name, values in self._samples.items()}
+            errors = dict(self._errors)
+            counters = dict(self._counters)
+        latency = {}
+        for name in sorted(set(samples) | set(errors)):
+            values = samples.get(name, [])
+            latency[name] = {
+                'count': len(values),
+                'errors': errors.get(name, 0),
+                'p50_ms': round(percentile(values, 50) * 1000, 3),
+                'p99_ms': round(percentile(values, 99) * 1000, 3),
+                'max_ms': round(max(values) * 1000, 3) if values else 0.0,
+            }
+        return {
+            'elapsed': round(elapsed, 3),
+            'counters': {name: {'total': total, 'per_sec': round(total / elapsed, 1) if elapsed > 0 else 0.0}
+                         for name, total in sorted(counters.items())},
+            'latency': latency,
+        }
+
+    def format_report(self):
+        """ report()를 사람이 읽을 수 있는 표로 """
+        report = self.report()
+        lines = ['elapsed %.1fs' % report['elapsed']]
+        for name, counter in report['counters'].items():
+            lines.append('%-24s %10d %10.1f/s' % (name, counter['total'], counter['per_sec']))
+        lines.append('%-24s %8s %6s %10s %10s %10s' % ('latency', 'count', 'errors', 'p50_ms', 'p99_ms', 'max_ms'))
+        for name, stats in report['latency'].items():
+            lines.append('%-24s %8d %6d %10.3f %10.3f %10.3f' % (
+                name, stats['count'], stats['errors'], stats['p50_ms'], stats['p99_ms'], stats['max_ms']))
+        return '\n'.join(lines)
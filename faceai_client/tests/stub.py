@@ -0,0 +1,117 @@
+"""faceai_client test용 HTTP/1.1 keep-alive stub server (표준 라이브러리 http.server)
+
+test가 path별 응답을 순서대로 지정하고(respond), 지정한 응답이 없으면 API와 같은 형식의 기본 응답을 보낸다.
+받은 요청(requests)과 연결된 connection 수(connections)를 기록한다.
+"""
+import json
+import socket
+import threading
+from collections import defaultdict, namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+# 받은 요청 (params: query string 또는 form body)
+Request = namedtuple('Request', 'method path params headers')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.stub._connected(self.connection)
+
+    def _handle(self):
+        parts = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+        params = dict(parse_qsl(parts.query if self.command == 'GET' else body, keep_blank_values=True))
+        status, payload, headers = self.server.stub._response(
+            Request(self.command, parts.path, params, {name.lower(): value for name, value in self.headers.items()}))
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer:
+    """ 127.0.0.1의 빈 port에서 background thread로 실행 (start/stop 또는 with) """
+
+    def __init__(self):
+        self.requests = []
+        self.connections = 0
+        self._responses = defaultdict(list)
+        self._sockets = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05},
+                                        daemon=True)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s' % self._server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self.drop_connections()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, path, code=200, data=None, status=200, headers=None, **extra):
+        """ path의 다음 요청에 보낼 응답을 추가 ({"code", "msg", "data", ...extra}, HTTP status, header) """
+        payload = dict({'code': code, 'msg': 'success' if code == 200 else 'error', 'data': data}, **extra)
+        with self._lock:
+            self._responses[path].append((status, payload, headers or {}))
+
+    def drop_connections(self):
+        """ 연결된 connection을 server 쪽에서 모두 끊는다 (keep-alive connection이 닫힌 상황) """
+        with self._lock:
+            sockets, self._sockets = self._sockets, []
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def requests_to(self, path):
+        with self._lock:
+            return [request for request in self.requests if request.path == path]
+
+    def _connected(self, sock):
+        with self._lock:
+            self.connections += 1
+            self._sockets.append(sock)
+
+    def _response(self, request):
+        with self._lock:
+            self.requests.append(request)
+            if self._responses[request.path]:
+                return self._responses[request.path].pop(0)
+        return 200, {'code': 200, 'msg': 'success', 'data': self._default_data(request)}, {}
+
+    def _default_data(self, request):
+        if request.path == '/ftp/tasks/':
+            return []
+        if request.path == '/metainfo/bulk/':
+            results = json.loads(request.params['results'])
+            return {'saved': len(results), 'results': [{'token': item['token'], 'saved': True} for item in results]}
+        return {}
@@ -0,0 +1,102 @@
+"""ConnectionPool keep-alive 재사용, 응답 parse (faceai_client.http)"""
+import threading
+import unittest
+
+from faceai_client import ApiError, FaceAIClient
+from faceai_client.http import ConnectionPool
+from faceai_client.tests.stub import StubServer
+
+
+class ConnectionPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer().start()
+        self.addCleanup(self.server.stop)
+
+    def test_reuses_keepalive_connection(self):
+        pool = ConnectionPool(self.server.url, maxsize=2)
+        self.addCleanup(pool.close)
+        for i in range(5):
+            status, _, _ = pool.request('GET', '/ftp/tasks/', {'ftpid': i})
+            self.assertEqual(status, 200)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual([request.params['ftpid'] for request in self.server.requests], ['0', '1', '2', '3', '4'])
+
+    def test_post_form_body(self):
+        pool = ConnectionPool(self.server.url + '/api/')
+        self.addCleanup(pool.close)
+        pool.request('POST', '/metainfo/', {'token': 't1', 'metainfos': '[]'}, {'Idempotency-Key': 'k1'})
+        request = self.server.requests[0]
+        self.assertEqual((request.method, request.path), ('POST', '/api/metainfo/'))
+        self.assertEqual(request.params, {'token': 't1', 'metainfos': '[]'})
+        self.assertEqual(request.headers['idempotency-key'], 'k1')
+
+    def test_reconnects_closed_connection(self):
+        pool = ConnectionPool(self.server.url)
+        self.addCleanup(pool.close)
+        pool.request('GET', '/info/')
+        self.server.drop_connections()
+        status, _, _ = pool.request('GET', '/info/')
+        self.assertEqual(status, 200)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_server_close_is_not_pooled(self):
+        self.server.respond('/info/', headers={'Connection': 'close'})
+        pool = ConnectionPool(self.server.url)
+        self.addCleanup(pool.close)
+        pool.request('GET', '/info/')
+        pool.request('GET', '/info/')
+        self.assertEqual(self.server.connections, 2)
+
+    def test_pool_keeps_at_most_maxsize_idle_connections(self):
+        pool = ConnectionPool(self.server.url, maxsize=2)
+        self.addCleanup(pool.close)
+        # 동시에 사용한 connection 4개 중 2개만 pool에 남는다
+        conns = [pool._get()[0] for _ in range(4)]
+        for conn in conns:
+            conn.connect()
+            pool._put(conn)
+        self.assertEqual(pool._idle.qsize(), 2)
+        self.assertIsNone(conns[3].sock)
+
+    def test_shared_between_threads(self):
+        client = FaceAIClient(self.server.url, pool_size=4)
+        self.addCleanup(client.close)
+
+        def work():
+            for _ in range(20):
+                client.fetch_tasks('1')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.server.requests), 80)
+        self.assertLessEqual(self.server.connections, 4)
+
+
+class ApiErrorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer().start()
+        self.addCleanup(self.server.stop)
+        self.client = FaceAIClient(self.server.url)
+        self.addCleanup(self.client.close)
+
+    def test_error_code_in_body(self):
+        self.server.respond('/metainfo/', code=422, data={'token': ['This field is required.']})
+        with self.assertRaises(ApiError) as raised:
+            self.client.submit_result('', [])
+        self.assertEqual(raised.exception.code, 422)
+        self.assertEqual(raised.exception.data, {'token': ['This field is required.']})
+        self.assertFalse(raised.exception.retryable)
+
+    def test_throttled(self):
+        self.server.respond('/ftp/imginfo/', code=429, status=429, headers={'Retry-After': '3'},
+                            data={'reason': 'queue', 'subject': '1', 'retry_after': 3})
+        with self.assertRaises(ApiError) as raised:
+            self.client.upload('1', [{'path': '/a.jpg'}])
+        self.assertEqual((raised.exception.code, raised.exception.retry_after), (429, 3.0))
+        self.assertTrue(raised.exception.retryable)
+        self.assertEqual(self.client.stats.report()['latency']['/ftp/imginfo/']['errors'], 1)
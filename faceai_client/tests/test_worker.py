@@ -0,0 +1,213 @@
+"""Prefetcher, ResultSubmitter batch 전송/재시도, TaskWorker (faceai_client.worker)"""
+import json
+import logging
+import time
+import unittest
+
+from faceai_client import FaceAIClient, Prefetcher, ResultSubmitter, TaskWorker
+from faceai_client.tests.stub import StubServer
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.01)
+
+
+def task_data(*tokens):
+    return [{'token': token, 'imglist': [{'id': '1', 'path': '/a.jpg', 'ftpid': '1'}]} for token in tokens]
+
+
+class WorkerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer().start()
+        self.addCleanup(self.server.stop)
+        self.client = FaceAIClient(self.server.url)
+        self.addCleanup(self.client.close)
+        # 오류/재시도 test의 warning log를 출력하지 않는다
+        logger = logging.getLogger('faceai_client')
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.CRITICAL)
+
+
+class PrefetcherTests(WorkerTestCase):
+
+    def start_prefetcher(self, **options):
+        prefetcher = Prefetcher(self.client, '1', **options)
+        prefetcher.start()
+        self.addCleanup(prefetcher.stop, 1)
+        return prefetcher
+
+    def test_prefetch_depth(self):
+        for i in range(4):
+            self.server.respond('/ftp/tasks/', data=task_data('t%s' % i))
+        prefetcher = self.start_prefetcher(depth=2, wait=0)
+        wait_until(lambda: len(self.server.requests_to('/ftp/tasks/')) == 2)
+        # depth개를 가져온 후에는 batch를 꺼낼 때까지 더 가져오지 않는다
+        time.sleep(0.2)
+        self.assertEqual(len(self.server.requests_to('/ftp/tasks/')), 2)
+
+        self.assertEqual([task.token for task in prefetcher.get(timeout=1)], ['t0'])
+        wait_until(lambda: len(self.server.requests_to('/ftp/tasks/')) >= 3)
+        self.assertEqual([task.token for task in prefetcher.get(timeout=1)], ['t1'])
+        self.assertEqual([task.token for task in prefetcher.get(timeout=1)], ['t2'])
+        wait_until(lambda: self.client.stats.count('tasks_fetched') == 4)
+
+    def test_fetch_options(self):
+        prefetcher = self.start_prefetcher(wait=5, limit=10, max_images=64, linger=0.05)
+        wait_until(lambda: self.server.requests_to('/ftp/tasks/'))
+        prefetcher.stop(1)
+        params = self.server.requests_to('/ftp/tasks/')[0].params
+        self.assertEqual(params, {'ftpid': '1', 'limit': '10', 'wait': '5', 'max_images': '64', 'linger': '0.05'})
+
+    def test_empty_batch_keeps_polling(self):
+        prefetcher = self.start_prefetcher(depth=1, wait=0)
+        wait_until(lambda: len(self.server.requests_to('/ftp/tasks/')) >= 3)
+        self.assertEqual(prefetcher.get(timeout=0.05), [])
+
+    def test_error_backoff(self):
+        self.server.respond('/ftp/tasks/', code=500, status=500)
+        self.server.respond('/ftp/tasks/', code=429, status=429, headers={'Retry-After': '0.05'})
+        self.server.respond('/ftp/tasks/', data=task_data('t1'))
+        prefetcher = self.start_prefetcher(wait=0, error_backoff=0.01)
+        self.assertEqual([task.token for task in prefetcher.get(timeout=2)], ['t1'])
+        self.assertEqual(self.client.stats.count('fetch_errors'), 2)
+
+    def test_stop_returns_abandoned_tasks(self):
+        self.server.respond('/ftp/tasks/', data=task_data('t1', 't2'))
+        prefetcher = self.start_prefetcher(wait=0)
+        wait_until(lambda: self.client.stats.count('tasks_fetched') == 2)
+        self.assertEqual(prefetcher.stop(1), 2)
+        self.assertEqual(self.client.stats.count('tasks_abandoned'), 2)
+
+
+class ResultSubmitterTests(WorkerTestCase):
+
+    def submitter(self, **options):
+        self.failures = []
+        options.setdefault('retry_backoff', 0.01)
+        return ResultSubmitter(self.client, on_failure=lambda results, error: self.failures.append((results, error)),
+                               **options)
+
+    def sent_batches(self):
+        return [[item['token'] for item in json.loads(request.params['results'])]
+                for request in self.server.requests_to('/metainfo/bulk/')]
+
+    def test_batch_size(self):
+        submitter = self.submitter(batch_size=3, flush_interval=0.5)
+        for i in range(7):
+            submitter.submit('t%s' % i, [{'id': i}])
+        submitter.start()
+        submitter.close()
+        self.assertEqual(self.sent_batches(), [['t0', 't1', 't2'], ['t3', 't4', 't5'], ['t6']])
+        self.assertEqual(self.client.stats.count('results_saved'), 7)
+        self.assertEqual(self.failures, [])
+
+    def test_flush_interval(self):
+        submitter = self.submitter(batch_size=100, flush_interval=0.05)
+        submitter.start()
+        submitter.submit('t1', [])
+        wait_until(lambda: self.sent_batches())
+        self.assertEqual(self.sent_batches(), [['t1']])
+        submitter.close()
+
+    def test_retry_with_same_idempotency_key(self):
+        self.server.respond('/metainfo/bulk/', code=500, status=500)
+        self.server.respond('/metainfo/bulk/', code=429, status=429, headers={'Retry-After': '0.01'})
+        submitter = self.submitter(batch_size=2)
+        submitter.submit('t1', [])
+        submitter.submit('t2', [])
+        submitter.start()
+        submitter.close()
+        requests = self.server.requests_to('/metainfo/bulk/')
+        self.assertEqual(len(requests), 3)
+        self.assertEqual(len(set(request.headers['idempotency-key'] for request in requests)), 1)
+        self.assertEqual(self.client.stats.count('submit_retries'), 2)
+        self.assertEqual(self.client.stats.count('results_saved'), 2)
+        self.assertEqual(self.failures, [])
+
+    def test_reconnects_after_transport_error(self):
+        submitter = self.submitter()
+        submitter.start()
+        submitter.submit('t1', [])
+        submitter.flush()
+        self.server.drop_connections()
+        submitter.submit('t2', [])
+        submitter.close()
+        self.assertEqual(self.sent_batches(), [['t1'], ['t2']])
+        self.assertEqual(self.failures, [])
+
+    def test_max_retries(self):
+        for _ in range(3):
+            self.server.respond('/metainfo/bulk/', code=500, status=500)
+        submitter = self.submitter(max_retries=2)
+        submitter.submit('t1', [{'id': 1}])
+        submitter.start()
+        submitter.close()
+        self.assertEqual(len(self.server.requests_to('/metainfo/bulk/')), 3)
+        [(results, error)] = self.failures
+        self.assertEqual((results, error.code), ([('t1', [{'id': 1}])], 500))
+
+    def test_invalid_request_is_not_retried(self):
+        self.server.respond('/metainfo/bulk/', code=422, data={'results': ['results must be a non-empty json array']})
+        submitter = self.submitter()
+        submitter.submit('t1', [])
+        submitter.start()
+        submitter.close()
+        self.assertEqual(len(self.server.requests_to('/metainfo/bulk/')), 1)
+        self.assertEqual([error.code for _, error in self.failures], [422])
+
+    def test_item_errors(self):
+        self.server.respond('/metainfo/bulk/', data={'saved': 1, 'results': [
+            {'token': 't1', 'saved': True}, {'token': 't2', 'saved': False, 'errors': {'token': ['unknown']}},
+            {'token': 't3', 'saved': True, 'duplicate': True}]})
+        submitter = self.submitter(batch_size=3)
+        for token in ('t1', 't2', 't3'):
+            submitter.submit(token, [])
+        submitter.start()
+        submitter.close()
+        [(results, error)] = self.failures
+        self.assertEqual(results, [('t2', [])])
+        self.assertEqual(error.data, [{'token': ['unknown']}])
+        self.assertEqual(self.client.stats.count('results_saved'), 2)
+        self.assertEqual(self.client.stats.count('results_duplicate'), 1)
+
+
+class TaskWorkerTests(WorkerTestCase):
+
+    def test_run(self):
+        self.server.respond('/ftp/tasks/', data=task_data('t1', 't2'))
+        self.server.respond('/ftp/tasks/', data=task_data('t3'))
+
+        def handler(tasks):
+            # None인 task는 결과를 보내지 않는다
+            return [None if task.token == 't2' else [{'id': task.imglist[0]['id'], 'metainfo': {'age': 30}}]
+                    for task in tasks]
+
+        with TaskWorker(self.client, '1', handler, wait=0, submit_batch=10) as worker:
+            self.assertEqual(worker.run(max_tasks=3), 3)
+        sent = [item for request in self.server.requests_to('/metainfo/bulk/')
+                for item in json.loads(request.params['results'])]
+        self.assertEqual(sorted(item['token'] for item in sent), ['t1', 't3'])
+        self.assertEqual(sent[0]['metainfos'], [{'id': '1', 'metainfo': {'age': 30}}])
+        # 처리하는 동안 같은 connection pool을 재사용한다
+        self.assertLessEqual(self.server.connections, 2)
+
+    def test_handler_error_skips_batch(self):
+        self.server.respond('/ftp/tasks/', data=task_data('t1'))
+
+        def handler(tasks):
+            raise RuntimeError('model failed')
+
+        with self.assertLogs('faceai_client', 'ERROR'):
+            with TaskWorker(self.client, '1', handler, wait=0) as worker:
+                self.assertEqual(worker.run(max_tasks=1), 1)
+        self.assertEqual(self.server.requests_to('/metainfo/bulk/'), [])
+        self.assertEqual(self.client.stats.report()['latency']['handler']['errors'], 1)
+
+    def test_idle_timeout(self):
+        with TaskWorker(self.client, '1', lambda tasks: [], wait=0) as worker:
+            self.assertEqual(worker.run(idle_timeout=0.1), 0)
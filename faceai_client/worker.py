@@ -0,0 +1,277 @@
+"""FTP서버 worker loop: task prefetch, 처리, 결과 batch 전송
+
+    def infer(tasks):
+        # tasks 순서대로 task별 metainfos ([{'id': 이미지 id, 'metainfo': {...}}, ...]) 리스트
+        return [model.run(task.imglist) for task in tasks]
+
+    client = FaceAIClient('http://faceai:8000')
+    with TaskWorker(client, '2', infer, max_images=64, linger=0.05) as worker:
+        worker.run()                    # stop() 또는 KeyboardInterrupt까지
+    print(client.stats.format_report())
+
+처리 중인 batch와 별도로 prefetch개 batch를 background thread가 미리 가져오고(long-poll), 결과는 ResultSubmitter가
+모아서 /metainfo/bulk/로 보낸다. 미리 가져온 task도 이미 배분된 상태(처리 기한이 흐르는 중)이므로 prefetch는
+batch 처리 시간 x (prefetch + 1)이 visibility timeout보다 충분히 짧게 잡는다. 종료할 때 처리하지 못한 task는
+visibility timeout 후 다시 배분된다.
+"""
+import logging
+import queue
+import threading
+import time
+import uuid
+from faceai_client.client import MAX_BULK_RESULTS
+from faceai_client.http import ApiError, TRANSPORT_ERRORS
+
+logger = logging.getLogger('faceai_client')
+
+# 오류 후 다시 시도할 때까지 기다리는 최대 시간 (초)
+MAX_BACKOFF = 30
+
+
+class Prefetcher:
+    """ task batch를 background thread에서 미리 가져온다 (가져온 batch는 최대 depth개까지 쌓아둔다) """
+
+    def __init__(self, client, ftpid, depth=1, wait=10, error_backoff=0.5, **fetch_options):
+        self.client = client
+        self.ftpid = ftpid
+        self.wait = wait
+        self.error_backoff = error_backoff
+        self.fetch_options = fetch_options
+        self._batches = queue.Queue()
+        self._slots = threading.Semaphore(max(1, depth))
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='faceai-prefetch-%s' % ftpid, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        stats = self.client.stats
+        delay = self.error_backoff
+        while not self._stopping.is_set():
+            if not self._slots.acquire(timeout=0.1):
+                continue
+            try:
+                tasks = self.client.fetch_tasks(self.ftpid, wait=self.wait, **self.fetch_options)
+            except (ApiError,) + TRANSPORT_ERRORS as e:
+                self._slots.release()
+                stats.add('fetch_errors')
+                logger.warning("fetch tasks failed (ftpid %s): %s", self.ftpid, e)
+                self._stopping.wait(getattr(e, 'retry_after', None) or delay)
+                delay = min(delay * 2, MAX_BACKOFF)
+                continue
+            delay = self.error_backoff
+            if not tasks:
+                self._slots.release()
+                continue
+            stats.add('tasks_fetched', len(tasks))
+            stats.add('images_fetched', sum(len(task.imglist) for task in tasks))
+            self._batches.put((time.perf_counter(), tasks))
+
+    def get(self, timeout=None):
+        """ Returns: 미리 가져온 batch ([Task, ...]), timeout초 동안 없으면 [] """
+        try:
+            fetched, tasks = self._batches.get(timeout=timeout)
+        except queue.Empty:
+            return []
+        self._slots.release()
+        self.client.stats.record('prefetch_wait', time.perf_counter() - fetched)
+        return tasks
+
+    def stop(self, timeout=None):
+        """ Returns: 가져왔지만 처리하지 않은 task 개수 (visibility timeout 후 다시 배분된다) """
+        self._stopping.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        abandoned = 0
+        while True:
+            try:
+                abandoned += len(self._batches.get_nowait()[1])
+            except queue.Empty:
+                break
+        if abandoned:
+            self.client.stats.add('tasks_abandoned', abandoned)
+        return abandoned
+
+
+class ResultSubmitter:
+    """ 처리 결과를 모아서 /metainfo/bulk/로 보낸다 (background thread)
+
+    submit()은 결과를 buffer에 넣고 바로 리턴하고, buffer가 max_pending개로 차면 자리가 날 때까지 기다린다.
+    flush thread는 batch_size개가 모이거나 첫 결과를 받은 후 flush_interval초가 지나면 보낸다.
+    전송 오류, 429, 5xx이면 같은 Idempotency-Key로 backoff 후 다시 보내므로 이전 시도가 저장되었어도 다시 저장되지 않는다.
+    max_retries번 넘게 실패하거나 item 오류(검증 실패 등)로 저장되지 않은 결과는 on_failure(results, error)로 넘긴다.
+    """
+
+    def __init__(self, client, batch_size=100, flush_interval=0.05, max_pending=1000, max_retries=5,
+                 retry_backoff=0.5, on_failure=None):
+        self.client = client
+        self.batch_size = min(batch_size, MAX_BULK_RESULTS)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.on_failure = on_failure
+        self._buffer = queue.Queue(max_pending)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='faceai-submit', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, token, metainfos, timeout=None):
+        """ buffer가 차 있으면 최대 timeout초 동안 기다린다 (자리가 나지 않으면 queue.Full) """
+        self._buffer.put((token, metainfos, time.perf_counter()), timeout=timeout)
+
+    def flush(self):
+        """ buffer의 결과를 모두 보낼 때까지 기다린다 """
+        self._buffer.join()
+
+    def close(self):
+        self.flush()
+        self._stopping.set()
+        self._thread.join()
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._buffer.empty()):
+            try:
+                batch = [self._buffer.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            deadline = time.perf_counter() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._buffer.get(timeout=remaining) if remaining > 0 else self._buffer.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._send(batch)
+            except Exception:
+                logger.exception("submit results failed")
+                self._failed(batch, None)
+            finally:
+                for _ in batch:
+                    self._buffer.task_done()
+
+    def _send(self, batch):
+        stats = self.client.stats
+        results = [(token, metainfos) for token, metainfos, _ in batch]
+        key = uuid.uuid4().hex
+        delay = self.retry_backoff
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                stats.add('submit_retries')
+            try:
+                replies = self.client.submit_results(results, idempotency_key=key)
+            except ApiError as e:
+                if not e.retryable:
+                    self._failed(batch, e)
+                    return
+                error, wait = e, e.retry_after or delay
+            except TRANSPORT_ERRORS as e:
+                error, wait = e, delay
+            else:
+                break
+            logger.warning("submit results failed (%s results, attempt %s): %s", len(batch), attempt + 1, error)
+            time.sleep(wait)
+            delay = min(delay * 2, MAX_BACKOFF)
+        else:
+            self._failed(batch, error)
+            return
+
+        now = time.perf_counter()
+        failed = []
+        for item, reply in zip(batch, replies):
+            if reply.get('saved'):
+                stats.record('result_delay', now - item[2])
+            else:
+                failed.append(item)
+        stats.add('results_saved', len(batch) - len(failed))
+        stats.add('results_duplicate', sum(1 for reply in replies if reply.get('duplicate')))
+        if failed:
+            errors = [reply.get('errors') for reply in replies if not reply.get('saved')]
+            self._failed(failed, ApiError(422, 'Data Invalid', errors))
+
+    def _failed(self, batch, error):
+        self.client.stats.add('results_failed', len(batch))
+        logger.error("%s results not saved: %s", len(batch), error)
+        if self.on_failure is not None:
+            self.on_failure([(token, metainfos) for token, metainfos, _ in batch], error)
+
+
+class TaskWorker:
+    """ Prefetcher -> handler -> ResultSubmitter
+
+    handler(tasks): tasks 순서대로 task별 metainfos 리스트를 리턴 (None인 task는 결과를 보내지 않는다).
+        예외가 나면 batch를 건너뛴다. (그 task들은 visibility timeout 후 다시 배분된다)
+    fetch_options: FaceAIClient.fetch_tasks의 limit, max_images, max_bytes, linger, consumer, steal
+    """
+
+    def __init__(self, client, ftpid, handler, prefetch=1, wait=10, submit_batch=100, flush_interval=0.05,
+                 max_pending=1000, max_retries=5, on_failure=None, **fetch_options):
+        self.client = client
+        self.handler = handler
+        self.prefetcher = Prefetcher(client, ftpid, depth=prefetch, wait=wait, **fetch_options)
+        self.submitter = ResultSubmitter(client, batch_size=submit_batch, flush_interval=flush_interval,
+                                         max_pending=max_pending, max_retries=max_retries, on_failure=on_failure)
+        self._stopping = threading.Event()
+        self._started = False
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            self.submitter.start()
+            self.prefetcher.start()
+
+    def run(self, max_tasks=None, idle_timeout=None):
+        """ stop()을 호출하거나, max_tasks개를 처리하거나, idle_timeout초 동안 task가 없으면 리턴
+
+        Returns: 처리한 task 개수
+        """
+        self.start()
+        stats = self.client.stats
+        processed = 0
+        idle_since = time.perf_counter()
+        while not self._stopping.is_set():
+            tasks = self.prefetcher.get(timeout=0.1)
+            if not tasks:
+                if idle_timeout is not None and time.perf_counter() - idle_since >= idle_timeout:
+                    break
+                continue
+            start = time.perf_counter()
+            try:
+                results = self.handler(tasks)
+            except Exception:
+                logger.exception("handler failed (%s tasks)", len(tasks))
+                stats.record('handler', time.perf_counter() - start, ok=False)
+                results = None
+            else:
+                stats.record('handler', time.perf_counter() - start)
+                stats.add('tasks_processed', len(tasks))
+                stats.add('images_processed', sum(len(task.imglist) for task in tasks))
+            for task, metainfos in zip(tasks, results or []):
+                if metainfos is not None:
+                    self.submitter.submit(task.token, metainfos)
+            processed += len(tasks)
+            idle_since = time.perf_counter()
+            if max_tasks is not None and processed >= max_tasks:
+                break
+        return processed
+
+    def stop(self):
+        """ run()을 끝낸다 (다른 thread나 handler에서 호출) """
+        self._stopping.set()
+
+    def close(self):
+        """ prefetch를 멈추고 buffer의 결과를 모두 보낸다 """
+        self._stopping.set()
+        if self._started:
+            self.prefetcher.stop(timeout=self.prefetcher.wait + 1)
+            self.submitter.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
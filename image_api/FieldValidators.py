@@ -1,4 +1,6 @@
+import json
 from rest_framework import serializers
+from image_api.constants import MAX_BULK_INFO
 
 '''
 
@@ -25,15 +27,22 @@ class MetainfoSerializer(serializers.Serializer):
     id = serializers.CharField(required=True)  # null=True
     #metainfo = serializers.ListField(required=True, allow_empty=False)  # null=True
 
-class MetainfoValidator(serializers.Serializer):
-    #metainfos = serializers.JSONField()
 
-    token = serializers.CharField(required=True)
-    metainfos = serializers.CharField(required=True)
-
-    #metainfos = serializers.ListField(child=MetainfoSerializer())
-
-
-class ImageinfoValidator(serializers.Serializer):
-    ftpid = serializers.IntegerField(required=False, min_value=1) #null=True
-    imglist = serializers.CharField(required=True)
+class BulkInfoValidator(serializers.Serializer):
+    tokens = serializers.CharField(required=True)
+    status_only = serializers.BooleanField(required=False, default=False)
+
+    def validate_tokens(self, value):
+        """ json array 또는 콤마로 구분된 token 목록; 중복은 제거 (순서 유지) """
+        if value.lstrip().startswith('['):
+            try:
+                tokens = json.loads(value)
+            except ValueError:
+                raise serializers.ValidationError('tokens must be a json array or comma separated')
+        else:
+            tokens = [token.strip() for token in value.split(',') if token.strip()]
+        if not tokens or not all(isinstance(token, str) and token for token in tokens):
+            raise serializers.ValidationError('tokens must be a non-empty list of strings')
+        if len(tokens) > MAX_BULK_INFO:
+            raise serializers.ValidationError('tokens must have at most %s items' % MAX_BULK_INFO)
+        return list(dict.fromkeys(tokens))
@@ -0,0 +1,166 @@
+"""업로드 admission control (backpressure)
+
+FTP서버 장애 등으로 task가 배분되지 않는 동안 업로드를 계속 받으면 queue와 이미지 정보가 Redis maxmemory까지 쌓이고,
+그 후에는 결과 조회를 포함한 모든 API가 실패한다. 업로드 API(IF-FACEAI-001, 006)는 저장 전에 ftpid의 Redis node에서
+script(ADMIT_UPLOADS) 한 번으로 아래 제한을 atomic하게 확인하고, 넘으면 저장하지 않고 429와 Retry-After를 리턴한다.
+
+    - ftpid별 이미지 수 token bucket (초당 rate개, 최대 burst개)
+    - ftpid별 배분 대기 task 개수 상한 (max_queue); Retry-After는 queue 길이 변화로 추정한 배분 속도로 계산
+      (배분 속도를 아직 모르면 retry_after, 없으면 token bucket이 다시 차는 시간)
+    - client별 이미지 수 token bucket (client는 REMOTE_ADDR 또는 settings.FACEAI_CLIENT_ID_HEADER;
+      bulk 업로드의 ftpid가 여러 Redis node에 있으면 첫 node에서만 확인한다)
+
+bulk 업로드의 ftpid가 여러 Redis node에 있으면 node별로 차례로 확인하고, 뒤의 node에서 거절되면 앞의 node에서
+차감한 token을 되돌린다(REFUND_UPLOADS). 받지 않은 이미지 때문에 재시도가 두 번 제한되지 않는다.
+
+Redis가 maxmemory에 도달해서 쓰기를 거절하면(OOM) 업로드만 429로 거절하고(memory_rejected) 조회 API는 계속 동작한다.
+제한을 설정하지 않으면(기본값) Redis 왕복 없이 모두 허용한다.
+
+    FACEAI_INGEST_LIMIT = {'rate': 0, 'burst': 0, 'max_queue': 0, 'retry_after': 0}   # 모든 ftpid의 기본값 (0이면 제한 없음)
+    FACEAI_INGEST_LIMITS = {'2': {'rate': 200, 'burst': 1000, 'max_queue': 50000}}   # ftpid별 값
+    FACEAI_CLIENT_INGEST_LIMIT = {'rate': 50, 'burst': 200}
+"""
+import asyncio
+import math
+import time
+from collections import namedtuple
+from django.conf import settings
+from image_api.constants import *
+from image_api.metrics import get_metrics
+from image_api.queues import get_task_queue
+from image_api.scripts import run_script, arun_script, ADMIT_UPLOADS, REFUND_UPLOADS
+from image_api.sharding import get_shard_ring
+from image_api.utils import json_error
+
+try:
+    from redis.exceptions import OutOfMemoryError
+except ImportError:  # redis-py < 4.2 (ResponseError 'OOM ...')
+    OutOfMemoryError = None
+
+# 거절 이유('rate', 'client_rate', 'queue', 'memory')와 다시 시도할 때까지의 시간(초)
+Rejected = namedtuple('Rejected', 'retry_after reason subject')
+
+
+def get_ingest_limit(ftpid):
+    """ ftpid의 {'rate', 'burst', 'max_queue', 'retry_after'} (settings.FACEAI_INGEST_LIMITS, 없으면 FACEAI_INGEST_LIMIT) """
+    limit = dict(INGEST_LIMIT, **getattr(settings, 'FACEAI_INGEST_LIMIT', {}))
+    limit.update(getattr(settings, 'FACEAI_INGEST_LIMITS', {}).get(str(ftpid), {}))
+    return limit
+
+
+def get_client_limit():
+    return dict({'rate': 0, 'burst': 0}, **getattr(settings, 'FACEAI_CLIENT_INGEST_LIMIT', {}))
+
+
+def client_id(request):
+    header = getattr(settings, 'FACEAI_CLIENT_ID_HEADER', None)
+    value = request.META.get(header) if header else None
+    return (value or request.META.get('REMOTE_ADDR') or '').split(',')[0].strip()
+
+
+def _burst(limit):
+    return limit['burst'] or limit['rate']
+
+
+def _default_retry(limit, images):
+    """ 배분 속도를 아직 모를 때 max_queue 거절의 Retry-After (초) """
+    if limit['retry_after'] > 0:
+        return limit['retry_after']
+    if limit['rate'] > 0:
+        return max(1, min(images, _burst(limit))) / limit['rate']
+    return INGEST_DEFAULT_RETRY_AFTER
+
+
+def admission_args(uploads, client):
+    """ ftpid의 Redis node별 ADMIT_UPLOADS ARGV
+
+    Returns: [(shard, args), ...] (제한이 없는 node는 제외)
+    """
+    queue = get_task_queue()
+    client_limit = get_client_limit()
+    client_images = sum(len(imglist) for _, imglist, _ in uploads)
+    check_client = bool(client and client_limit['rate'] > 0)
+
+    totals = {}
+    for ftpid, imglist, _ in uploads:
+        tasks, images = totals.get(ftpid, (0, 0))
+        totals[ftpid] = (tasks + 1, images + len(imglist))
+    ftpids = list(totals)
+
+    shard_args = []
+    for shard, indexes in get_shard_ring().group_ftpids(ftpids):
+        ftpid_args = []
+        for i in indexes:
+            limit = get_ingest_limit(ftpids[i])
+            if limit['rate'] > 0 or limit['max_queue'] > 0:
+                tasks, images = totals[ftpids[i]]
+                ftpid_args.extend([ftpids[i], tasks, images, limit['rate'], _burst(limit), limit['max_queue'],
+                                   _default_retry(limit, images)])
+        client_args = [client, client_images, client_limit['rate'], _burst(client_limit)] if check_client \
+            else ['', 0, 0, 0]
+        if ftpid_args or check_client:
+            shard_args.append((shard, [queue.queue_prefix, TASK_LANE_PREFIX, queue.name, TASK_STREAM_GROUP,
+                                       INGEST_STATE_PREFIX, time.time(), INGEST_STATE_AGE, INGEST_MAX_RETRY_AFTER]
+                               + client_args + ftpid_args))
+            check_client = False
+    return shard_args
+
+
+def _rejected(reply):
+    if not reply:
+        return None
+    retry_ms, reason, subject = reply
+    return Rejected(int(retry_ms) / 1000.0, reason, subject)
+
+
+def memory_rejected(error):
+    """ 업로드 저장 중 Redis 오류가 maxmemory 초과(OOM)이면 Rejected를 리턴하고, 아니면 error를 다시 raise """
+    if not ((OutOfMemoryError is not None and isinstance(error, OutOfMemoryError)) or str(error).startswith('OOM')):
+        raise error
+    get_metrics().record_rejected('memory')
+    return Rejected(INGEST_MAX_RETRY_AFTER, 'memory', '')
+
+
+def admit_uploads(uploads, client=''):
+    """ 업로드를 받을지 확인한다
+
+    Args:
+        uploads: save_uploads의 [(ftpid, imglist, lane), ...]
+        client: client_id(request)
+
+    Returns: 허용하면 None, 거절하면 Rejected
+    """
+    admitted = []
+    for shard, args in admission_args(uploads, client):
+        rejected = _rejected(run_script(shard.conn(), ADMIT_UPLOADS, args=args))
+        if rejected is not None:
+            for admitted_shard, admitted_args in admitted:
+                run_script(admitted_shard.conn(), REFUND_UPLOADS, args=admitted_args)
+            get_metrics().record_rejected(rejected.reason)
+            return rejected
+        admitted.append((shard, args))
+    return None
+
+
+async def aadmit_uploads(uploads, client=''):
+    """ admit_uploads의 asyncio 버전 """
+    admitted = []
+    for shard, args in admission_args(uploads, client):
+        rejected = _rejected(await arun_script(shard.aconn(), ADMIT_UPLOADS, args=args))
+        if rejected is not None:
+            await asyncio.gather(*[arun_script(admitted_shard.aconn(), REFUND_UPLOADS, args=admitted_args)
+                                   for admitted_shard, admitted_args in admitted])
+            get_metrics().record_rejected(rejected.reason)
+            return rejected
+        admitted.append((shard, args))
+    return None
+
+
+def throttled_response(rejected):
+    """ 429 응답 (Retry-After: 초 단위 정수) """
+    retry_after = max(1, int(math.ceil(rejected.retry_after)))
+    response = json_error('Too Many Requests', code=429, data={
+        'reason': rejected.reason, 'subject': rejected.subject, 'retry_after': retry_after})
+    response.status_code = 429
+    response['Retry-After'] = str(retry_after)
+    return response
@@ -0,0 +1,97 @@
+"""image_api의 async view를 직접 실행하는 ASGI application
+
+Django 3.0의 ASGI handler는 view를 thread에서 실행하므로, image_api의 API 경로는 이 application이
+async view를 바로 호출하고 나머지 경로(admin, /metrics 등)는 Django application으로 넘긴다.
+경로와 적용하는 middleware는 wsgi_app.ApiWSGIApplication과 같다: API_ROUTES(/ftp/*, /metainfo*)는 middleware 없이,
+CORS_ROUTES(/info*)는 settings.MIDDLEWARE의 CorsMiddleware만 적용한다.
+settings.FACEAI_ASYNC_API = False 이면 모든 요청을 Django application으로 넘긴다.
+"""
+import io
+import logging
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse
+from django.http.response import HttpResponseBase
+from image_api.metrics import get_metrics
+from image_api.utils import json_error
+from image_api.wsgi_app import API_ROUTES, CORS_ROUTES, cors_middleware
+
+logger = logging.getLogger('api.custom')
+
+
+class AsyncStreamingHttpResponse(HttpResponseBase):
+    """ async generator를 body로 전송하는 streaming response (AsyncApiApplication 전용) """
+    streaming = True
+
+    def __init__(self, streaming_content, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.streaming_content = streaming_content
+
+
+def async_routes():
+    """ Returns: {경로: (async view, CorsMiddleware 적용 여부)} """
+    from image_api import async_views
+    routes = {path: (getattr(async_views, name), False) for path, name in API_ROUTES.items()}
+    routes.update({path: (getattr(async_views, name), True) for path, name in CORS_ROUTES.items()})
+    return routes
+
+
+class AsyncApiApplication:
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.enabled = getattr(settings, 'FACEAI_ASYNC_API', True)
+        self.routes = async_routes() if self.enabled else {}
+        self.cors = cors_middleware()
+
+    async def __call__(self, scope, receive, send):
+        route = self.routes.get(scope.get('path')) if scope['type'] == 'http' else None
+        if route is None:
+            await self.fallback(scope, receive, send)
+        else:
+            view, cors = route
+            await self.handle(view, scope, receive, send, cors and self.cors is not None)
+
+    async def handle(self, view, scope, receive, send, cors=False):
+        body = io.BytesIO()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.write(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+
+        request = ASGIRequest(scope, body)
+        tracker = get_metrics().start_request()
+        try:
+            response = await (self.cors_response(view, request) if cors else view(request))
+        except Exception as e:
+            logger.exception("exception occured: %s", e)
+            response = json_error('Internal Server Error', 500)
+            response.status_code = 500
+        if tracker is not None:
+            tracker.finish(view.__name__, response.status_code)
+
+        headers = [(key.encode('latin1'), value.encode('latin1')) for key, value in response.items()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        if isinstance(response, AsyncStreamingHttpResponse):
+            async for chunk in response.streaming_content:
+                await send({'type': 'http.response.body', 'body': response.make_bytes(chunk), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        elif response.streaming:
+            # json_list_response 등 sync iterator streaming response (encode만 하므로 그대로 순회)
+            for chunk in response.streaming_content:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        else:
+            await send({'type': 'http.response.body', 'body': response.content})
+
+    async def cors_response(self, view, request):
+        """ CorsMiddleware를 적용해서 view를 실행 (Django의 middleware 순서와 같이 preflight 요청은 view를 실행하지 않고
+        CorsMiddleware가 응답한다) """
+        if request.method == 'OPTIONS' and 'HTTP_ACCESS_CONTROL_REQUEST_METHOD' in request.META:
+            return self.cors(lambda request: HttpResponse())(request)
+        response = await view(request)
+        return self.cors(lambda request: response)(request)
@@ -0,0 +1,35 @@
+"""asyncio Redis client
+
+settings.CACHES에 지정된 Redis 설정(LOCATION, PASSWORD, CONNECTION_POOL_KWARGS)을 그대로 사용하여
+asyncio용 connection pool을 만든다. pool은 process(event loop) 안에서 공유한다.
+OPTIONS의 ASYNC_REDIS_CLIENT_CLASS로 client class를 바꿀 수 있다. (django_redis의 REDIS_CLIENT_CLASS에 해당)
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis-py < 4.2
+    aioredis = None
+
+_clients = {}
+
+
+def get_async_redis_connection(alias='default'):
+    """ get_redis_connection의 asyncio 버전 """
+    client = _clients.get(alias)
+    if client is None:
+        if aioredis is None:
+            raise ImproperlyConfigured('async views require redis-py >= 4.2 (redis.asyncio)')
+        cache = settings.CACHES[alias]
+        options = cache.get('OPTIONS', {})
+        pool_kwargs = dict(options.get('CONNECTION_POOL_KWARGS', {}))
+        if options.get('PASSWORD'):
+            pool_kwargs.setdefault('password', options['PASSWORD'])
+        pool = aioredis.ConnectionPool.from_url(cache['LOCATION'], **pool_kwargs)
+        client_class = import_string(options['ASYNC_REDIS_CLIENT_CLASS']) \
+            if options.get('ASYNC_REDIS_CLIENT_CLASS') else aioredis.Redis
+        client = client_class(connection_pool=pool)
+        _clients[alias] = client
+    return client
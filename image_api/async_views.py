@@ -0,0 +1,406 @@
+"""views.py의 asyncio 버전
+
+AsyncApiApplication(image_api.async_app)을 통해 ASGI에서 직접 실행된다. Redis I/O를 기다리는 동안
+thread를 점유하지 않으므로 한 process에서 많은 polling / long-polling 요청을 동시에 처리할 수 있다.
+요청 파라미터와 응답 형식은 views.py와 동일하다.
+"""
+import asyncio
+import logging
+from image_api.utils import *
+from image_api.FieldValidators import BulkInfoValidator
+from image_api.validation import ValidationFailed, validate_upload, validate_uploads, validate_metainfo, \
+    validate_metainfos, validate_limit, validate_seconds, validate_ftpid
+from image_api.constants import *
+from image_api.queues import get_task_queue
+from image_api.sharding import get_shard_ring
+from image_api.stealing import get_steal_sources, asteal_tasks
+from image_api.views import queue_uploads, save_metainfo, queue_metainfos, group_valid_results, \
+    bulk_metainfo_results, queue_bulk_info, fill_bulk_info, bulk_info_response, is_waiting_status, \
+    cached_info_response, queue_get_result, cache_result, cache_metainfos, merge_shard_results, stolen_results, \
+    record_dispatch, task_budget, queue_upload_claims, claimed_uploads, group_metainfo_claims, \
+    queue_metainfo_claims, claimed_metainfos, dead_task_tokens, dead_task_list, requeue_dead_args
+from image_api.scripts import arun_script, REQUEUE_DEAD_TASKS
+from image_api.metrics import get_metrics
+from image_api.result_cache import get_result_cache
+from image_api.async_app import AsyncStreamingHttpResponse
+from image_api.admission import aadmit_uploads, client_id, memory_rejected, throttled_response
+from image_api.idempotency import upload_keys, metainfo_keys, IdempotencyConflict
+from redis.exceptions import ResponseError
+
+logger = logging.getLogger('api.custom')
+
+
+async def create_ftpimginfo(request):
+    """ IF-FACEAI-001 (async) """
+    if request.method == 'POST':
+        try:
+            uploads = [validate_upload(request.POST)]
+            keys = upload_keys(request, uploads)
+        except ValidationFailed as e:
+            return json_error('Data Invalid', code=422, data=e.errors)
+        logger.info("%s token: %s, imgid_list: %s", 'IF-FACEAI-001', uploads[0][0], uploads[0][1])
+
+        try:
+            tokens, rejected = await admit_and_save_uploads(request, uploads, keys)
+        except IdempotencyConflict as e:
+            return json_error('Data Invalid', code=422, data=e.errors)
+        if rejected is not None:
+            return throttled_response(rejected)
+        return json_response({'token': tokens[0]})
+    else:
+        return json_error('HTTP METHOD ERROR', 405)
+
+
+async def create_ftpimginfos(request):
+    """ IF-FACEAI-006 (async) """
+    if request.method == 'POST':
+        try:
+            uploads = validate_uploads(request.POST)
+            keys = upload_keys(request, uploads)
+        except ValidationFailed as e:
+            return json_error('Data Invalid', code=422, data=e.errors)
+        logger.info("%s batches: %s, images: %s", 'IF-FACEAI-006',
+                    len(uploads), sum(len(imglist) for _, imglist, _ in uploads))
+
+        try:
+            tokens, rejected = await admit_and_save_uploads(request, uploads, keys)
+        except IdempotencyConflict as e:
+            return json_error('Data Invalid', code=422, data=e.errors)
+        if rejected is not None:
+            return throttled_response(rejected)
+        return json_response({'tokens': tokens})
+    else:
+        return json_error('HTTP METHOD ERROR', 405)
+
+
+async def task_provider(request):
+    """ IF-FACEAI-002 (async) """
+    try:
+        ftpid = validate_ftpid(request.GET)
+        limit = validate_limit(request.GET, 100, 1000)
+        wait = validate_seconds(request.GET, 'wait', 0.0, MAX_POLL_WAIT)
+        budget = task_budget(request)
+    except ValidationFailed as e:
+        return json_error('Data Invalid', code=422, data=e.errors)
+    consumer = request.GET.get('consumer')
+    steal = request.GET.get('steal', '1') != '0' and bool(get_steal_sources(ftpid))
+
+    conn = get_shard_ring().for_ftpid(ftpid).aconn()
+    queue = get_task_queue()
+    tasklist = await queue.adispatch(conn, ftpid, limit, consumer, 0 if steal else wait, budget)
+    result_list = [{'token': token, 'imglist': imglist} for token, imglist in tasklist]
+    if steal and not result_list:
+        result_list = stolen_results(ftpid, await asteal_tasks(ftpid, limit, consumer, budget))
+        if not result_list and wait > 0:
+            tasklist = await queue.adispatch(conn, ftpid, limit, consumer, wait, budget)
+            result_list = [{'token': token, 'imglist': imglist} for token, imglist in tasklist]
+    record_dispatch(result_list)
+    return json_list_response(result_list)
+
+
+async def get_peddingtasks(request):
+    """ IF-FACEAI-003 (async) """
+    try:
+        limit = validate_limit(request.GET, 100)
+    except ValidationFailed as e:
+        return json_error('Data Invalid', code=422, data=e.errors)
+    shard_results = await asyncio.gather(*[get_task_queue().apending(shard.aconn(), limit)
+                                           for shard in get_shard_ring().shards])
+    pedding_tasks = merge_shard_results(shard_results, lambda task: task[1], limit + 1)
+    pedding_tasks = list(map(lambda task: {'token': task[0], 'createtime': timetamp_formatter(task[1])}, pedding_tasks))
+    return json_list_response(pedding_tasks)
+
+
+async def dead_tasks(request):
+    """ IF-FACEAI-008 (async) """
+    ring = get_shard_ring()
+    if request.method == 'POST':
+        if request.POST.get('all') == '1':
+            try:
+                limit = validate_limit(request.POST, 1000)
+            except ValidationFailed as e:
+                return json_error('Data Invalid', code=422, data=e.errors)
+            requeued = []
+            for shard in ring.shards:
+                conn = shard.aconn()
+                requeued.extend(await requeue_dead_tasks(
+                    conn, await conn.zrange(DEAD_TASK_ZSET, 0, limit - len(requeued) - 1)))
+                if len(requeued) >= limit:
+                    break
+        else:
+            try:
+                tokens = dead_task_tokens(request.POST)
+            except ValidationFailed as e:
+                return json_error('Data Invalid', code=422, data=e.errors)
+            shard_requeued = await asyncio.gather(*[requeue_dead_tasks(shard.aconn(), [tokens[i] for i in indexes])
+                                                    for shard, indexes in ring.group_tokens(tokens)])
+            requeued = [token for tokens in shard_requeued for token in tokens]
+        logger.info("%s requeued: %s", 'IF-FACEAI-008', len(requeued))
+        return json_response({'requeued': requeued})
+
+    try:
+        limit = validate_limit(request.GET, 100)
+    except ValidationFailed as e:
+        return json_error('Data Invalid', code=422, data=e.errors)
+
+    async def fetch(shard):
+        conn = shard.aconn()
+        dead = await conn.zrange(DEAD_TASK_ZSET, 0, limit - 1, withscores=True)
+        pipline = conn.pipeline(False)
+        for token, _ in dead:
+            pipline.hmget(TASK_INFO_PREFIX + token, 'ftpid', 'attempts')
+        return [(token, deadtime, ftpid, attempts)
+                for (token, deadtime), (ftpid, attempts) in zip(dead, await pipline.execute())]
+
+    shard_results = await asyncio.gather(*[fetch(shard) for shard in ring.shards])
+    return json_response(dead_task_list(shard_results, limit))
+
+
+async def metainfo(request):
+    """ IF-FACEAI-004 (async) """
+    try:
+        results = [(validate_metainfo(request.POST), None)]
+        keys = metainfo_keys(request, results)
+    except ValidationFailed as e:
+        logger.error("Data Invalid [detail_info]: %s", e.errors)
+        return json_error('Data Invalid', code=422, data=e.errors)
+
+    token, metainfos = results[0][0]['token'], results[0][0]['metainfos']
+    logger.info("%s token: %s", 'IF-FACEAI-004', token)
+
+    duplicates, conflicts, claims = await claim_metainfos(results, keys)
+    if conflicts:
+        return json_error('Data Invalid', code=422, data=IdempotencyConflict().errors)
+    if duplicates:
+        get_metrics().record_replay('metainfo', 1)
+        return json_response({})
+    conn = get_shard_ring().for_token(token).aconn()
+    pipline = conn.pipeline(False)
+    save_metainfo(pipline, token, metainfos)
+    get_result_cache().publish_invalidation(pipline, [token])
+    try:
+        await pipline.execute()
+    except Exception:
+        await release_claims(claims)
+        raise
+    cache_metainfos([(token, metainfos)])
+    await get_task_queue().aack(conn, [token])
+    get_metrics().record_status(STATUS.COMPLETE, 1)
+    return json_response({})
+
+
+async def metainfo_bulk(request):
+    """ IF-FACEAI-009 (async) """
+    if request.method == 'POST':
+        try:
+            results = validate_metainfos(request.POST)
+            keys = metainfo_keys(request, results)
+        except ValidationFailed as e:
+            return json_error('Data Invalid', code=422, data=e.errors)
+
+        duplicates, conflicts, claims = await claim_metainfos(results, keys)
+        new_results = [result for i, result in enumerate(results) if i not in duplicates and i not in conflicts]
+        try:
+            shard_tokens = await asyncio.gather(*[save_shard_metainfos(shard.aconn(), shard_results)
+                                                  for shard, shard_results in group_valid_results(new_results)])
+        except Exception:
+            await release_claims(claims)
+            raise
+        tokens = [token for tokens in shard_tokens for token in tokens]
+        cache_metainfos([(item['token'], item['metainfos']) for item, errors in new_results if errors is None])
+        get_metrics().record_status(STATUS.COMPLETE, len(tokens))
+        get_metrics().record_replay('metainfo', len(duplicates))
+        logger.info("%s results: %s, saved: %s, duplicate: %s", 'IF-FACEAI-009', len(results), len(tokens),
+                    len(duplicates))
+        return json_response({'saved': len(tokens),
+                              'results': bulk_metainfo_results(results, duplicates, conflicts)})
+    else:
+        return json_error('HTTP METHOD ERROR', 405)
+
+
+async def info(request):
+    """ IF-FACEAI-005 (async) """
+    token = request.GET['token']
+    try:
+        wait = validate_seconds(request.GET, 'wait', 0.0, MAX_INFO_WAIT)
+    except ValidationFailed as e:
+        return json_error('Data Invalid', code=422, data=e.errors)
+    response = cached_info_response(token)
+    if response is not None:
+        return response
+    conn = get_shard_ring().for_token(token).aconn()
+    status = await get_status(conn, token)
+    if wait > 0 and is_waiting_status(status):
+        status = await wait_status_event(conn, token, wait) or status
+    logger.info("%s token: %s, status: %s", 'IF-FACEAI-005', token, status)
+
+    return await info_response(conn, token, status)
+
+
+async def info_bulk(request):
+    """ IF-FACEAI-010 (async) """
+    valid_ser = BulkInfoValidator(data=request.POST if request.method == 'POST' else request.GET)
+    if not valid_ser.is_valid():
+        return json_error('Data Invalid', code=422, data=valid_ser.errors)
+
+    tokens = valid_ser.validated_data['tokens']
+    status_only = valid_ser.validated_data['status_only']
+    logger.info("%s tokens: %s, status_only: %s", 'IF-FACEAI-010', len(tokens), status_only)
+
+    statuses, metainfos = [None] * len(tokens), [None] * len(tokens)
+
+    async def fetch(shard, indexes):
+        pipline = shard.araw_conn().pipeline(False)
+        queue_bulk_info(pipline, [tokens[i] for i in indexes], status_only)
+        fill_bulk_info(statuses, metainfos, indexes, await pipline.execute(), status_only)
+
+    await asyncio.gather(*[fetch(shard, indexes) for shard, indexes in get_shard_ring().group_tokens(tokens)])
+    return bulk_info_response(tokens, statuses, metainfos, status_only)
+
+
+async def info_events(request):
+    """ IF-FACEAI-007 (async) """
+    token = request.GET['token']
+    try:
+        wait = validate_seconds(request.GET, 'wait', SSE_MAX_DURATION, SSE_MAX_DURATION)
+    except ValidationFailed as e:
+        return json_error('Data Invalid', code=422, data=e.errors)
+    response = AsyncStreamingHttpResponse(status_event_stream(token, wait), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+async def get_status(conn, token):
+    status = await conn.hget(TASK_INFO_PREFIX + token, 'status')
+    if status is None:
+        return STATUS.EMPTY.value
+    return status
+
+
+async def info_response(conn, token, status):
+    if str(STATUS.COMPLETE.value) != status:
+        return json_response([], status=status)
+    else:
+        generation = get_result_cache().generation()
+        pipline = get_shard_ring().for_token(token).araw_conn().pipeline(False)
+        queue_get_result(pipline, token)
+        return json_raw_response(cache_result(token, generation, *await pipline.execute()), status=status)
+
+
+async def wait_status_event(conn, token, timeout):
+    """ views.wait_status_event의 asyncio 버전 """
+    found = await conn.xread({META_EVENT_PREFIX + token: '0'}, count=1, block=max(1, int(timeout * 1000)))
+    if not found:
+        return None
+    return found[0][1][-1][1]['status']
+
+
+async def status_event_stream(token, wait):
+    conn = get_shard_ring().for_token(token).aconn()
+    deadline = time.time() + wait
+    status = await get_status(conn, token)
+    while is_waiting_status(status):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        yield ': keepalive\n\n'
+        status = await wait_status_event(conn, token, min(SSE_HEARTBEAT, remaining)) or status
+    response = await info_response(conn, token, status)
+    yield sse_event('status', response.content.decode())
+
+
+async def save_uploads(uploads, keys=None):
+    """ views.save_uploads의 asyncio 버전 (Redis node별로 동시에 저장) """
+    tokens = [None] * len(uploads)
+    created = []
+
+    async def save(shard, indexes):
+        conn = shard.aconn()
+        shard_uploads = [uploads[i] for i in indexes]
+        shard_keys = [keys[i] for i in indexes] if keys else None
+        count = sum(len(imglist) for _, imglist, _ in shard_uploads)
+        shard_tokens = new_tokens = None
+        new = list(range(len(shard_uploads)))
+        if shard_keys:
+            pipline = conn.pipeline(False)
+            new_tokens = queue_upload_claims(pipline, shard_uploads, shard_keys)
+            try:
+                shard_tokens, new, imgids = claimed_uploads(shard, shard_uploads, shard_keys, new_tokens,
+                                                            await pipline.execute())
+            except IdempotencyConflict as e:
+                if e.created_keys:
+                    await conn.delete(*e.created_keys)
+                raise
+        elif count > 0:
+            imgids = shard.image_ids(await conn.incrby(FTP_IMAGE_PREFIX, count), count)
+        else:
+            imgids = []
+        if new:
+            pipline = conn.pipeline(False)
+            new_tokens = queue_uploads(pipline, [shard_uploads[j] for j in new], imgids,
+                                       new_tokens and [new_tokens[j] for j in new])
+            try:
+                await pipline.execute()
+            except Exception:
+                if shard_keys:
+                    await conn.delete(*[shard_keys[j] for j in new])
+                raise
+        for i, token in zip(indexes, shard_tokens or new_tokens):
+            tokens[i] = token
+        created.append(len(new))
+
+    await asyncio.gather(*[save(shard, indexes)
+                           for shard, indexes in get_shard_ring().group_ftpids([upload[0] for upload in uploads])])
+    get_metrics().record_status(STATUS.CREATE, sum(created))
+    get_metrics().record_replay('upload', len(tokens) - sum(created))
+    return tokens
+
+
+async def admit_and_save_uploads(request, uploads, keys=None):
+    """ views.admit_and_save_uploads의 asyncio 버전 """
+    try:
+        rejected = await aadmit_uploads(uploads, client_id(request))
+        if rejected is not None:
+            return None, rejected
+        return await save_uploads(uploads, keys), None
+    except ResponseError as e:
+        return None, memory_rejected(e)
+
+
+async def claim_metainfos(results, keys):
+    """ views.claim_metainfos의 asyncio 버전 (Redis node별로 동시에 등록) """
+    async def claim(shard, shard_keys):
+        pipline = shard.aconn().pipeline(False)
+        queue_metainfo_claims(pipline, results, shard_keys)
+        return shard, claimed_metainfos(results, shard_keys, await pipline.execute())
+
+    shard_claims = await asyncio.gather(*[claim(shard, shard_keys)
+                                          for shard, shard_keys in group_metainfo_claims(results, keys)])
+    duplicates = set(i for _, (shard_duplicates, _, _) in shard_claims for i in shard_duplicates)
+    conflicts = set(i for _, (_, shard_conflicts, _) in shard_claims for i in shard_conflicts)
+    return duplicates, conflicts, [(shard, new_keys) for shard, (_, _, new_keys) in shard_claims]
+
+
+async def requeue_dead_tasks(conn, tokens):
+    """ views.requeue_dead_tasks의 asyncio 버전 """
+    if not tokens:
+        return []
+    requeued = await arun_script(conn, REQUEUE_DEAD_TASKS, keys=[DEAD_TASK_ZSET], args=requeue_dead_args(tokens))
+    get_metrics().record_status(STATUS.CREATE, len(requeued))
+    return requeued
+
+
+async def release_claims(claims):
+    """ views.release_claims의 asyncio 버전 """
+    for shard, keys in claims:
+        if keys:
+            await shard.aconn().delete(*keys)
+
+
+async def save_shard_metainfos(conn, results):
+    """ Redis node 하나에 속한 item의 meta 정보를 저장하고 ack한다. Returns: 저장한 token 리스트 """
+    pipline = conn.pipeline(False)
+    tokens = queue_metainfos(pipline, results)
+    await pipline.execute()
+    await get_task_queue().aack(conn, tokens)
+    return tokens
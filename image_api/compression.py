@@ -0,0 +1,67 @@
+"""metainfo 저장 형식
+
+metainfo는 저장할 때 한 번만 JSON으로 정규화하고, 크기가 FACEAI_METAINFO_COMPRESS_MIN 이상이면 압축해서 저장한다.
+info 조회 시에는 저장된 JSON bytes를 parse하지 않고 응답 envelope에 그대로 넣는다.
+
+저장 값의 첫 byte로 형식을 구분한다.
+    - METAINFO_PLAIN: 정규화된 JSON
+    - METAINFO_ZLIB: zlib으로 압축된 JSON
+    - METAINFO_ZSTD: zstd로 압축된 JSON (zstandard 패키지 필요)
+    - 그 외: 이전 버전이 저장한 원본 문자열 (조회 시 정규화)
+"""
+import json
+import zlib
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+METAINFO_PLAIN = b'\x00'
+METAINFO_ZLIB = b'\x01'
+METAINFO_ZSTD = b'\x02'
+
+
+def normalize_metainfo(metainfos):
+    """ client가 보낸 metainfos 문자열을 정규화된 JSON 문자열로 변환 (json.loads 실패 시 ValueError)
+
+    이전 client가 보내는 작은따옴표 형식(python repr)도 받는다.
+    """
+    try:
+        value = json.loads(metainfos)
+    except ValueError:
+        value = json.loads(metainfos.replace("\'", "\""))
+    # JsonResponse와 같은 형식으로 encode해서 응답에 그대로 사용
+    return json.dumps(value)
+
+
+def _zstd_required():
+    if zstandard is None:
+        raise ImproperlyConfigured("FACEAI_METAINFO_CODEC = 'zstd' requires the zstandard package")
+
+
+def encode_metainfo(metainfo):
+    """ 정규화된 JSON 문자열을 저장 형식(bytes)으로 변환 """
+    data = metainfo.encode('utf-8')
+    if len(data) < getattr(settings, 'FACEAI_METAINFO_COMPRESS_MIN', 1024):
+        return METAINFO_PLAIN + data
+    codec = getattr(settings, 'FACEAI_METAINFO_CODEC', 'zlib')
+    if codec == 'zstd':
+        _zstd_required()
+        return METAINFO_ZSTD + zstandard.ZstdCompressor().compress(data)
+    return METAINFO_ZLIB + zlib.compress(data)
+
+
+def decode_metainfo(stored):
+    """ 저장된 값(bytes)을 JSON bytes로 변환 """
+    marker, data = stored[:1], stored[1:]
+    if marker == METAINFO_PLAIN:
+        return data
+    if marker == METAINFO_ZLIB:
+        return zlib.decompress(data)
+    if marker == METAINFO_ZSTD:
+        _zstd_required()
+        return zstandard.ZstdDecompressor().decompress(data)
+    return normalize_metainfo(stored.decode('utf-8')).encode('utf-8')
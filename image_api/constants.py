@@ -0,0 +1,118 @@
+from enum import Enum
+
+#Redis에 Metainfo를 저장하는 Key의 prefix
+META_RESULT_PREFIX = 'm_'
+#Redis에 token별 처리 완료 event(Stream)를 저장하는 Key의 prefix
+META_EVENT_PREFIX = 'meta_event:'
+#Redis에 이미지 정보를 저장하는 Key의 prefix
+FTP_IMAGE_PREFIX = 'ftp_img:'
+#Redis에 순서대로 Task정보를 저장하는 queue
+TASK_QUEUE_PREFIX = 'task_queue'
+#Redis에 처리중인 Task정보를 저장하는 queue
+PEDDING_TASK_ZSET = 'pedding_task_zset'
+#Redis에 재시도 횟수를 넘긴 Task를 저장하는 dead letter queue (score=이동 시간)
+DEAD_TASK_ZSET = 'dead_task_zset'
+#Redis에 Task정보를 저장하는 Key의 Prefix
+TASK_INFO_PREFIX = 'taskinfo:'
+#업로드 admission control의 ftpid/client별 token bucket, queue 길이 상태 (Hash)의 prefix
+INGEST_STATE_PREFIX = 'ingest:'
+#업로드/metainfo 멱등성 key (Idempotency-Key 또는 내용 hash -> 처음 요청의 token)의 prefix
+IDEMPOTENCY_PREFIX = 'idempotency:'
+#result cache 무효화 message를 보내는 pub/sub channel
+RESULT_CACHE_CHANNEL = 'result_cache:invalidate'
+#pending task reaper의 leader lease key
+REAPER_LEASE_KEY = 'reaper:leader'
+#pending task reaper의 처리 통계 (Hash)
+REAPER_STATS_KEY = 'reaper:stats'
+#metrics: 모든 process의 counter/histogram 합계 (Hash, field=Prometheus series)
+METRICS_KEY = 'metrics'
+#Redis Stream backend: ftpid(lane)별 task stream의 prefix
+TASK_STREAM_PREFIX = 'task_stream'
+#Redis Stream backend: task stream이 존재하는 queue 이름(ftpid 또는 'ftpid|priority|tenant') 목록 (Set)
+TASK_STREAM_SET = 'task_streams'
+#Redis Stream backend: consumer group 이름
+TASK_STREAM_GROUP = 'faceai'
+#ftpid별 priority/tenant lane 목록 (Zset, score=마지막으로 task를 추가한 시간)
+TASK_LANE_PREFIX = 'task_lanes:'
+#ftpid별 lane 선택 상태 (Hash, weighted round robin 값과 마지막 배분 시간)
+TASK_LANE_STATE_PREFIX = 'task_lane_state:'
+
+#binary 값(압축된 metainfo)을 decode 없이 읽는 Redis connection의 CACHES alias
+RAW_REDIS_ALIAS = 'raw'
+
+#metainfo/bulk 한 번에 받을 수 있는 최대 결과 개수
+MAX_BULK_RESULTS = 1000
+#info/bulk 한 번에 조회할 수 있는 최대 token 개수
+MAX_BULK_INFO = 1000
+
+#sharding: node당 consistent hashing virtual node 개수
+SHARD_VNODES = 160
+#sharding: node별 이미지 id 범위 (id = node index * SHARD_ID_SPAN + node의 counter)
+SHARD_ID_SPAN = 2 ** 40
+
+#task_provider의 long-poll(wait) 최대 대기 시간 (초)
+MAX_POLL_WAIT = 30
+#task_provider가 첫 task를 꺼낸 후 max_images/limit이 찰 때까지 더 기다리는(linger) 최대 시간 (초)
+MAX_DISPATCH_LINGER = 1
+
+#lane 이름('priority|tenant')과 queue 이름('ftpid|priority|tenant')의 구분자 (Lua script와 같은 값)
+LANE_SEPARATOR = '|'
+#priority를 지정하지 않은 task의 priority (tenant도 없으면 기존 ftpid queue를 그대로 사용)
+DEFAULT_PRIORITY = 'normal'
+#priority별 배분 weight 기본값 (settings.FACEAI_LANE_WEIGHTS), 0이면 다른 lane이 비었을 때만 배분
+LANE_WEIGHTS = {'high': 8, 'normal': 4, 'low': 1}
+#이 시간(초) 이상 배분되지 않은 lane은 weight와 관계없이 먼저 배분 (settings.FACEAI_LANE_MAX_WAIT)
+LANE_MAX_WAIT = 30
+#lane을 사용하는 ftpid의 long-poll 확인 주기 (초)
+LANE_POLL_INTERVAL = 0.1
+
+#work stealing: 대기 task가 이 개수 이상인 queue에서만 가져간다 (settings.FACEAI_STEAL_MIN_BACKLOG)
+STEAL_MIN_BACKLOG = 10
+
+#metrics: queue 길이를 보여줄 ftpid 목록을 다시 찾는 주기 (초, list backend는 SCAN 사용)
+METRICS_DISCOVERY_INTERVAL = 60 * 5
+
+#업로드 admission control 기본값 (settings.FACEAI_INGEST_LIMIT); rate: 초당 이미지 수, burst: 한 번에 받을 수 있는
+#이미지 수 (0이면 rate), max_queue: 배분 대기 task 개수 상한 (0이면 제한 없음),
+#retry_after: 배분 속도를 아직 모를 때 max_queue 거절의 Retry-After (초, 0이면 rate로 업로드 이미지 수만큼 token이
+#다시 차는 시간, rate도 없으면 INGEST_DEFAULT_RETRY_AFTER)
+INGEST_LIMIT = {'rate': 0, 'burst': 0, 'max_queue': 0, 'retry_after': 0}
+INGEST_DEFAULT_RETRY_AFTER = 5
+#admission control 상태 key 보관 시간 (초)
+INGEST_STATE_AGE = 60 * 60
+#업로드를 거절할 때 알려주는 Retry-After의 최대값 (초)
+INGEST_MAX_RETRY_AFTER = 60 * 5
+#멱등성 key 보관 시간 (초, settings.FACEAI_IDEMPOTENCY_TTL); 이 시간 안의 재시도는 처음 요청의 결과를 돌려준다
+IDEMPOTENCY_AGE = 60 * 60
+
+#info의 long-poll(wait) 최대 대기 시간 (초)
+MAX_INFO_WAIT = 60
+#info/events(SSE) connection 최대 유지 시간 (초)
+SSE_MAX_DURATION = 60 * 5
+#info/events(SSE) keepalive 전송 주기 (초)
+SSE_HEARTBEAT = 15
+
+#해당 시간내에 task를 처리 못하면 다시 queue에 넣는다 (ftpid별 값은 settings.FACEAI_VISIBILITY_TIMEOUT)
+PEDDING_TASK_AGE = 60 * 20 #20분
+#task 최대 시도 횟수 기본값; 넘으면 dead letter queue로 이동 (settings.FACEAI_MAX_TASK_ATTEMPTS)
+MAX_TASK_ATTEMPTS = 3
+# TASK정보 보유 기간
+TASK_INFO_AGE = 60 * 60 * 24 # 24 Hours
+# 이미지 정보 보유 기간
+IMG_INFO_AGE = 60 * 60 * 24 # 24 Hours
+# 메타 정보 보유 기간
+META_RESULT_AGE = 60 * 60 * 24 # 24 Hours
+
+class STATUS(Enum):
+    """ Task 처리 상태
+    CREATE: 생성됨
+    PENDDING: 처리 중
+    COMPLETE: 완성
+    ABORT: 장기간 동안 처리를 못하여 강제로 작업을 종료됨
+    EMPTY: 해당 task정보 없음
+    """
+    CREATE = 0
+    PENDDING = 1
+    COMPLETE = 2
+    ABORT = 3
+    EMPTY = 4
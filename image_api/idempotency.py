@@ -0,0 +1,129 @@
+"""업로드/metainfo 요청의 멱등성 (client 재시도 시 중복 처리 방지)
+
+단말기는 timeout이 나면 /ftp/imginfo/를 다시 호출하고, 그때마다 새 token과 이미지 id로 queue에 다시 들어가서
+같은 이미지를 여러 번 분석하게 된다. 요청에 Idempotency-Key header가 있으면 (또는 settings.FACEAI_IDEMPOTENCY_CONTENT_HASH
+이면 imglist/metainfos 내용의 hash로) 멱등성 key를 만들고, 저장 전에 같은 Redis node에 SET NX로 key -> token을
+atomic하게 등록한다. 이미 등록된 key이면 저장하지 않는다.
+
+    - 업로드(IF-FACEAI-001, 006): 처음 요청의 token을 그대로 리턴 (queue에 다시 넣지 않음)
+    - metainfo(IF-FACEAI-004, 009): 저장, ack 없이 성공 (no-op)
+
+key는 FACEAI_IDEMPOTENCY_TTL초 후 삭제된다. bulk API의 header key는 batch/item 순서를 붙여 item별로 사용한다.
+저장이 실패하면 key를 삭제해서 다음 재시도가 다시 저장하게 한다.
+
+key에는 token과 함께 요청 내용의 hash(content_digest)를 저장한다. 같은 key로 내용이 다른 요청을 보내면
+(client가 key를 잘못 재사용) 처음 요청의 결과를 돌려주지 않고 IdempotencyConflict(422)로 거절한다.
+"""
+import hashlib
+import json
+from django.conf import settings
+from image_api.constants import *
+from image_api.validation import ValidationFailed
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+CONFLICT_MESSAGE = 'Idempotency-Key was already used for a request with different content.'
+
+
+class IdempotencyConflict(ValidationFailed):
+    """ 이미 등록된 멱등성 key로 내용이 다른 요청을 보냄
+
+    created_keys: 같은 pipeline에서 새로 등록했지만 저장하지 않는 key (삭제해야 다음 요청이 다시 등록할 수 있음)
+    """
+
+    def __init__(self, created_keys=()):
+        super().__init__({'Idempotency-Key': [CONFLICT_MESSAGE]})
+        self.created_keys = list(created_keys)
+
+
+def get_idempotency_ttl():
+    return getattr(settings, 'FACEAI_IDEMPOTENCY_TTL', IDEMPOTENCY_AGE)
+
+
+def request_key(request):
+    """ Idempotency-Key header (없으면 None) """
+    key = request.META.get(IDEMPOTENCY_HEADER, '').strip()
+    if len(key) > MAX_KEY_LENGTH:
+        raise ValidationFailed({'Idempotency-Key': ['Ensure this field has no more than %s characters.'
+                                                    % MAX_KEY_LENGTH]})
+    return key or None
+
+
+def content_digest(value):
+    """ imglist/metainfos 내용의 hash (dict key 순서와 공백에 관계없이 같은 값) """
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, separators=(',', ':'))
+    return 'sha1:' + hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+
+def _item_keys(request, contents, prefix):
+    """ contents: [(scope, 내용), ...] (검증에 실패한 item은 None)
+
+    Returns: contents 순서대로 Redis key 리스트 (멱등성 처리를 하지 않으면 None)
+    """
+    key = request_key(request)
+    content_hash = getattr(settings, 'FACEAI_IDEMPOTENCY_CONTENT_HASH', False)
+    if key is None and not content_hash:
+        return None
+    keys = []
+    for i, content in enumerate(contents):
+        if content is None:
+            keys.append(None)
+            continue
+        scope, value = content
+        item_key = '%s:%s' % (key, i) if key is not None else content_digest(value)
+        keys.append('%s%s:%s:%s' % (IDEMPOTENCY_PREFIX, prefix, scope, item_key))
+    return keys
+
+
+def upload_keys(request, uploads):
+    """ save_uploads의 uploads([(ftpid, imglist, lane), ...])별 멱등성 key (key는 ftpid별) """
+    return _item_keys(request, [(ftpid, [lane, imglist]) for ftpid, imglist, lane in uploads], 'upload')
+
+
+def upload_digests(uploads):
+    """ uploads별 내용 hash (멱등성 key와 함께 저장) """
+    return [content_digest([lane, imglist]) for _, imglist, lane in uploads]
+
+
+def metainfo_keys(request, results):
+    """ validate_metainfos의 [(item, errors), ...]별 멱등성 key (key는 token별) """
+    return _item_keys(request, [(item['token'], item['metainfos']) if errors is None else None
+                                for item, errors in results], 'meta')
+
+
+def metainfo_digests(items):
+    """ 검증을 통과한 metainfo item별 내용 hash (멱등성 key와 함께 저장) """
+    return [content_digest(item['metainfos']) for item in items]
+
+
+def queue_claims(pipline, keys, values, digests):
+    """ key마다 SET NX('digest value'), GET 명령을 pipeline에 추가 (sync/async pipeline 공용, key가 None이면 생략) """
+    ttl = get_idempotency_ttl()
+    for key, value, digest in zip(keys, values, digests):
+        if key is not None:
+            pipline.set(key, '%s %s' % (digest, value), nx=True, ex=ttl)
+            pipline.get(key)
+
+
+def claimed(keys, values, digests, replies):
+    """ queue_claims의 pipeline 결과 (replies: queue_claims 이후에 추가한 명령의 결과가 뒤에 있어도 됨)
+
+    Returns: keys 순서대로 [(처음 요청이면 True, 처음 요청의 value, 처음 요청과 내용이 다르면 True), ...]
+             (key가 None이면 (True, value, False))
+    """
+    results = []
+    offset = 0
+    for key, value, digest in zip(keys, values, digests):
+        if key is None:
+            results.append((True, value, False))
+            continue
+        created, current = replies[offset: offset + 2]
+        offset += 2
+        if created or current is None:
+            results.append((bool(created), value, False))
+            continue
+        # 내용 hash 없이 token만 저장된 key(이전 version)는 내용을 비교하지 않는다
+        current_digest, _, current_value = current.rpartition(' ')
+        results.append((False, current_value, bool(current_digest) and current_digest != digest))
+    return results
@@ -0,0 +1,38 @@
+import json
+from django.core.management.base import BaseCommand
+from image_api.constants import REAPER_STATS_KEY
+from image_api.reaper import PendingTaskReaper
+from image_api.sharding import get_shard_ring
+
+
+class Command(BaseCommand):
+    help = '처리 기한이 지난 pending task를 재시도/dead letter 처리 (Redis lease로 leader 하나만 동작)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='batch당 처리할 task 개수')
+        parser.add_argument('--interval', type=float, default=10, help='정리 주기 (초)')
+        parser.add_argument('--lease-ttl', type=float, default=30, help='leader lease 유지 시간 (초)')
+        parser.add_argument('--once', action='store_true', help='한 번만 정리하고 종료')
+        parser.add_argument('--stats', action='store_true', help='reaper 처리 통계를 출력하고 종료')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            stats = get_shard_ring().control.conn().hgetall(REAPER_STATS_KEY)
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+
+        reaper = PendingTaskReaper(batch_size=options['batch_size'], interval=options['interval'],
+                                   lease_ttl=max(options['lease_ttl'], options['interval'] * 2))
+        if options['once']:
+            result = reaper.run_once()
+            if result is None:
+                self.stdout.write('another reaper holds the lease')
+            else:
+                self.stdout.write('reaped: %s, requeued: %s, dead: %s' % result)
+                reaper.release_lease(get_shard_ring().control.conn())
+            return
+        try:
+            reaper.run_forever()
+        except KeyboardInterrupt:
+            # manage.py serve가 종료/reload 시 SIGINT를 보낸다 (lease는 run_forever에서 반납)
+            pass
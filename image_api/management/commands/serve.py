@@ -0,0 +1,42 @@
+import json
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from image_api.server import get_server_config, run
+
+
+class Command(BaseCommand):
+    help = '운영 server 실행 (gunicorn worker process 여러 개 + reaper 하나, 기본값은 settings.FACEAI_SERVER)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', help='listen 주소 (host:port, 여러 개는 ,로 구분)')
+        parser.add_argument('--asgi', dest='interface', action='store_const', const='asgi',
+                            help='ASGI application을 uvicorn worker로 실행 (기본값: wsgi, gthread worker)')
+        parser.add_argument('--wsgi', dest='interface', action='store_const', const='wsgi')
+        parser.add_argument('--workers', type=int, help='worker process 수 (0이면 CPU 수)')
+        parser.add_argument('--threads', type=int, help='wsgi worker당 thread 수')
+        parser.add_argument('--keepalive', type=int, help='idle keep-alive connection 유지 시간 (초)')
+        parser.add_argument('--max-requests', type=int, help='worker를 교체할 요청 수 (0이면 교체하지 않음)')
+        parser.add_argument('--max-requests-jitter', type=int)
+        parser.add_argument('--timeout', type=int, help='응답 없는 worker를 다시 띄우는 시간 (초)')
+        parser.add_argument('--graceful-timeout', type=int, help='종료/reload 시 처리 중인 요청을 기다리는 시간 (초)')
+        parser.add_argument('--no-preload', dest='preload', action='store_const', const=False,
+                            help='worker마다 application을 import (HUP으로 새 code를 읽는다)')
+        parser.add_argument('--no-reaper', dest='reaper', action='store_const', const=False,
+                            help='reaper를 띄우지 않음 (manage.py reaper를 따로 실행할 때)')
+        parser.add_argument('--pidfile')
+        parser.add_argument('--print-config', action='store_true', help='설정을 출력하고 종료')
+
+    def handle(self, *args, **options):
+        config = get_server_config(**{key: options[key] for key in (
+            'bind', 'interface', 'workers', 'threads', 'keepalive', 'max_requests', 'max_requests_jitter',
+            'timeout', 'graceful_timeout', 'preload', 'reaper', 'pidfile')})
+        if options['print_config']:
+            self.stdout.write(json.dumps(config, indent=2))
+            return
+        if settings.DEBUG:
+            self.stderr.write('warning: DEBUG = True; use --settings=faceai_central.settings_production')
+        try:
+            run(config)
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
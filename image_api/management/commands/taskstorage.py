@@ -0,0 +1,135 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from image_api.constants import *
+from image_api.scripts import run_script, PACK_TASKS
+from image_api.sharding import get_shard_ring
+from image_api.views import alloc_imgids, create_token, save_imginfos, save_taskinfo, save_packed_taskinfo
+
+
+class Command(BaseCommand):
+    help = 'task 저장 형식(hash/packed)별 task당 Redis 메모리 사용량 조회, hash 형식 task를 packed 형식으로 변환'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=int, default=1000, help='메모리 사용량을 측정할 task 개수')
+        parser.add_argument('--migrate', action='store_true', help='hash 형식 task를 모두 packed 형식으로 변환')
+        parser.add_argument('--batch-size', type=int, default=500, help='변환 script 한 번에 처리할 task 개수')
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='실제 데이터 대신 N개의 임시 task를 두 형식으로 저장해서 측정 후 삭제')
+        parser.add_argument('--images', type=int, default=10, help='--synthetic task당 이미지 개수')
+
+    def handle(self, *args, **options):
+        ring = get_shard_ring()
+        if options['synthetic']:
+            shard = ring.for_ftpid('1')
+            self.write_report('synthetic', self.synthetic_report(shard, options['synthetic'], options['images']))
+            return
+
+        self.write_report('before', self.report(ring.shards, options['sample']))
+        if options['migrate']:
+            start = time.time()
+            migrated = skipped = 0
+            for shard in ring.shards:
+                shard_migrated, shard_skipped = self.migrate(shard.conn(), options['batch_size'])
+                migrated, skipped = migrated + shard_migrated, skipped + shard_skipped
+            self.stdout.write('migrated: %s, skipped: %s, %.3fs' % (migrated, skipped, time.time() - start))
+            self.write_report('after', self.report(ring.shards, options['sample']))
+
+    def write_report(self, label, report):
+        self.stdout.write(json.dumps({label: report}, indent=2))
+
+    def scan_tasks(self, conn, count):
+        for task_key in conn.scan_iter(match=TASK_INFO_PREFIX + '*', count=count):
+            yield task_key
+
+    def task_usage(self, conn, task_keys):
+        """ Returns: [(형식, 이미지 개수, task와 이미지 key의 메모리 합계(bytes)), ...] """
+        pipline = conn.pipeline(False)
+        for task_key in task_keys:
+            pipline.hmget(task_key, 'imgstr', 'imgs')
+        tasks = pipline.execute()
+
+        pipline = conn.pipeline(False)
+        for task_key, (imgstr, imgs) in zip(task_keys, tasks):
+            pipline.memory_usage(task_key, samples=0)
+            for img_id in (imgstr or '').split('#') if imgs is None else []:
+                if img_id:
+                    pipline.memory_usage(FTP_IMAGE_PREFIX + img_id, samples=0)
+        usages = iter(pipline.execute())
+
+        result = []
+        for imgstr, imgs in tasks:
+            if imgs is not None:
+                result.append(('packed', imgs.count('\0') if imgs else 0, next(usages) or 0))
+            else:
+                img_ids = [img_id for img_id in (imgstr or '').split('#') if img_id]
+                result.append(('hash', len(img_ids), sum(next(usages) or 0 for _ in range(len(img_ids) + 1))))
+        return result
+
+    def summarize(self, usages):
+        report = {}
+        for storage in ('hash', 'packed'):
+            rows = [row for row in usages if row[0] == storage]
+            if not rows:
+                continue
+            images = sum(row[1] for row in rows)
+            total = sum(row[2] for row in rows)
+            report[storage] = {
+                'tasks': len(rows),
+                'images_per_task': round(images / len(rows), 1),
+                'bytes_per_task': round(total / len(rows), 1),
+                'bytes_per_image': round(total / images, 1) if images else None,
+            }
+        return report
+
+    def report(self, shards, sample):
+        """ Redis node마다 최대 sample / node 개수 만큼의 task를 측정 """
+        usages = []
+        for shard in shards:
+            conn = shard.conn()
+            task_keys = []
+            for task_key in self.scan_tasks(conn, 1000):
+                task_keys.append(task_key)
+                if len(task_keys) >= max(1, sample // len(shards)):
+                    break
+            usages.extend(self.task_usage(conn, task_keys))
+        return self.summarize(usages)
+
+    def migrate(self, conn, batch_size):
+        migrated = skipped = 0
+        batch = []
+        for task_key in self.scan_tasks(conn, batch_size):
+            batch.append(task_key)
+            if len(batch) >= batch_size:
+                result = run_script(conn, PACK_TASKS, args=[FTP_IMAGE_PREFIX] + batch)
+                migrated, skipped, batch = migrated + result[0], skipped + result[1], []
+        if batch:
+            result = run_script(conn, PACK_TASKS, args=[FTP_IMAGE_PREFIX] + batch)
+            migrated, skipped = migrated + result[0], skipped + result[1]
+        return migrated, skipped
+
+    def synthetic_report(self, shard, count, images):
+        """ queue에 넣지 않은 임시 task를 두 형식으로 count개씩 저장하고 측정한 뒤 삭제 """
+        conn = shard.conn()
+        now = time.time()
+        imglist = [{'path': '/data/ftp/%s/%08d.jpg' % (time.strftime('%Y%m%d'), i)} for i in range(images)]
+        task_keys = []
+        img_keys = []
+        pipline = conn.pipeline(False)
+        for i in range(count):
+            imgid_list = alloc_imgids(shard, images)
+            token = create_token('1')
+            save_imginfos(pipline, '1', imglist, imgid_list, now)
+            img_keys.extend(FTP_IMAGE_PREFIX + img_id for img_id in imgid_list)
+            save_taskinfo(pipline, token, '1', imgid_list, now)
+            task_keys.append(TASK_INFO_PREFIX + token)
+            token = create_token('1')
+            save_packed_taskinfo(pipline, token, '1', imglist, imgid_list, now)
+            task_keys.append(TASK_INFO_PREFIX + token)
+        pipline.execute()
+        try:
+            return self.summarize(self.task_usage(conn, task_keys))
+        finally:
+            keys = task_keys + img_keys
+            for i in range(0, len(keys), 1000):
+                conn.delete(*keys[i:i + 1000])
@@ -0,0 +1,401 @@
+"""Prometheus 형식 metrics
+
+요청별 처리 시간과 Redis 사용량, Redis 명령별 왕복 시간, task status 변경 횟수, result cache hit/miss 횟수를 수집하여
+/metrics로 제공한다.
+
+    - counter/histogram: process 안에서 누적하고 FACEAI_METRICS_FLUSH_INTERVAL초마다 control node의 METRICS_KEY
+      hash에 HINCRBYFLOAT로 더한다. (flush당 Redis 왕복 1회) /metrics는 모든 process(web, reaper)의 합계를 보여준다.
+    - gauge (queue 길이, pending 개수/가장 오래된 task의 처리 시간, dead letter 개수): 요청마다 계산하지 않고
+      /metrics 요청 시 FACEAI_METRICS_SAMPLE_INTERVAL초에 한 번만 Redis에서 조회한다.
+
+Redis 명령은 settings.CACHES의 OPTIONS에 지정한 client class(InstrumentedRedis, InstrumentedAsyncRedis)에서
+측정하므로 view와 helper(save_uploads, queue_metainfos, dispatch script 등)를 따로 고칠 필요가 없다.
+요청 처리 시간은 MetricsMiddleware(WSGI/Django)와 AsyncApiApplication(ASGI의 async view)에서 측정한다.
+"""
+import bisect
+import contextvars
+import logging
+import re
+import threading
+import time
+from django.conf import settings
+from django.http import HttpResponse
+from redis.client import Redis, Pipeline
+from image_api.constants import *
+from image_api.queues import get_task_queue
+from image_api.sharding import get_shard_ring
+
+try:
+    from redis.asyncio.client import Redis as AsyncRedis, Pipeline as AsyncPipeline
+except ImportError:  # redis-py < 4.2
+    AsyncRedis = AsyncPipeline = None
+
+logger = logging.getLogger('api.custom')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+REDIS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0, 30.0)
+ROUNDTRIP_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 32, 64)
+BATCH_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+IMAGE_BUCKETS = (0, 1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# metric 이름: (type, help, histogram buckets)
+METRICS = {
+    'faceai_http_request_duration_seconds': (
+        'histogram', 'View processing time by endpoint and HTTP status.', LATENCY_BUCKETS),
+    'faceai_http_request_redis_seconds': (
+        'histogram', 'Time spent waiting on Redis per request.', LATENCY_BUCKETS),
+    'faceai_http_request_redis_roundtrips': (
+        'histogram', 'Redis round trips per request.', ROUNDTRIP_BUCKETS),
+    'faceai_redis_roundtrip_seconds': (
+        'histogram', 'Redis round trip time by command (pipeline: whole pipeline).', REDIS_BUCKETS),
+    'faceai_redis_commands_total': (
+        'counter', 'Redis commands sent, including commands inside pipelines.', None),
+    'faceai_task_status_total': (
+        'counter', 'Task status transitions by new status.', None),
+    'faceai_ingest_rejected_total': (
+        'counter', 'Uploads rejected by admission control by reason.', None),
+    'faceai_idempotent_replays_total': (
+        'counter', 'Retried uploads and metainfo submits answered without saving again, by kind.', None),
+    'faceai_result_cache_lookups_total': (
+        'counter', 'Result cache lookups for /info/ by result (hit or miss).', None),
+    'faceai_dispatch_batch_size': (
+        'histogram', 'Tasks returned per task_provider call.', BATCH_BUCKETS),
+    'faceai_dispatch_batch_images': (
+        'histogram', 'Images in the tasks returned per task_provider call.', IMAGE_BUCKETS),
+    'faceai_queue_depth': (
+        'gauge', 'Tasks waiting to be dispatched per ftpid (all lanes).', None),
+    'faceai_pending_tasks': (
+        'gauge', 'Dispatched tasks waiting for results per Redis node.', None),
+    'faceai_pending_oldest_age_seconds': (
+        'gauge', 'Seconds since the oldest pending task was dispatched per Redis node.', None),
+    'faceai_dead_tasks': (
+        'gauge', 'Tasks in the dead letter queue per Redis node.', None),
+}
+
+_HISTOGRAM_SUFFIXES = {'_bucket': 0, '_sum': 1, '_count': 2}
+_LE_PATTERN = re.compile(r',?le="([^"]*)"')
+
+# 처리중인 요청의 RequestTracker (요청마다 Redis 사용량을 누적)
+_current_request = contextvars.ContextVar('faceai_current_request', default=None)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"')
+                                        .replace('\n', r'\n')) for name, value in labels) + '}'
+
+
+def _family(name):
+    for suffix in _HISTOGRAM_SUFFIXES:
+        if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+            return name[:-len(suffix)]
+    return name
+
+
+def _sort_key(series):
+    name, _, labels = series.partition('{')
+    family = _family(name)
+    le = _LE_PATTERN.search(labels)
+    return (family, _LE_PATTERN.sub('', labels), _HISTOGRAM_SUFFIXES.get(name[len(family):], 0),
+            float(le.group(1)) if le else 0.0)
+
+
+class RequestTracker:
+    """ 요청 하나의 처리 시간과 Redis 사용량 (같은 context에서 실행된 Redis 명령을 누적)
+
+    다른 tracker 안에서 시작하면 finish할 때 Redis 사용량을 바깥 tracker에도 더한다. (benchmark 등)
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.start = time.perf_counter()
+        self.redis_seconds = 0.0
+        self.redis_roundtrips = 0
+        self.redis_commands = 0
+        self._parent = _current_request.get()
+        self._token = _current_request.set(self)
+
+    def finish(self, endpoint, status):
+        _current_request.reset(self._token)
+        if self._parent is not None:
+            self._parent.redis_seconds += self.redis_seconds
+            self._parent.redis_roundtrips += self.redis_roundtrips
+            self._parent.redis_commands += self.redis_commands
+        labels = (('endpoint', endpoint),)
+        self.metrics.observe('faceai_http_request_duration_seconds', time.perf_counter() - self.start,
+                             labels + (('status', status),))
+        self.metrics.observe('faceai_http_request_redis_seconds', self.redis_seconds, labels)
+        self.metrics.observe('faceai_http_request_redis_roundtrips', self.redis_roundtrips, labels)
+
+
+class Metrics:
+
+    def __init__(self, enabled=True, flush_interval=10, sample_interval=15):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.sample_interval = sample_interval
+        self._counters = {}
+        self._histograms = {}
+        self._unflushed = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._gauges = None
+        self._sampled_at = 0
+        self._ftpids = set()
+        self._discovered_at = 0
+
+    def inc(self, name, value=1, labels=()):
+        if not self.enabled or not value:
+            return
+        self._ensure_flusher()
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        if not self.enabled:
+            return
+        self._ensure_flusher()
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # bucket별 개수 (마지막은 +Inf), 합계
+                histogram = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            histogram[0][bisect.bisect_left(buckets, value)] += 1
+            histogram[1] += value
+
+    def record_status(self, status, count):
+        """ count개의 task가 status(STATUS)로 바뀌었음을 기록 """
+        self.inc('faceai_task_status_total', count, (('status', status.name),))
+
+    def record_rejected(self, reason):
+        """ admission control에서 업로드 요청 하나를 거절했음을 기록 """
+        self.inc('faceai_ingest_rejected_total', 1, (('reason', reason),))
+
+    def record_replay(self, kind, count):
+        """ kind('upload', 'metainfo') 요청 count개가 멱등성 key로 중복 처리되었음을 기록 """
+        if count:
+            self.inc('faceai_idempotent_replays_total', count, (('kind', kind),))
+
+    def record_cache_lookup(self, hit):
+        """ result cache 조회 한 번 (hit: cache에 있었는지) """
+        self.inc('faceai_result_cache_lookups_total', 1, (('result', 'hit' if hit else 'miss'),))
+
+    def start_request(self):
+        """ Returns: RequestTracker, 사용하지 않으면 None """
+        return RequestTracker(self) if self.enabled else None
+
+    def record_redis(self, command, elapsed, commands=1):
+        """ Redis 왕복 한 번 (pipeline이면 commands개의 명령) """
+        if not self.enabled:
+            return
+        labels = (('command', command),)
+        self.observe('faceai_redis_roundtrip_seconds', elapsed, labels)
+        self.inc('faceai_redis_commands_total', commands, labels)
+        tracker = _current_request.get()
+        if tracker is not None:
+            tracker.redis_seconds += elapsed
+            tracker.redis_roundtrips += 1
+            tracker.redis_commands += commands
+
+    def _drain(self):
+        """ 누적된 값을 METRICS_KEY hash의 field별 증가분으로 바꾸고 비운다 """
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            histograms, self._histograms = self._histograms, {}
+            fields, self._unflushed = self._unflushed, {}
+        for (name, labels), value in counters.items():
+            series = name + _format_labels(labels)
+            fields[series] = fields.get(series, 0) + value
+        for (name, labels), (counts, total) in histograms.items():
+            updates = {name + '_sum' + _format_labels(labels): total,
+                       name + '_count' + _format_labels(labels): sum(counts)}
+            cumulative = 0
+            for le, count in zip(METRICS[name][2] + ('+Inf',), counts):
+                cumulative += count
+                if cumulative:
+                    le = le if le == '+Inf' else float(le)
+                    updates[name + '_bucket' + _format_labels(labels + (('le', le),))] = cumulative
+            for series, value in updates.items():
+                fields[series] = fields.get(series, 0) + value
+        return fields
+
+    def flush(self):
+        """ 이 process에서 누적한 값을 control node의 METRICS_KEY에 더한다 (실패하면 다음 flush에 다시 보낸다) """
+        fields = self._drain()
+        if not fields:
+            return
+        try:
+            pipline = get_shard_ring().control.conn().pipeline(False)
+            for series, value in fields.items():
+                pipline.hincrbyfloat(METRICS_KEY, series, value)
+            pipline.execute()
+        except Exception:
+            with self._lock:
+                for series, value in fields.items():
+                    self._unflushed[series] = self._unflushed.get(series, 0) + value
+            raise
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_forever, daemon=True, name='metrics-flush')
+                self._flusher.start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("exception occured: %s", e)
+
+    def gauges(self):
+        """ Returns: [(metric 이름, labels, 값), ...] (sample_interval초 동안은 마지막으로 조회한 값) """
+        now = time.time()
+        if self._gauges is None or now - self._sampled_at >= self.sample_interval:
+            self._gauges = self.sample_gauges(now)
+            self._sampled_at = now
+        return self._gauges
+
+    def sample_gauges(self, now):
+        ring = get_shard_ring()
+        queue = get_task_queue()
+        # queue가 있는 ftpid 목록은 METRICS_DISCOVERY_INTERVAL초마다 갱신하고, 비었던 queue도 계속 0으로 보여준다
+        if now - self._discovered_at >= METRICS_DISCOVERY_INTERVAL:
+            for shard in ring.shards:
+                self._ftpids.update(queue.ftpids(shard.conn()))
+            self._discovered_at = now
+
+        gauges = []
+        ftpids = sorted(self._ftpids)
+        for shard, indexes in ring.group_ftpids(ftpids):
+            shard_ftpids = [ftpids[i] for i in indexes]
+            for ftpid, depth in zip(shard_ftpids, queue.depths(shard.conn(), shard_ftpids)):
+                gauges.append(('faceai_queue_depth', (('ftpid', ftpid),), depth))
+        for shard in ring.shards:
+            conn = shard.conn()
+            labels = (('shard', shard.index),)
+            count, oldest = queue.pending_stats(conn)
+            gauges.append(('faceai_pending_tasks', labels, count))
+            gauges.append(('faceai_pending_oldest_age_seconds', labels,
+                           round(max(0.0, now - oldest), 3) if oldest is not None else 0))
+            gauges.append(('faceai_dead_tasks', labels, conn.zcard(DEAD_TASK_ZSET)))
+        # 같은 metric의 series는 연속되어야 한다 (node 순서는 유지)
+        return sorted(gauges, key=lambda gauge: gauge[0])
+
+    def collect(self):
+        """ Returns: Prometheus text format """
+        self.flush()
+        stored = get_shard_ring().control.conn().hgetall(METRICS_KEY)
+        rows = [(series, value) for series, value in stored.items()]
+        rows.sort(key=lambda row: _sort_key(row[0]))
+        rows.extend((name + _format_labels(labels), value) for name, labels, value in self.gauges())
+
+        lines = []
+        family = None
+        for series, value in rows:
+            name = _family(series.partition('{')[0])
+            if name != family:
+                family = name
+                if name in METRICS:
+                    lines.append('# HELP %s %s' % (name, METRICS[name][1]))
+                    lines.append('# TYPE %s %s' % (name, METRICS[name][0]))
+            lines.append('%s %s' % (series, value))
+        return '\n'.join(lines) + '\n'
+
+
+_metrics = None
+
+
+def get_metrics():
+    """ settings로 설정한 Metrics를 리턴 (process당 하나) """
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics(
+            enabled=getattr(settings, 'FACEAI_METRICS', True),
+            flush_interval=getattr(settings, 'FACEAI_METRICS_FLUSH_INTERVAL', 10),
+            sample_interval=getattr(settings, 'FACEAI_METRICS_SAMPLE_INTERVAL', 15),
+        )
+    return _metrics
+
+
+def metrics_response():
+    return HttpResponse(get_metrics().collect(), content_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    """ Django view의 처리 시간과 Redis 사용량을 기록 (MIDDLEWARE 맨 앞에 둔다) """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tracker = get_metrics().start_request()
+        response = self.get_response(request)
+        if tracker is not None:
+            resolver_match = getattr(request, 'resolver_match', None)
+            tracker.finish(resolver_match.func.__name__ if resolver_match else 'unmatched', response.status_code)
+        return response
+
+
+class InstrumentedRedis(Redis):
+    """ 명령별 Redis 왕복 시간을 기록하는 client (CACHES OPTIONS의 REDIS_CLIENT_CLASS) """
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            get_metrics().record_redis(str(args[0]).lower(), time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class InstrumentedPipeline(Pipeline):
+
+    def execute(self, raise_on_error=True):
+        commands = len(self.command_stack)
+        if not commands:
+            return super().execute(raise_on_error)
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            get_metrics().record_redis('pipeline', time.perf_counter() - start, commands)
+
+
+if AsyncRedis is not None:
+
+    class InstrumentedAsyncRedis(AsyncRedis):
+        """ InstrumentedRedis의 asyncio 버전 (CACHES OPTIONS의 ASYNC_REDIS_CLIENT_CLASS) """
+
+        async def execute_command(self, *args, **options):
+            start = time.perf_counter()
+            try:
+                return await super().execute_command(*args, **options)
+            finally:
+                get_metrics().record_redis(str(args[0]).lower(), time.perf_counter() - start)
+
+        def pipeline(self, transaction=True, shard_hint=None):
+            return InstrumentedAsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+    class InstrumentedAsyncPipeline(AsyncPipeline):
+
+        async def execute(self, raise_on_error=True):
+            commands = len(self.command_stack)
+            if not commands:
+                return await super().execute(raise_on_error)
+            start = time.perf_counter()
+            try:
+                return await super().execute(raise_on_error)
+            finally:
+                get_metrics().record_redis('pipeline', time.perf_counter() - start, commands)
@@ -0,0 +1,531 @@
+"""Task queue backend
+
+settings.FACEAI_TASK_QUEUE_BACKEND 값으로 선택한다.
+    - 'list'   (default): ftpid별 Redis List + PEDDING_TASK_ZSET
+    - 'stream': ftpid별 Redis Stream + consumer group (pending 정보는 stream이 관리)
+
+업로드 시 priority/tenant를 지정한 task는 ftpid 안의 lane('priority|tenant')별 queue에 들어가고,
+배분 시에는 Lua script(DISPATCH_TASKS / STREAM_DISPATCH_TASKS)에서 weighted fair selection으로 lane을 고른다.
+기본 lane(기본 priority, tenant 없음)은 기존 ftpid queue를 그대로 사용한다.
+
+배분 시 TaskBudget을 넘기면 token 개수(limit)와 함께 이미지 수/크기 합계로도 제한한다. script가 task를 꺼내기 전에
+이미지 수를 확인하므로 budget을 넘는 task는 queue에 그대로 남는다. (꺼낸 후 다시 넣지 않음)
+"""
+import time
+from django.conf import settings
+from redis.exceptions import ResponseError
+from image_api.constants import *
+from image_api.scripts import run_script, arun_script, pairs_to_dict, DISPATCH_TASKS, STREAM_DISPATCH_TASKS, \
+    STREAM_FETCH_TASKS, STREAM_ACK_TASKS, RETRY_TASKS, REAP_TASKS, QUEUE_DEPTHS
+
+# queue에 남아 있어도 배분하지 않는 status (reaper가 다시 넣은 후 늦게 결과가 저장된 task 등)
+DONE_STATUS_ARGS = [STATUS.COMPLETE.value, STATUS.ABORT.value]
+
+def _to_tasklist(rows):
+    return [(token, [pairs_to_dict(img) for img in imgs]) for token, imgs in rows]
+
+
+def image_bytes(imglist):
+    """ budget에서 사용하는 이미지 크기 (이미지 path의 byte 합계, Lua script의 task_size와 같은 값) """
+    return sum(len(img.get('path', '').encode('utf-8')) for img in imglist)
+
+
+class TaskBudget:
+    """ task_provider 요청 하나에서 꺼낼 task의 이미지 수/크기 budget
+
+    max_images: 이미지 수 합계 상한, max_bytes: 이미지 path byte 합계 상한 (0이면 제한 없음)
+    queue 순서대로 꺼내다가 다음 task가 남은 budget을 넘으면 멈춘다. token은 나누지 않으므로
+    아직 꺼낸 task가 없으면 첫 task는 budget보다 커도 꺼낸다. (큰 task가 queue를 막지 않도록)
+    linger: 첫 task를 꺼낸 후 budget(또는 limit)이 찰 때까지 task를 더 기다리는 최대 시간(초)
+
+    work stealing처럼 여러 queue에서 꺼낼 때도 같은 TaskBudget을 넘겨서 남은 양을 이어서 사용한다.
+    """
+
+    def __init__(self, max_images=0, max_bytes=0, linger=0):
+        self.max_images = max_images
+        self.max_bytes = max_bytes
+        self.linger = linger
+        self.tasks = 0
+        self.images = 0
+        self.bytes = 0
+        # 다음 task가 budget을 넘어서 더 꺼낼 수 없음
+        self.full = False
+
+    def args(self):
+        """ DISPATCH_TASKS / STREAM_DISPATCH_TASKS ARGV[9..11] """
+        return [self.max_images - self.images if self.max_images else 0,
+                self.max_bytes - self.bytes if self.max_bytes else 0,
+                0 if self.tasks else 1]
+
+    def add(self, tasklist, stopped):
+        """ 꺼낸 task를 budget에서 뺀다 (stopped: script가 budget을 넘는 task 앞에서 멈췄으면 true) """
+        self.tasks += len(tasklist)
+        self.images += sum(len(imglist) for _, imglist in tasklist)
+        self.bytes += sum(image_bytes(imglist) for _, imglist in tasklist)
+        self.full = bool(stopped) or (0 < self.max_images <= self.images) or (0 < self.max_bytes <= self.bytes)
+
+
+class DispatchBatch:
+    """ dispatch 한 번에서 꺼낸 task (wait, linger 동안 배분 script를 여러 번 실행해서 모은다) """
+
+    def __init__(self, limit, wait, budget):
+        self.limit = limit
+        self.budget = budget
+        self.tasklist = []
+        self.deadline = time.time() + wait
+
+    @property
+    def remaining(self):
+        """ 더 꺼낼 task 개수 """
+        return self.limit - len(self.tasklist)
+
+    def add(self, reply):
+        """ 배분 script 결과를 더한다
+
+        Returns: task를 더 기다릴 시간(초), 0 이하이면 배분을 끝낸다
+        """
+        _, rows, stopped = reply
+        tasklist = _to_tasklist(rows)
+        if self.budget is not None:
+            self.budget.add(tasklist, stopped)
+            if tasklist and not self.tasklist:
+                # 첫 task를 꺼낸 후에는 linger 동안만 더 기다린다
+                self.deadline = time.time() + self.budget.linger
+        self.tasklist.extend(tasklist)
+        if self.tasklist and (self.budget is None or self.budget.full or self.remaining <= 0):
+            return 0
+        return self.deadline - time.time()
+
+
+def get_visibility_timeout(ftpid):
+    """ ftpid의 task 처리 기한(초); settings.FACEAI_VISIBILITY_TIMEOUT에 없으면 PEDDING_TASK_AGE """
+    return getattr(settings, 'FACEAI_VISIBILITY_TIMEOUT', {}).get(str(ftpid), PEDDING_TASK_AGE)
+
+
+def get_lane_weights():
+    """ priority별 배분 weight (settings.FACEAI_LANE_WEIGHTS) """
+    return getattr(settings, 'FACEAI_LANE_WEIGHTS', LANE_WEIGHTS)
+
+
+def make_lane(priority=None, tenant=None):
+    """ Returns: lane 이름 ('priority|tenant'), 기본 lane이면 None """
+    priority = priority or DEFAULT_PRIORITY
+    if priority == DEFAULT_PRIORITY and not tenant:
+        return None
+    return priority + LANE_SEPARATOR + (tenant or '')
+
+
+def queue_name(ftpid, lane):
+    """ lane의 queue 이름 (queue key = queue prefix + queue 이름) """
+    return ftpid if lane is None else ftpid + LANE_SEPARATOR + lane
+
+
+def queue_ftpid(name):
+    return name.split(LANE_SEPARATOR, 1)[0]
+
+
+def register_lane(pipline, ftpid, lane):
+    pipline.zadd(TASK_LANE_PREFIX + ftpid, {lane: time.time()})
+    pipline.expire(TASK_LANE_PREFIX + ftpid, TASK_INFO_AGE)
+
+
+def lane_args(queue_prefix, ftpid, limit, budget=None):
+    """ DISPATCH_TASKS / STREAM_DISPATCH_TASKS 공통 ARGV[1..11] """
+    weights = ' '.join('%s=%s' % (priority, weight) for priority, weight in get_lane_weights().items())
+    return [queue_prefix, ftpid, limit, time.time(), getattr(settings, 'FACEAI_LANE_MAX_WAIT', LANE_MAX_WAIT),
+            TASK_INFO_AGE, weights, DEFAULT_PRIORITY] + (budget.args() if budget is not None else [0, 0, 1])
+
+
+def lane_keys(ftpid):
+    return [TASK_LANE_PREFIX + ftpid, TASK_LANE_STATE_PREFIX + ftpid]
+
+
+def depth_args(queue, ftpids):
+    """ QUEUE_DEPTHS ARGV """
+    return [queue.queue_prefix, TASK_LANE_PREFIX, queue.name, TASK_STREAM_GROUP] + [str(ftpid) for ftpid in ftpids]
+
+
+class ListTaskQueue:
+    """ Redis List에 task를 쌓고, 처리중인 task는 PEDDING_TASK_ZSET(score=처리 기한)으로 관리 """
+    name = 'list'
+    queue_prefix = TASK_QUEUE_PREFIX
+
+    def push(self, pipline, ftpid, token, lane=None):
+        pipline.rpush(TASK_QUEUE_PREFIX + queue_name(ftpid, lane), TASK_INFO_PREFIX + token)
+        if lane is not None:
+            register_lane(pipline, ftpid, lane)
+
+    def _dispatch_args(self, ftpid, limit, budget=None):
+        now = time.time()
+        return lane_args(TASK_QUEUE_PREFIX, ftpid, limit, budget) + [
+            now + get_visibility_timeout(ftpid), STATUS.PENDDING.value, FTP_IMAGE_PREFIX] + DONE_STATUS_ARGS
+
+    def _block_time(self, lanes, remaining):
+        # BLMOVE는 key 하나만 기다릴 수 있으므로 lane을 사용하는 ftpid는 짧게 나눠서 다시 확인한다
+        # (Redis는 timeout을 ms 단위로 자르고 0이면 무한히 기다리므로 최소 1ms)
+        return max(0.001, min(remaining, LANE_POLL_INTERVAL) if lanes else remaining)
+
+    def dispatch(self, conn, ftpid, limit, consumer=None, wait=0, budget=None):
+        """ lane 선택, pop, pedding 등록, status 업데이트, 이미지 조회를 script 한 번으로 처리
+
+        queue가 비어 있으면 최대 wait초 동안 task가 들어오기를 기다린다. 기다리는 동안에는
+        BLMOVE queue queue LEFT LEFT로 head를 제자리에 둔 채 block하므로 task가 유실되지 않는다.
+        budget(TaskBudget)의 linger가 있으면 task를 꺼낸 후에도 같은 방법으로 budget이 찰 때까지 기다린다.
+
+        Returns: [(token, [imginfo, ...]), ...]
+        """
+        queue_key = TASK_QUEUE_PREFIX + ftpid
+        batch = DispatchBatch(limit, wait, budget)
+        while True:
+            reply = run_script(conn, DISPATCH_TASKS, keys=lane_keys(ftpid) + [PEDDING_TASK_ZSET],
+                               args=self._dispatch_args(ftpid, batch.remaining, budget))
+            remaining = batch.add(reply)
+            if remaining <= 0:
+                return batch.tasklist
+            # 다른 worker가 먼저 가져가면 남은 시간 동안 다시 기다린다
+            lanes = reply[0]
+            if conn.blmove(queue_key, queue_key, self._block_time(lanes, remaining), 'LEFT', 'LEFT') is None \
+                    and not lanes:
+                return batch.tasklist
+
+    async def adispatch(self, conn, ftpid, limit, consumer=None, wait=0, budget=None):
+        """ dispatch의 asyncio 버전 """
+        queue_key = TASK_QUEUE_PREFIX + ftpid
+        batch = DispatchBatch(limit, wait, budget)
+        while True:
+            reply = await arun_script(conn, DISPATCH_TASKS, keys=lane_keys(ftpid) + [PEDDING_TASK_ZSET],
+                                      args=self._dispatch_args(ftpid, batch.remaining, budget))
+            remaining = batch.add(reply)
+            if remaining <= 0:
+                return batch.tasklist
+            lanes = reply[0]
+            if await conn.blmove(queue_key, queue_key, self._block_time(lanes, remaining), 'LEFT', 'LEFT') is None \
+                    and not lanes:
+                return batch.tasklist
+
+    def ack(self, conn, tokens):
+        if tokens:
+            conn.zrem(PEDDING_TASK_ZSET, *tokens)
+
+    async def aack(self, conn, tokens):
+        if tokens:
+            await conn.zrem(PEDDING_TASK_ZSET, *tokens)
+
+    def depths(self, conn, ftpids):
+        """ Returns: ftpids 순서대로 배분 대기중인 task 개수 (모든 lane 합계) """
+        return run_script(conn, QUEUE_DEPTHS, args=depth_args(self, ftpids))
+
+    async def adepths(self, conn, ftpids):
+        return await arun_script(conn, QUEUE_DEPTHS, args=depth_args(self, ftpids))
+
+    def pending(self, conn, limit):
+        """ Returns: 처리 기한 순서로 [(token, 배분 시간), ...] """
+        tokens = conn.zrange(PEDDING_TASK_ZSET, 0, limit, desc=False)
+        pipline = conn.pipeline(False)
+        for token in tokens:
+            pipline.hget(TASK_INFO_PREFIX + token, 'dispatch_time')
+        return self._pending_tasks(tokens, pipline.execute())
+
+    async def apending(self, conn, limit):
+        tokens = await conn.zrange(PEDDING_TASK_ZSET, 0, limit, desc=False)
+        pipline = conn.pipeline(False)
+        for token in tokens:
+            pipline.hget(TASK_INFO_PREFIX + token, 'dispatch_time')
+        return self._pending_tasks(tokens, await pipline.execute())
+
+    def _pending_tasks(self, tokens, dispatch_times):
+        return [(token, float(dispatch_time)) for token, dispatch_time in zip(tokens, dispatch_times)
+                if dispatch_time is not None]
+
+    def pending_stats(self, conn):
+        """ Returns: (처리중인 task 개수, 처리 기한이 가장 먼저 되는 task의 배분 시간 또는 None) """
+        pending = self.pending(conn, 0)
+        return conn.zcard(PEDDING_TASK_ZSET), pending[0][1] if pending else None
+
+    def ftpids(self, conn):
+        """ Returns: 배분 대기중인 task가 있는 ftpid 목록 (비어 있는 List는 Redis에서 삭제되므로 포함되지 않는다) """
+        return set(queue_ftpid(key[len(TASK_QUEUE_PREFIX):])
+                   for key in conn.scan_iter(match=TASK_QUEUE_PREFIX + '*', count=1000))
+
+    def reap(self, conn, count, max_attempts):
+        """ 처리 기한(visibility timeout)이 지난 task를 최대 count개 pending에서 제거하고, 다시 queue에 넣거나
+        최대 시도 횟수를 넘었으면 dead letter queue로 보낸다
+
+        ZRANGEBYSCORE로 기한이 지난 범위만 정확히 읽어서 ZREM, 재시도까지 script 한 번으로 처리한다.
+
+        Returns: (pending에서 제거한 개수, 다시 queue에 넣은 개수, [(token, taskinfo pairs), ...] dead letter로 보낸 task)
+        """
+        reaped, requeued, dead = run_script(conn, REAP_TASKS, keys=[DEAD_TASK_ZSET, PEDDING_TASK_ZSET],
+                                            args=retry_args(self, max_attempts) + [count])
+        return reaped, requeued, dead
+
+
+class StreamTaskQueue:
+    """ ftpid(lane)별 Redis Stream에 task를 쌓고, consumer group(TASK_STREAM_GROUP)으로 배분
+
+    - dispatch: XREADGROUP (consumer별 pending list에 자동 등록)
+    - ack: XACK + XDEL (ack에 필요한 queue 이름, entry_id는 배분 시 taskinfo에 기록)
+    - reap: XAUTOCLAIM으로 idle 시간이 처리 기한(visibility timeout)을 넘은 entry를 회수
+    """
+    name = 'stream'
+    queue_prefix = TASK_STREAM_PREFIX
+    # 이미 consumer group을 생성한 (connection pool, stream) (process 단위)
+    _groups = set()
+
+    def _stream_key(self, name):
+        return TASK_STREAM_PREFIX + name
+
+    def _group_key(self, conn, stream_key):
+        # sharding 사용 시 같은 이름의 stream이 여러 Redis node에 있다
+        return id(conn.connection_pool), stream_key
+
+    def _ensure_group(self, conn, stream_key):
+        group_key = self._group_key(conn, stream_key)
+        if group_key in self._groups:
+            return
+        try:
+            conn.xgroup_create(stream_key, TASK_STREAM_GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._groups.add(group_key)
+
+    async def _aensure_group(self, conn, stream_key):
+        group_key = self._group_key(conn, stream_key)
+        if group_key in self._groups:
+            return
+        try:
+            await conn.xgroup_create(stream_key, TASK_STREAM_GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._groups.add(group_key)
+
+    def _dispatch_args(self, ftpid, limit, consumer, budget=None):
+        return lane_args(TASK_STREAM_PREFIX, ftpid, limit, budget) + [
+            TASK_STREAM_GROUP, consumer, STATUS.PENDDING.value, FTP_IMAGE_PREFIX] + DONE_STATUS_ARGS
+
+    def _wait_streams(self, ftpid, lanes):
+        """ long-poll로 기다릴 stream 목록 (기본 lane + lane 목록) """
+        return [self._stream_key(queue_name(ftpid, lane)) for lane in [None] + list(lanes)]
+
+    def _block_ms(self, remaining):
+        # '$'(XREAD를 호출한 시점 이후의 entry)를 기다리므로 script 실행과 XREAD 사이에 들어온 entry를 놓치지 않게 짧게 나눈다
+        return max(1, int(min(remaining, LANE_POLL_INTERVAL) * 1000))
+
+    def _deadline_ms(self, batch):
+        # BLOCK 0은 무한히 기다리므로 1ms 미만으로 남았어도 1ms는 기다린다
+        return max(1, int((batch.deadline - time.time()) * 1000))
+
+    def _fetch_args(self, stream_key, entries):
+        args = [TASK_STREAM_GROUP, STATUS.PENDDING.value, FTP_IMAGE_PREFIX, stream_key[len(TASK_STREAM_PREFIX):],
+                time.time()] + DONE_STATUS_ARGS
+        for entry_id, fields in entries:
+            args.extend([entry_id, fields['task']])
+        return args
+
+    def push(self, pipline, ftpid, token, lane=None):
+        name = queue_name(ftpid, lane)
+        pipline.xadd(self._stream_key(name), {'task': TASK_INFO_PREFIX + token})
+        pipline.sadd(TASK_STREAM_SET, name)
+        if lane is not None:
+            register_lane(pipline, ftpid, lane)
+
+    def dispatch(self, conn, ftpid, limit, consumer=None, wait=0, budget=None):
+        """ lane 선택, XREADGROUP, status 업데이트, 이미지 조회를 script 한 번으로 처리
+
+        읽을 task가 없으면 최대 wait초 동안 모든 lane의 stream을 XREADGROUP BLOCK으로 기다린다.
+        (기다린 후에는 먼저 들어온 task를 lane 선택 없이 리턴한다)
+        budget(TaskBudget)이 있으면 XREADGROUP BLOCK은 budget을 확인하지 않고 읽으므로, XREAD BLOCK으로
+        새 entry를 기다린 후 script로 다시 배분한다. (linger 동안에도 같은 방법으로 기다린다)
+        """
+        consumer = consumer or 'ftp' + ftpid
+        batch = DispatchBatch(limit, wait, budget)
+        reply = run_script(conn, STREAM_DISPATCH_TASKS, keys=lane_keys(ftpid),
+                           args=self._dispatch_args(ftpid, limit, consumer, budget))
+        remaining = batch.add(reply)
+        if budget is not None:
+            while remaining > 0:
+                conn.xread({stream_key: '$' for stream_key in self._wait_streams(ftpid, reply[0])},
+                           count=1, block=self._block_ms(remaining))
+                reply = run_script(conn, STREAM_DISPATCH_TASKS, keys=lane_keys(ftpid),
+                                   args=self._dispatch_args(ftpid, batch.remaining, consumer, budget))
+                remaining = batch.add(reply)
+        if remaining <= 0:
+            return batch.tasklist
+        lanes = reply[0]
+        stream_keys = self._wait_streams(ftpid, lanes)
+        for stream_key in stream_keys:
+            self._ensure_group(conn, stream_key)
+        # COUNT는 stream별 개수이므로 합계가 limit을 넘지 않도록 나눈다
+        streams = conn.xreadgroup(TASK_STREAM_GROUP, consumer, {stream_key: '>' for stream_key in stream_keys},
+                                  count=max(1, limit // len(stream_keys)), block=self._deadline_ms(batch))
+        rows = []
+        for stream_key, entries in streams or []:
+            rows.extend(run_script(conn, STREAM_FETCH_TASKS, keys=[stream_key],
+                                   args=self._fetch_args(stream_key, entries)))
+        return _to_tasklist(rows)
+
+    async def adispatch(self, conn, ftpid, limit, consumer=None, wait=0, budget=None):
+        consumer = consumer or 'ftp' + ftpid
+        batch = DispatchBatch(limit, wait, budget)
+        reply = await arun_script(conn, STREAM_DISPATCH_TASKS, keys=lane_keys(ftpid),
+                                  args=self._dispatch_args(ftpid, limit, consumer, budget))
+        remaining = batch.add(reply)
+        if budget is not None:
+            while remaining > 0:
+                await conn.xread({stream_key: '$' for stream_key in self._wait_streams(ftpid, reply[0])},
+                                 count=1, block=self._block_ms(remaining))
+                reply = await arun_script(conn, STREAM_DISPATCH_TASKS, keys=lane_keys(ftpid),
+                                          args=self._dispatch_args(ftpid, batch.remaining, consumer, budget))
+                remaining = batch.add(reply)
+        if remaining <= 0:
+            return batch.tasklist
+        lanes = reply[0]
+        stream_keys = self._wait_streams(ftpid, lanes)
+        for stream_key in stream_keys:
+            await self._aensure_group(conn, stream_key)
+        streams = await conn.xreadgroup(TASK_STREAM_GROUP, consumer,
+                                        {stream_key: '>' for stream_key in stream_keys},
+                                        count=max(1, limit // len(stream_keys)), block=self._deadline_ms(batch))
+        rows = []
+        for stream_key, entries in streams or []:
+            rows.extend(await arun_script(conn, STREAM_FETCH_TASKS, keys=[stream_key],
+                                          args=self._fetch_args(stream_key, entries)))
+        return _to_tasklist(rows)
+
+    def ack(self, conn, tokens):
+        if tokens:
+            run_script(conn, STREAM_ACK_TASKS,
+                       args=[TASK_STREAM_GROUP, TASK_STREAM_PREFIX, TASK_INFO_PREFIX] + list(tokens))
+
+    async def aack(self, conn, tokens):
+        if tokens:
+            await arun_script(conn, STREAM_ACK_TASKS,
+                              args=[TASK_STREAM_GROUP, TASK_STREAM_PREFIX, TASK_INFO_PREFIX] + list(tokens))
+
+    def depths(self, conn, ftpids):
+        """ Returns: ftpids 순서대로 배분 대기중인(아직 읽지 않은) task 개수 (모든 lane 합계) """
+        return run_script(conn, QUEUE_DEPTHS, args=depth_args(self, ftpids))
+
+    async def adepths(self, conn, ftpids):
+        return await arun_script(conn, QUEUE_DEPTHS, args=depth_args(self, ftpids))
+
+    def _oldest_entries(self, pending_ranges, limit):
+        entries = []
+        for stream_key, pending_range in pending_ranges:
+            for entry in pending_range:
+                entries.append((stream_key, entry['message_id'], entry['time_since_delivered']))
+        entries.sort(key=lambda entry: -entry[2])
+        return entries[:limit + 1]
+
+    def _pending_tasks(self, entries, found_list, now):
+        pedding_tasks = []
+        for (_, _, idle), found in zip(entries, found_list):
+            if found:
+                token = found[0][1]['task'][len(TASK_INFO_PREFIX):]
+                pedding_tasks.append((token, now - idle / 1000.0))
+        return pedding_tasks
+
+    def pending(self, conn, limit):
+        now = time.time()
+        pending_ranges = []
+        for name in conn.smembers(TASK_STREAM_SET):
+            stream_key = self._stream_key(name)
+            self._ensure_group(conn, stream_key)
+            pending_ranges.append(
+                (stream_key, conn.xpending_range(stream_key, TASK_STREAM_GROUP, '-', '+', limit + 1)))
+        entries = self._oldest_entries(pending_ranges, limit)
+
+        pipline = conn.pipeline(False)
+        for stream_key, entry_id, _ in entries:
+            pipline.xrange(stream_key, entry_id, entry_id)
+        return self._pending_tasks(entries, pipline.execute(), now)
+
+    async def apending(self, conn, limit):
+        now = time.time()
+        pending_ranges = []
+        for name in await conn.smembers(TASK_STREAM_SET):
+            stream_key = self._stream_key(name)
+            await self._aensure_group(conn, stream_key)
+            pending_ranges.append(
+                (stream_key, await conn.xpending_range(stream_key, TASK_STREAM_GROUP, '-', '+', limit + 1)))
+        entries = self._oldest_entries(pending_ranges, limit)
+
+        pipline = conn.pipeline(False)
+        for stream_key, entry_id, _ in entries:
+            pipline.xrange(stream_key, entry_id, entry_id)
+        return self._pending_tasks(entries, await pipline.execute(), now)
+
+    def pending_stats(self, conn):
+        """ Returns: (처리중인 task 개수, 가장 오래 전에 배분된 task의 배분 시간 또는 None) """
+        names = list(conn.smembers(TASK_STREAM_SET))
+        for name in names:
+            self._ensure_group(conn, self._stream_key(name))
+        pipline = conn.pipeline(False)
+        for name in names:
+            pipline.xpending(self._stream_key(name), TASK_STREAM_GROUP)
+        count = sum(summary['pending'] for summary in pipline.execute())
+        pending = self.pending(conn, 0)
+        return count, pending[0][1] if pending else None
+
+    def ftpids(self, conn):
+        """ Returns: task stream이 있는 ftpid 목록 """
+        return set(queue_ftpid(name) for name in conn.smembers(TASK_STREAM_SET))
+
+    def reap(self, conn, count, max_attempts):
+        """ ListTaskQueue.reap과 같다
+
+        기한이 지난 entry의 task를 먼저 다시 queue에 넣고(RETRY_TASKS) 나서 entry를 ACK/XDEL한다. 중간에 실패하면
+        task가 다시 배분될 수는 있지만 어느 queue에도 없는 PENDDING 상태로 남지는 않는다.
+        """
+        reaped = requeued = 0
+        dead = []
+        for name in conn.smembers(TASK_STREAM_SET):
+            stream_key = self._stream_key(name)
+            self._ensure_group(conn, stream_key)
+            min_idle_time = int(get_visibility_timeout(queue_ftpid(name)) * 1000)
+            claimed = conn.xautoclaim(stream_key, TASK_STREAM_GROUP, 'reaper', min_idle_time, count=count - reaped)
+            entries = [(entry_id, fields) for entry_id, fields in claimed[1] if fields]
+            if not entries:
+                continue
+            tokens = [fields['task'][len(TASK_INFO_PREFIX):] for _, fields in entries]
+            batch_requeued, batch_dead = run_script(conn, RETRY_TASKS, keys=[DEAD_TASK_ZSET],
+                                                    args=retry_args(self, max_attempts) + tokens)
+            entry_ids = [entry_id for entry_id, _ in entries]
+            pipline = conn.pipeline(False)
+            pipline.xack(stream_key, TASK_STREAM_GROUP, *entry_ids)
+            pipline.xdel(stream_key, *entry_ids)
+            pipline.execute()
+            reaped += len(tokens)
+            requeued += batch_requeued
+            dead.extend(batch_dead)
+            if reaped >= count:
+                break
+        return reaped, requeued, dead
+
+
+def retry_args(queue, max_attempts):
+    """ RETRY_TASKS, REAP_TASKS의 ARGV[1..12] """
+    return [
+        TASK_INFO_PREFIX, META_EVENT_PREFIX, queue.queue_prefix, queue.name, max_attempts, time.time(),
+        META_RESULT_AGE, STATUS.CREATE.value, STATUS.ABORT.value, STATUS.COMPLETE.value,
+        TASK_LANE_PREFIX, TASK_STREAM_SET,
+    ]
+
+
+TASK_QUEUE_BACKENDS = {
+    'list': ListTaskQueue,
+    'stream': StreamTaskQueue,
+}
+
+_task_queue = None
+
+
+def get_task_queue():
+    """ settings에서 지정한 task queue backend를 리턴 (process당 하나) """
+    global _task_queue
+    if _task_queue is None:
+        backend = getattr(settings, 'FACEAI_TASK_QUEUE_BACKEND', 'list')
+        _task_queue = TASK_QUEUE_BACKENDS[backend]()
+    return _task_queue
@@ -0,0 +1,139 @@
+"""처리 기한이 지난 pending task를 정리하는 reaper
+
+기한이 지난 task는 다시 queue에 넣고, 최대 시도 횟수(FACEAI_MAX_TASK_ATTEMPTS)를 넘으면 ABORT 처리 후
+dead letter queue(DEAD_TASK_ZSET)로 보낸다.
+
+`python manage.py reaper`로 별도 process에서 실행한다. 여러 개를 띄워도 Redis lease(REAPER_LEASE_KEY)를
+가진 하나만 동작하고, 나머지는 대기하다가 leader가 죽으면 lease를 이어받는다.
+sharding 사용 시 lease와 통계는 control node에 두고, leader가 모든 Redis node를 차례로 정리한다.
+"""
+import json
+import logging
+import os
+import socket
+import time
+from django.conf import settings
+from image_api.constants import *
+from image_api.metrics import get_metrics
+from image_api.queues import get_task_queue
+from image_api.scripts import run_script, pairs_to_dict, RENEW_LEASE, RELEASE_LEASE
+from image_api.sharding import get_shard_ring
+
+logger = logging.getLogger('api.custom')
+logger_pedding = logging.getLogger('pedding.custom')
+
+
+class PendingTaskReaper:
+    """ 처리 기한(visibility timeout) 안에 처리결과를 받지 못한 task를 재시도 또는 dead letter 처리
+
+    Args:
+        batch_size: 한 번에 처리하는 task 개수
+        interval: 정리 주기 (초)
+        lease_ttl: leader lease 유지 시간 (초); interval보다 길어야 한다
+    """
+
+    def __init__(self, batch_size=1000, interval=10, lease_ttl=30):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease_ttl = lease_ttl
+        self.owner = '%s:%s' % (socket.gethostname(), os.getpid())
+        self.is_leader = False
+        self.max_attempts = getattr(settings, 'FACEAI_MAX_TASK_ATTEMPTS', MAX_TASK_ATTEMPTS)
+
+    def acquire_lease(self, conn):
+        """ leader lease를 획득 또는 연장한다. Returns: leader 여부 """
+        ttl_ms = int(self.lease_ttl * 1000)
+        if self.is_leader:
+            self.is_leader = bool(run_script(conn, RENEW_LEASE, keys=[REAPER_LEASE_KEY], args=[self.owner, ttl_ms]))
+        if not self.is_leader:
+            self.is_leader = bool(conn.set(REAPER_LEASE_KEY, self.owner, nx=True, px=ttl_ms))
+            if self.is_leader:
+                logger.info("reaper %s became leader", self.owner)
+        return self.is_leader
+
+    def release_lease(self, conn):
+        if self.is_leader:
+            run_script(conn, RELEASE_LEASE, keys=[REAPER_LEASE_KEY], args=[self.owner])
+            self.is_leader = False
+
+    def record_dead(self, dead):
+        """ dead letter로 보낸 task를 pedding.log에 기록 """
+        for _, taskinfo in dead:
+            logger_pedding.error(json.dumps(pairs_to_dict(taskinfo)))
+
+    def reap_once(self, conn, lease_conn):
+        """ Redis node 하나(conn)의 기한이 지난 pending task를 batch 단위로 모두 처리한다
+
+        pending에서 제거하고 다시 queue에 넣거나 dead letter로 보내는 것은 queue backend의 reap이 한 번에 처리한다.
+
+        Args:
+            conn: 정리할 Redis node의 connection
+            lease_conn: lease가 있는 control node의 connection
+
+        Returns: (pending에서 제거한 개수, 다시 queue에 넣은 개수, dead letter로 보낸 개수)
+        """
+        queue = get_task_queue()
+        reaped = requeued = dead = 0
+        while True:
+            batch_reaped, batch_requeued, batch_dead = queue.reap(conn, self.batch_size, self.max_attempts)
+            if not batch_reaped:
+                break
+            self.record_dead(batch_dead)
+            get_metrics().record_status(STATUS.CREATE, batch_requeued)
+            get_metrics().record_status(STATUS.ABORT, len(batch_dead))
+            reaped += batch_reaped
+            requeued += batch_requeued
+            dead += len(batch_dead)
+            # batch 처리 중에 lease가 만료되지 않도록 연장; leader를 잃으면 중단
+            if not self.acquire_lease(lease_conn):
+                break
+        return reaped, requeued, dead
+
+    def record_stats(self, conn, reaped, requeued, dead, elapsed):
+        rate = reaped / elapsed if elapsed > 0 else 0.0
+        pipline = conn.pipeline(False)
+        pipline.hset(REAPER_STATS_KEY, mapping={
+            'leader': self.owner,
+            'last_run': time.time(),
+            'last_reaped': reaped,
+            'last_requeued': requeued,
+            'last_dead': dead,
+            'last_duration': round(elapsed, 6),
+            'last_rate': round(rate, 1),
+        })
+        pipline.hincrby(REAPER_STATS_KEY, 'reaped_total', reaped)
+        pipline.hincrby(REAPER_STATS_KEY, 'requeued_total', requeued)
+        pipline.hincrby(REAPER_STATS_KEY, 'dead_total', dead)
+        pipline.execute()
+        if reaped:
+            logger.info("reaper reaped: %s, requeued: %s, dead: %s, %.3fs (%.1f tasks/s)",
+                        reaped, requeued, dead, elapsed, rate)
+
+    def run_once(self):
+        """ leader이면 한 번 정리한다. Returns: reap_once 결과 또는 leader가 아니면 None """
+        conn = get_shard_ring().control.conn()
+        if not self.acquire_lease(conn):
+            return None
+        start = time.time()
+        result = (0, 0, 0)
+        for shard in get_shard_ring().shards:
+            result = tuple(total + count for total, count in zip(result, self.reap_once(shard.conn(), conn)))
+            if not self.is_leader:
+                break
+        self.record_stats(conn, *result, elapsed=time.time() - start)
+        get_metrics().flush()
+        return result
+
+    def run_forever(self):
+        try:
+            while True:
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logger.error("exception occured: %s", e)
+                time.sleep(self.interval)
+        finally:
+            try:
+                self.release_lease(get_shard_ring().control.conn())
+            except Exception as e:
+                logger.error("exception occured: %s", e)
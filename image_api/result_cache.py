@@ -0,0 +1,164 @@
+"""COMPLETE된 token의 meta 정보를 process 안에 보관하는 LRU cache
+
+COMPLETE된 token의 meta 정보는 만료될 때까지 바뀌지 않으므로, 한 번 읽은 결과는 Redis 조회와 parse 없이
+응답에 바로 사용한다. metainfo 저장 시에는 저장한 process의 cache를 갱신하고, 다른 process의 cache는
+pub/sub(RESULT_CACHE_CHANNEL)으로 무효화한다. 무효화 message는 token의 Redis node로 보내므로 모든 node를 구독한다.
+Redis 조회 중에 무효화된 token의 조회 결과는 넣지 않는다 (조회 전에 generation()을 받아서 put에 넘긴다).
+hit/miss 횟수는 /metrics의 faceai_result_cache_lookups_total로 제공한다.
+
+settings
+    - FACEAI_RESULT_CACHE_SIZE: 최대 token 개수 (0이면 사용하지 않음)
+    - FACEAI_RESULT_CACHE_TTL: 최대 보관 시간 (초, META_RESULT_AGE 이하이며 Redis에 남은 시간도 넘지 않는다)
+    - FACEAI_RESULT_CACHE_INVALIDATION: 다른 process의 cache 무효화 사용 여부
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from image_api.constants import *
+from image_api.metrics import get_metrics
+from image_api.sharding import get_shard_ring
+
+logger = logging.getLogger('api.custom')
+
+
+class ResultCache:
+
+    def __init__(self, max_size=10000, ttl=600, invalidation=True):
+        self.max_size = max_size
+        self.ttl = min(ttl, META_RESULT_AGE)
+        self.invalidation = invalidation
+        self.origin = '%s:%s' % (socket.gethostname(), os.getpid())
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        # 무효화할 때마다 증가; token별 마지막 무효화 generation (최대 max_size개)과 밀려난 것 중 가장 최근 값
+        self._generation = 0
+        self._invalidated = OrderedDict()
+        self._invalidated_floor = 0
+        self._lock = threading.Lock()
+        self._listeners = None
+
+    def get(self, token):
+        """ Returns: cache된 meta 정보(JSON bytes), 없거나 만료되었으면 None """
+        if self.max_size <= 0:
+            return None
+        self._ensure_listener()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                payload = None
+            else:
+                self._entries.move_to_end(token)
+                self.hits += 1
+                payload = entry[1]
+        get_metrics().record_cache_lookup(payload is not None)
+        return payload
+
+    def generation(self):
+        """ Redis에서 meta 정보를 조회하기 전에 받아서 put에 넘긴다 """
+        return self._generation
+
+    def put(self, token, payload, ttl, generation=None):
+        """ ttl: Redis에 남은 보관 시간 (초); self.ttl보다 길면 self.ttl
+
+        generation: 조회 전의 generation(); 그 후에 token이 무효화되었으면 조회한 payload가 오래된 값일 수 있으므로
+        넣지 않는다. None이면 확인하지 않는다 (저장한 process가 방금 저장한 값)
+        """
+        ttl = min(self.ttl, ttl)
+        if self.max_size <= 0 or ttl <= 0:
+            return
+        self._ensure_listener()
+        with self._lock:
+            if generation is not None and (generation < self._invalidated_floor
+                                           or self._invalidated.get(token, 0) > generation):
+                return
+            self._entries[token] = (time.time() + ttl, payload)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, tokens):
+        with self._lock:
+            self._generation += 1
+            for token in tokens:
+                if self._entries.pop(token, None) is not None:
+                    self.invalidations += 1
+                self._invalidated[token] = self._generation
+                self._invalidated.move_to_end(token)
+            while len(self._invalidated) > self.max_size:
+                self._invalidated_floor = self._invalidated.popitem(last=False)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            # 조회 중인 결과도 넣지 않는다
+            self._generation += 1
+            self._invalidated.clear()
+            self._invalidated_floor = self._generation
+
+    def publish_invalidation(self, pipline, tokens):
+        """ 다른 process의 cache에서 tokens를 삭제하는 message를 pipeline에 추가 (sync/async pipeline 공용) """
+        if self.max_size > 0 and self.invalidation and tokens:
+            pipline.publish(RESULT_CACHE_CHANNEL, '%s %s' % (self.origin, ','.join(tokens)))
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {
+            'size': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+    def _ensure_listener(self):
+        if not self.invalidation or self._listeners is not None:
+            return
+        with self._lock:
+            if self._listeners is None:
+                self._listeners = [threading.Thread(target=self._listen, args=(shard,), daemon=True,
+                                                    name='result-cache-invalidation-%s' % shard.index)
+                                   for shard in get_shard_ring().shards]
+                for listener in self._listeners:
+                    listener.start()
+
+    def _listen(self, shard):
+        while True:
+            try:
+                pubsub = shard.conn().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(RESULT_CACHE_CHANNEL)
+                for message in pubsub.listen():
+                    origin, _, tokens = message['data'].partition(' ')
+                    if origin != self.origin:
+                        self.invalidate(tokens.split(','))
+            except Exception as e:
+                logger.error("exception occured: %s", e)
+            # 연결이 끊긴 동안의 무효화 message는 받지 못하므로 cache를 비운다
+            self.clear()
+            time.sleep(1)
+
+
+_result_cache = None
+
+
+def get_result_cache():
+    """ settings로 설정한 result cache를 리턴 (process당 하나) """
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(
+            max_size=getattr(settings, 'FACEAI_RESULT_CACHE_SIZE', 10000),
+            ttl=getattr(settings, 'FACEAI_RESULT_CACHE_TTL', 600),
+            invalidation=getattr(settings, 'FACEAI_RESULT_CACHE_INVALIDATION', True),
+        )
+    return _result_cache
@@ -0,0 +1,848 @@
+"""Redis 서버에서 실행하는 Lua script 모음
+
+여러 번의 Redis 왕복이 필요한 작업을 script 한 번으로 처리하기 위해 사용한다.
+script는 EVALSHA로 실행되며, 서버에 캐시가 없으면 redis-py가 자동으로 다시 로드한다.
+"""
+
+# packed 형식(FACEAI_TASK_STORAGE = 'packed')의 이미지 목록을 HGETALL 결과와 같은 형태로 변환하는 Lua 함수
+#   packed: '첫 이미지 id\0path\0path...' (이미지 id는 연속), 이미지가 없으면 ''
+_UNPACK_IMAGES = """
+local function unpack_images(packed, ftpid, create_time)
+    local imglist = {}
+    local pos = string.find(packed, '\\0', 1, true)
+    if not pos then
+        return imglist
+    end
+    local img_id = tonumber(string.sub(packed, 1, pos - 1))
+    while pos do
+        local next_pos = string.find(packed, '\\0', pos + 1, true)
+        local path = string.sub(packed, pos + 1, (next_pos or 0) - 1)
+        imglist[#imglist + 1] = {'id', string.format('%d', img_id), 'path', path,
+                                 'ftpid', ftpid, 'create_time', create_time}
+        img_id = img_id + 1
+        pos = next_pos
+    end
+    return imglist
+end
+"""
+
+# task 하나를 처리중 상태로 변경하고 이미지 정보와 함께 리턴하는 Lua 함수
+# (task가 만료되었거나 done status(완료/중단)이면 nil)
+#   done: {[status] = true, ...} - reaper가 다시 queue에 넣은 후 늦게 결과가 저장된 task는 다시 배분하지 않는다
+# hash 형식(imgstr + ftp_img:<id>)과 packed 형식(imgs)을 모두 읽는다
+_FETCH_TASK = _UNPACK_IMAGES + """
+local function fetch_task(task_key, status, img_prefix, now, done)
+    local task = redis.call('HMGET', task_key, 'token', 'imgstr', 'imgs', 'ftpid', 'create_time', 'status')
+    if not task[1] or (task[6] and done[task[6]]) then
+        return nil
+    end
+    redis.call('HSET', task_key, 'status', status, 'dispatch_time', now)
+    local imglist = {}
+    if task[3] then
+        imglist = unpack_images(task[3], task[4], task[5])
+    elseif task[2] then
+        for imgid in string.gmatch(task[2], '[^#]+') do
+            imglist[#imglist + 1] = redis.call('HGETALL', img_prefix .. imgid)
+        end
+    end
+    return {task[1], imglist}
+end
+"""
+
+# ftpid의 priority/tenant lane에서 weighted fair selection으로 task를 꺼내는 Lua 함수 (list/stream backend 공용)
+#   lane 이름은 'priority|tenant', queue key는 queue prefix .. ftpid .. '|' .. lane
+#   (기본 lane(기본 priority, tenant 없음)은 기존 queue key(queue prefix .. ftpid)를 그대로 사용)
+#   1. task가 있는 lane 중 ARGV[5]초 이상 배분되지 않은 lane에서 먼저 하나씩 꺼낸다 (anti-starvation)
+#   2. 나머지는 smooth weighted round robin으로 lane별 개수를 정해서 꺼낸다. lane weight는 priority weight를
+#      같은 priority의 lane(tenant) 개수로 나눈 값이고, 선택 상태는 KEYS[2]에 보관해서 다음 배분에 이어서 사용한다.
+#      개수만큼 꺼내지 못한 lane이 있으면 남은 개수를 나머지 lane으로 다시 나눈다.
+#      이미지 budget이 있으면 앞 lane이 budget을 다 쓰지 않도록 선택한 순서대로 하나씩 꺼낸다.
+#   KEYS[1]: lane 목록 (TASK_LANE_PREFIX + ftpid)
+#   KEYS[2]: lane 선택 상태 (TASK_LANE_STATE_PREFIX + ftpid)
+#   ARGV[1]: queue key prefix
+#   ARGV[2]: ftpid
+#   ARGV[3]: 읽어올 task 개수
+#   ARGV[4]: 현재 timestamp
+#   ARGV[5]: anti-starvation 기준 시간 (초)
+#   ARGV[6]: lane 목록/상태 보유 기간 (초)
+#   ARGV[7]: priority별 weight ('high=8 normal=4 low=1')
+#   ARGV[8]: 기본 priority
+#   ARGV[9]: 남은 이미지 수 budget (0이면 제한 없음)
+#   ARGV[10]: 남은 이미지 크기 budget (이미지 path byte 합계, 0이면 제한 없음)
+#   ARGV[11]: '1'이면 첫 task는 budget보다 커도 꺼낸다 (token은 나누지 않으므로)
+#   has_backlog(queue_key): lane에 task가 있을 수 있으면 true
+#   take(queue_key, count, result): 최대 count개를 꺼내서 result에 추가하고 꺼낸 개수(만료된 task 포함)를 리턴
+#       꺼내기 전에 task마다 budget_admit(task_key, img_prefix)로 확인하고, false이면 그 task부터는 꺼내지 않는다
+# 리턴: {lane 목록, {{token, {{field, value, ...}, ...}}, ...}, budget 때문에 멈췄으면 1}
+_DISPATCH_LANES = """
+local budget = {images = tonumber(ARGV[9]), bytes = tonumber(ARGV[10]), first = ARGV[11] == '1', full = false}
+budget.limit_images = budget.images > 0
+budget.limit_bytes = budget.bytes > 0
+budget.limited = budget.limit_images or budget.limit_bytes
+
+-- task의 이미지 수와 이미지 path 크기 합계 (만료된 task는 0, 0)
+local function task_size(task_key, img_prefix)
+    local task = redis.call('HMGET', task_key, 'imgstr', 'imgs')
+    local images, size = 0, 0
+    if task[2] then
+        -- packed: '첫 이미지 id\\0path\\0path...'
+        local first = string.find(task[2], '\\0', 1, true)
+        local pos = first
+        while pos do
+            images = images + 1
+            pos = string.find(task[2], '\\0', pos + 1, true)
+        end
+        if first then
+            size = #task[2] - first + 1 - images
+        end
+    elseif task[1] then
+        for imgid in string.gmatch(task[1], '[^#]+') do
+            images = images + 1
+            if budget.limit_bytes then
+                size = size + redis.call('HSTRLEN', img_prefix .. imgid, 'path')
+            end
+        end
+    end
+    return images, size
+end
+
+-- task를 꺼낼 수 있으면 budget에서 빼고 true, budget을 넘으면 budget.full로 표시하고 false
+local function budget_admit(task_key, img_prefix)
+    if not budget.limited then
+        return true
+    end
+    if budget.full then
+        return false
+    end
+    local images, size = task_size(task_key, img_prefix)
+    if not budget.first and ((budget.limit_images and images > budget.images)
+            or (budget.limit_bytes and size > budget.bytes)) then
+        budget.full = true
+        return false
+    end
+    budget.first = false
+    budget.images = budget.images - images
+    budget.bytes = budget.bytes - size
+    if (budget.limit_images and budget.images <= 0) or (budget.limit_bytes and budget.bytes <= 0) then
+        budget.full = true
+    end
+    return true
+end
+
+local function dispatch_lanes(has_backlog, take)
+    local ftpid, now = ARGV[2], tonumber(ARGV[4])
+    local default_lane = ARGV[8] .. '|'
+    local weights = {}
+    for priority, weight in string.gmatch(ARGV[7], '([^%s=]+)=(%S+)') do
+        weights[priority] = tonumber(weight)
+    end
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - tonumber(ARGV[6]))
+    local lanes = redis.call('ZRANGE', KEYS[1], 0, -1)
+    local result = {}
+    local remaining = tonumber(ARGV[3])
+
+    local function queue_key(lane)
+        if lane == default_lane then
+            return ARGV[1] .. ftpid
+        end
+        return ARGV[1] .. ftpid .. '|' .. lane
+    end
+
+    local candidates = {}
+    if has_backlog(queue_key(default_lane)) then
+        candidates[1] = default_lane
+    end
+    for _, lane in ipairs(lanes) do
+        if lane ~= default_lane and has_backlog(queue_key(lane)) then
+            candidates[#candidates + 1] = lane
+        end
+    end
+    -- lane이 하나뿐이면 선택할 필요가 없다 (lane을 사용하지 않는 ftpid)
+    if #candidates <= 1 then
+        if #candidates == 1 then
+            take(queue_key(candidates[1]), remaining, result)
+        end
+        return {lanes, result, budget.full and 1 or 0}
+    end
+
+    local active = {}
+    for _, lane in ipairs(candidates) do
+        active[lane] = true
+    end
+    -- count개를 다 꺼내면 true, lane이 비면 선택 상태를 지우고 false (budget 때문에 멈춘 lane은 그대로 둔다)
+    local function serve(lane, count)
+        local taken = take(queue_key(lane), count, result)
+        remaining = remaining - taken
+        if taken < count and not budget.full then
+            active[lane] = nil
+            redis.call('HDEL', KEYS[2], 'cw:' .. lane, 'seen:' .. lane)
+            return false
+        end
+        redis.call('HSET', KEYS[2], 'seen:' .. lane, now)
+        return true
+    end
+
+    -- 1. anti-starvation: 오래 기다린 lane부터 하나씩
+    local starved = {}
+    for _, lane in ipairs(candidates) do
+        local seen = tonumber(redis.call('HGET', KEYS[2], 'seen:' .. lane))
+        if not seen then
+            redis.call('HSET', KEYS[2], 'seen:' .. lane, now)
+        elseif now - seen >= tonumber(ARGV[5]) then
+            starved[#starved + 1] = {lane, seen}
+        end
+    end
+    table.sort(starved, function(a, b) return a[2] < b[2] end)
+    for _, item in ipairs(starved) do
+        if remaining <= 0 or budget.full then
+            break
+        end
+        serve(item[1], 1)
+    end
+
+    -- 2. smooth weighted round robin
+    while remaining > 0 and not budget.full do
+        local tenants = {}
+        for _, lane in ipairs(candidates) do
+            if active[lane] then
+                local priority = string.match(lane, '^[^|]*')
+                tenants[priority] = (tenants[priority] or 0) + 1
+            end
+        end
+        local selected, total = {}, 0
+        for _, lane in ipairs(candidates) do
+            if active[lane] then
+                local priority = string.match(lane, '^[^|]*')
+                local weight = (weights[priority] or weights[ARGV[8]] or 1) / tenants[priority]
+                if weight > 0 then
+                    local cw = tonumber(redis.call('HGET', KEYS[2], 'cw:' .. lane)) or 0
+                    selected[#selected + 1] = {lane, weight, cw, 0}
+                    total = total + weight
+                end
+            end
+        end
+        -- weight 0인 lane만 남으면 같은 비율로 나눈다
+        if #selected == 0 then
+            for _, lane in ipairs(candidates) do
+                if active[lane] then
+                    local cw = tonumber(redis.call('HGET', KEYS[2], 'cw:' .. lane)) or 0
+                    selected[#selected + 1] = {lane, 1, cw, 0}
+                    total = total + 1
+                end
+            end
+        end
+        if #selected == 0 then
+            break
+        end
+        local order = {}
+        for _ = 1, remaining do
+            local best = nil
+            for _, item in ipairs(selected) do
+                item[3] = item[3] + item[2]
+                if not best or item[3] > best[3] then
+                    best = item
+                end
+            end
+            best[3] = best[3] - total
+            best[4] = best[4] + 1
+            order[#order + 1] = best[1]
+        end
+        local exhausted = false
+        for _, item in ipairs(selected) do
+            redis.call('HSET', KEYS[2], 'cw:' .. item[1], item[3])
+        end
+        if budget.limited then
+            for _, lane in ipairs(order) do
+                if budget.full then
+                    break
+                end
+                if active[lane] and not serve(lane, 1) then
+                    exhausted = true
+                end
+            end
+        else
+            for _, item in ipairs(selected) do
+                if item[4] > 0 and not serve(item[1], item[4]) then
+                    exhausted = true
+                end
+            end
+        end
+        if not exhausted then
+            break
+        end
+    end
+    redis.call('EXPIRE', KEYS[2], ARGV[6])
+    return {lanes, result, budget.full and 1 or 0}
+end
+"""
+
+# task 배분 script (list backend)
+#   KEYS[1..2], ARGV[1..11]: _DISPATCH_LANES 참고 (ARGV[1]: TASK_QUEUE_PREFIX)
+#   KEYS[3]: pedding task zset (PEDDING_TASK_ZSET)
+#   ARGV[12]: 처리 기한 timestamp (pedding zset score = 현재 시간 + visibility timeout)
+#   ARGV[13]: 변경할 status (STATUS.PENDDING)
+#   ARGV[14]: 이미지 정보 key prefix (FTP_IMAGE_PREFIX)
+#   ARGV[15..16]: 배분하지 않을 status (STATUS.COMPLETE, STATUS.ABORT)
+# 리턴: {lane 목록, {{token, {{field, value, ...}, ...}}, ...}, budget 때문에 멈췄으면 1}
+DISPATCH_TASKS = _FETCH_TASK + _DISPATCH_LANES + """
+local done = {[ARGV[15]] = true, [ARGV[16]] = true}
+
+local function has_backlog(queue_key)
+    return redis.call('LLEN', queue_key) > 0
+end
+
+local function take(queue_key, count, result)
+    -- budget이 있으면 head부터 조금씩 읽어서 budget 안의 task만 꺼낸다
+    local chunk = budget.limited and math.min(count, 16) or count
+    local taken = 0
+    while taken < count do
+        local size = math.min(chunk, count - taken)
+        local items = redis.call('LRANGE', queue_key, taken, taken + size - 1)
+        for _, task_key in ipairs(items) do
+            if not budget_admit(task_key, ARGV[14]) then
+                break
+            end
+            taken = taken + 1
+            -- 만료되었거나 이미 완료된 task는 건너뛴다 (LTRIM으로 queue에서 지운다)
+            local task = fetch_task(task_key, ARGV[13], ARGV[14], ARGV[4], done)
+            if task then
+                redis.call('ZADD', KEYS[3], ARGV[12], task[1])
+                result[#result + 1] = task
+            end
+        end
+        if #items < size or budget.full then
+            break
+        end
+    end
+    if taken > 0 then
+        redis.call('LTRIM', queue_key, taken, -1)
+    end
+    return taken
+end
+
+return dispatch_lanes(has_backlog, take)
+"""
+
+# stream entry 하나의 task를 처리중 상태로 변경하는 Lua 함수, 만료되었거나 이미 완료된 task는 ack 처리 (stream backend)
+_STREAM_FETCH_ENTRY = """
+local function fetch_entry(stream_key, queue, group, entry_id, task_key, status, img_prefix, now, done)
+    local task = fetch_task(task_key, status, img_prefix, now, done)
+    if task then
+        -- ack할 때 사용할 stream 정보
+        redis.call('HSET', task_key, 'queue', queue, 'entry_id', entry_id)
+    else
+        -- 만료되었거나 이미 완료된 task는 바로 ack 처리
+        redis.call('XACK', stream_key, group, entry_id)
+        redis.call('XDEL', stream_key, entry_id)
+    end
+    return task
+end
+"""
+
+# task 배분 script (stream backend): lane별 stream에서 XREADGROUP으로 읽는다
+#   KEYS[1..2], ARGV[1..11]: _DISPATCH_LANES 참고 (ARGV[1]: TASK_STREAM_PREFIX)
+#   ARGV[12]: consumer group
+#   ARGV[13]: consumer
+#   ARGV[14]: 변경할 status (STATUS.PENDDING)
+#   ARGV[15]: 이미지 정보 key prefix (FTP_IMAGE_PREFIX)
+#   ARGV[16..17]: 배분하지 않을 status (STATUS.COMPLETE, STATUS.ABORT)
+# 리턴: DISPATCH_TASKS와 동일
+STREAM_DISPATCH_TASKS = _FETCH_TASK + _STREAM_FETCH_ENTRY + _DISPATCH_LANES + """
+local done = {[ARGV[16]] = true, [ARGV[17]] = true}
+
+local function has_backlog(stream_key)
+    return redis.call('XLEN', stream_key) > 0
+end
+
+-- consumer group이 아직 읽지 않은 entry를 최대 count개 읽는다 (XREADGROUP '>'가 읽을 entry와 같은 순서)
+local function peek_entries(stream_key, count)
+    -- consumer group이 아직 없으면 take에서 '0'부터 읽도록 만든다
+    local last_id = '0-0'
+    for _, group in ipairs(redis.call('XINFO', 'GROUPS', stream_key)) do
+        local info = {}
+        for i = 1, #group, 2 do
+            info[group[i]] = group[i + 1]
+        end
+        if info['name'] == ARGV[12] then
+            last_id = info['last-delivered-id']
+        end
+    end
+    local entries = redis.call('XRANGE', stream_key, last_id, '+', 'COUNT', count + 1)
+    if entries[1] and entries[1][1] == last_id then
+        table.remove(entries, 1)
+    end
+    return entries
+end
+
+local function take(stream_key, count, result)
+    if budget.limited then
+        -- XREADGROUP은 읽은 entry를 바로 pending에 넣으므로 budget 안의 개수를 먼저 정한다
+        local admitted = 0
+        for i, entry in ipairs(peek_entries(stream_key, count)) do
+            if i > count or not budget_admit(entry[2][2], ARGV[15]) then
+                break
+            end
+            admitted = admitted + 1
+        end
+        if admitted == 0 then
+            return 0
+        end
+        count = admitted
+    end
+    local args = {'XREADGROUP', 'GROUP', ARGV[12], ARGV[13], 'COUNT', count, 'STREAMS', stream_key, '>'}
+    local reply = redis.pcall(unpack(args))
+    if type(reply) == 'table' and reply.err then
+        -- consumer group이 없으면(NOGROUP) 만들고 다시 읽는다 (다른 오류는 다시 읽을 때 그대로 발생)
+        redis.pcall('XGROUP', 'CREATE', stream_key, ARGV[12], '0', 'MKSTREAM')
+        reply = redis.call(unpack(args))
+    end
+    if not reply then
+        return 0
+    end
+    local queue = string.sub(stream_key, #ARGV[1] + 1)
+    local entries = reply[1][2]
+    for _, entry in ipairs(entries) do
+        local task = fetch_entry(stream_key, queue, ARGV[12], entry[1], entry[2][2], ARGV[14], ARGV[15], ARGV[4],
+                                 done)
+        if task then
+            result[#result + 1] = task
+        end
+    end
+    return #entries
+end
+
+return dispatch_lanes(has_backlog, take)
+"""
+
+# long-poll(XREADGROUP BLOCK)로 읽어온 stream entry의 task 정보를 조회하는 script (stream backend)
+#   KEYS[1]: task stream (TASK_STREAM_PREFIX + queue 이름)
+#   ARGV[1]: consumer group
+#   ARGV[2]: 변경할 status (STATUS.PENDDING)
+#   ARGV[3]: 이미지 정보 key prefix (FTP_IMAGE_PREFIX)
+#   ARGV[4]: queue 이름 (ftpid 또는 'ftpid|priority|tenant')
+#   ARGV[5]: 현재 timestamp
+#   ARGV[6..7]: 배분하지 않을 status (STATUS.COMPLETE, STATUS.ABORT)
+#   ARGV[8..]: entry id, task key 반복
+# 리턴: {{token, {{field, value, ...}, ...}}, ...}
+STREAM_FETCH_TASKS = _FETCH_TASK + _STREAM_FETCH_ENTRY + """
+local done = {[ARGV[6]] = true, [ARGV[7]] = true}
+local result = {}
+for i = 8, #ARGV, 2 do
+    local task = fetch_entry(KEYS[1], ARGV[4], ARGV[1], ARGV[i], ARGV[i + 1], ARGV[2], ARGV[3], ARGV[5], done)
+    if task then
+        result[#result + 1] = task
+    end
+end
+return result
+"""
+
+# 처리 완료된 task를 stream에서 ack하는 script (stream backend)
+#   ARGV[1]: consumer group
+#   ARGV[2]: task stream prefix (TASK_STREAM_PREFIX)
+#   ARGV[3]: task 정보 key prefix (TASK_INFO_PREFIX)
+#   ARGV[4..]: token
+# 리턴: ack된 개수
+STREAM_ACK_TASKS = """
+local acked = 0
+for i = 4, #ARGV do
+    -- queue 필드가 없으면 이전 버전이 배분한 task (ftpid의 stream)
+    local task = redis.call('HMGET', ARGV[3] .. ARGV[i], 'queue', 'ftpid', 'entry_id')
+    local queue = task[1] or task[2]
+    if queue and task[3] then
+        local stream_key = ARGV[2] .. queue
+        acked = acked + redis.call('XACK', stream_key, ARGV[1], task[3])
+        redis.call('XDEL', stream_key, task[3])
+    end
+end
+return acked
+"""
+
+# ftpid의 배분 대기중인 task 개수(모든 lane 합계)를 구하는 Lua 함수 (list/stream backend 공용)
+_QUEUE_DEPTH = """
+local function queue_depth(queue_prefix, lane_prefix, backend, group, ftpid)
+    local names = {ftpid}
+    for _, lane in ipairs(redis.call('ZRANGE', lane_prefix .. ftpid, 0, -1)) do
+        names[#names + 1] = ftpid .. '|' .. lane
+    end
+    local depth = 0
+    for _, name in ipairs(names) do
+        local queue_key = queue_prefix .. name
+        if backend == 'stream' then
+            local length = redis.call('XLEN', queue_key)
+            if length > 0 then
+                -- ack된 entry는 삭제되므로 배분 대기 = 전체 - 처리중(pending)
+                local pending = redis.pcall('XPENDING', queue_key, group)
+                if type(pending) == 'table' and not pending.err then
+                    length = length - pending[1]
+                end
+            end
+            depth = depth + length
+        else
+            depth = depth + redis.call('LLEN', queue_key)
+        end
+    end
+    return depth
+end
+"""
+
+# ftpid별 배분 대기중인 task 개수를 조회하는 script (work stealing 대상 선택)
+#   ARGV[1]: queue key prefix (list: TASK_QUEUE_PREFIX, stream: TASK_STREAM_PREFIX)
+#   ARGV[2]: lane 목록 key prefix (TASK_LANE_PREFIX)
+#   ARGV[3]: queue backend ('list' 또는 'stream')
+#   ARGV[4]: consumer group (stream backend)
+#   ARGV[5..]: ftpid
+# 리턴: ftpid 순서대로 모든 lane의 대기 task 개수 합계
+QUEUE_DEPTHS = _QUEUE_DEPTH + """
+local depths = {}
+for i = 5, #ARGV do
+    depths[#depths + 1] = queue_depth(ARGV[1], ARGV[2], ARGV[3], ARGV[4], ARGV[i])
+end
+return depths
+"""
+
+# 업로드 admission control: ftpid별/client별 이미지 수 token bucket과 ftpid별 queue 길이 quota를 확인하고,
+# 모두 통과하면 token을 차감한다 (하나라도 넘으면 아무것도 차감하지 않는다)
+#   상태 hash (ARGV[5] .. 'ftpid:' .. ftpid, ARGV[5] .. 'client:' .. client)
+#     tokens, ts: token bucket의 남은 token과 마지막 갱신 시간
+#     depth, depth_ts, admitted: 마지막으로 조회한 queue 길이, 조회 시간, 그 이후 허용한 task 개수
+#     drain: queue 길이 변화로 추정한 배분 속도 (task/초, 지수 이동 평균)
+#   burst보다 큰 업로드는 bucket이 가득 찼을 때 허용하고 token을 음수로 만든다 (다음 업로드가 그만큼 기다린다)
+#   ARGV[1..4]: QUEUE_DEPTHS의 ARGV[1..4]
+#   ARGV[5]: 상태 key prefix (INGEST_STATE_PREFIX)
+#   ARGV[6]: 현재 시간, ARGV[7]: 상태 key 보관 시간 (초), ARGV[8]: 최대 Retry-After (초)
+#   ARGV[9..12]: client, 이미지 개수, rate (초당 이미지 수), burst (client가 '' 또는 rate가 0이면 client 제한 없음)
+#   ARGV[13..]: ftpid별 7개 - ftpid, task 개수, 이미지 개수, rate, burst, 최대 queue 길이 (0이면 제한 없음),
+#               배분 속도를 아직 모를 때 queue 길이 초과의 Retry-After (초)
+# 리턴: {} 허용, 거절: {Retry-After(ms), 이유('rate', 'client_rate', 'queue'), ftpid 또는 client}
+ADMIT_UPLOADS = _QUEUE_DEPTH + """
+local now = tonumber(ARGV[6])
+local max_retry = tonumber(ARGV[8])
+local states = {}
+
+local function bucket(key, rate, burst, amount)
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    tokens = math.min(burst, tokens + math.max(0, now - (tonumber(state[2]) or now)) * rate)
+    states[#states + 1] = {key, 'tokens', tokens - amount, 'ts', now}
+    if tokens >= math.min(amount, burst) then
+        return nil
+    end
+    return (math.min(amount, burst) - tokens) / rate
+end
+
+local function quota(key, ftpid, tasks, max_queue, default_retry)
+    if max_queue <= 0 then
+        return nil
+    end
+    local depth = queue_depth(ARGV[1], ARGV[2], ARGV[3], ARGV[4], ftpid)
+    local state = redis.call('HMGET', key, 'depth', 'depth_ts', 'admitted', 'drain')
+    local drain = tonumber(state[4])
+    local elapsed = now - (tonumber(state[2]) or now)
+    if state[1] and elapsed >= 1 then
+        local drained = math.max(0, (tonumber(state[1]) + (tonumber(state[3]) or 0) - depth) / elapsed)
+        drain = drain and (drain + drained) / 2 or drained
+        redis.call('HSET', key, 'depth', depth, 'depth_ts', now, 'admitted', 0, 'drain', drain)
+    elseif not state[1] then
+        redis.call('HSET', key, 'depth', depth, 'depth_ts', now, 'admitted', 0)
+    end
+    redis.call('EXPIRE', key, ARGV[7])
+    if depth + tasks <= max_queue or depth == 0 then
+        return nil
+    end
+    if not drain or drain <= 0 then
+        return default_retry
+    end
+    return (depth + tasks - max_queue) / drain
+end
+
+local function reject(retry, reason, subject)
+    return {math.floor(math.min(max_retry, retry) * 1000), reason, subject}
+end
+
+for i = 13, #ARGV, 7 do
+    local ftpid, tasks, images = ARGV[i], tonumber(ARGV[i + 1]), tonumber(ARGV[i + 2])
+    local rate, burst, max_queue = tonumber(ARGV[i + 3]), tonumber(ARGV[i + 4]), tonumber(ARGV[i + 5])
+    local key = ARGV[5] .. 'ftpid:' .. ftpid
+    local retry = quota(key, ftpid, tasks, max_queue, tonumber(ARGV[i + 6]))
+    if retry then
+        return reject(retry, 'queue', ftpid)
+    end
+    if rate > 0 then
+        retry = bucket(key, rate, burst, images)
+        if retry then
+            return reject(retry, 'rate', ftpid)
+        end
+    end
+    states[#states + 1] = {key, 'admitted', tasks}
+end
+
+if ARGV[9] ~= '' and tonumber(ARGV[11]) > 0 then
+    local retry = bucket(ARGV[5] .. 'client:' .. ARGV[9], tonumber(ARGV[11]), tonumber(ARGV[12]), tonumber(ARGV[10]))
+    if retry then
+        return reject(retry, 'client_rate', ARGV[9])
+    end
+end
+
+for _, state in ipairs(states) do
+    if state[2] == 'admitted' then
+        redis.call('HINCRBY', state[1], 'admitted', state[3])
+    else
+        redis.call('HSET', state[1], state[2], state[3], state[4], state[5])
+    end
+    redis.call('EXPIRE', state[1], ARGV[7])
+end
+return {}
+"""
+
+# ADMIT_UPLOADS로 차감한 token과 admitted를 되돌리는 script
+# (bulk 업로드의 ftpid가 여러 Redis node에 있을 때, 앞의 node에서 허용한 후 다음 node에서 거절된 경우)
+#   ARGV: ADMIT_UPLOADS와 같음
+# 리턴: 0
+REFUND_UPLOADS = """
+local function refund(key, burst, amount)
+    local tokens = tonumber(redis.call('HGET', key, 'tokens'))
+    if tokens then
+        redis.call('HSET', key, 'tokens', math.min(burst, tokens + amount))
+    end
+end
+
+for i = 13, #ARGV, 7 do
+    local key = ARGV[5] .. 'ftpid:' .. ARGV[i]
+    local admitted = tonumber(redis.call('HGET', key, 'admitted'))
+    if admitted then
+        redis.call('HSET', key, 'admitted', math.max(0, admitted - tonumber(ARGV[i + 1])))
+    end
+    if tonumber(ARGV[i + 3]) > 0 then
+        refund(key, tonumber(ARGV[i + 4]), tonumber(ARGV[i + 2]))
+    end
+end
+
+if ARGV[9] ~= '' and tonumber(ARGV[11]) > 0 then
+    refund(ARGV[5] .. 'client:' .. ARGV[9], tonumber(ARGV[12]), tonumber(ARGV[10]))
+end
+return 0
+"""
+
+# task를 처음 넣었던 lane의 queue에 다시 넣는 Lua 함수
+_PUSH_TASK = """
+local function push_task(queue_prefix, backend, ftpid, task_key, lane_prefix, stream_set, now)
+    local queue = ftpid
+    local lane = redis.call('HGET', task_key, 'lane')
+    if lane then
+        queue = ftpid .. '|' .. lane
+        redis.call('ZADD', lane_prefix .. ftpid, now, lane)
+    end
+    if backend == 'stream' then
+        redis.call('XADD', queue_prefix .. queue, '*', 'task', task_key)
+        redis.call('SADD', stream_set, queue)
+    else
+        redis.call('RPUSH', queue_prefix .. queue, task_key)
+    end
+end
+"""
+
+# 처리 기한이 지난 task를 다시 queue에 넣거나, 시도 횟수를 넘으면 dead letter queue로 보내는 Lua 함수
+# (이미 COMPLETE된 task는 건너뛴다)
+#   tokens: token 리스트
+#   dead_key: dead letter zset (DEAD_TASK_ZSET)
+#   opt: RETRY_TASKS의 ARGV[1..12]
+# 리턴: {다시 queue에 넣은 개수, {{token, {field, value, ...}}, ...}} (dead letter로 보낸 task의 taskinfo)
+_RETRY_TASKS = _PUSH_TASK + """
+local function retry_tasks(tokens, dead_key, opt)
+    local requeued = 0
+    local dead = {}
+    for _, token in ipairs(tokens) do
+        local task_key = opt[1] .. token
+        local taskinfo = redis.call('HGETALL', task_key)
+        if #taskinfo > 0 and redis.call('HGET', task_key, 'status') ~= opt[10] then
+            local attempts = redis.call('HINCRBY', task_key, 'attempts', 1)
+            local ftpid = redis.call('HGET', task_key, 'ftpid')
+            if ftpid and attempts < tonumber(opt[5]) then
+                redis.call('HSET', task_key, 'status', opt[8])
+                push_task(opt[3], opt[4], ftpid, task_key, opt[11], opt[12], opt[6])
+                requeued = requeued + 1
+            else
+                redis.call('HSET', task_key, 'status', opt[9])
+                redis.call('ZADD', dead_key, opt[6], token)
+                local event_key = opt[2] .. token
+                redis.call('XADD', event_key, 'MAXLEN', 1, '*', 'status', opt[9])
+                redis.call('EXPIRE', event_key, opt[7])
+                dead[#dead + 1] = {token, taskinfo}
+            end
+        end
+    end
+    return {requeued, dead}
+end
+"""
+
+# tokens를 다시 queue에 넣거나 dead letter queue로 보내는 script (stream backend의 reap)
+#   KEYS[1]: dead letter zset (DEAD_TASK_ZSET)
+#   ARGV[1]: task 정보 key prefix (TASK_INFO_PREFIX)
+#   ARGV[2]: 완료 event key prefix (META_EVENT_PREFIX)
+#   ARGV[3]: queue key prefix (list: TASK_QUEUE_PREFIX, stream: TASK_STREAM_PREFIX)
+#   ARGV[4]: queue backend ('list' 또는 'stream')
+#   ARGV[5]: 최대 시도 횟수
+#   ARGV[6]: 현재 timestamp
+#   ARGV[7]: event 보유 기간 (초)
+#   ARGV[8]: STATUS.CREATE
+#   ARGV[9]: STATUS.ABORT
+#   ARGV[10]: STATUS.COMPLETE
+#   ARGV[11]: lane 목록 key prefix (TASK_LANE_PREFIX)
+#   ARGV[12]: stream 목록 (TASK_STREAM_SET)
+#   ARGV[13..]: token
+# 리턴: retry_tasks의 리턴
+RETRY_TASKS = _RETRY_TASKS + """
+local tokens = {}
+for i = 13, #ARGV do
+    tokens[#tokens + 1] = ARGV[i]
+end
+return retry_tasks(tokens, KEYS[1], ARGV)
+"""
+
+# 처리 기한이 지난 pending task를 PEDDING_TASK_ZSET에서 꺼내서 다시 queue에 넣거나 dead letter queue로 보내는 script
+# (list backend의 reap); pending에서 제거와 재시도를 script 한 번으로 처리해서 중간에 task를 잃지 않는다
+#   KEYS[1]: dead letter zset (DEAD_TASK_ZSET)
+#   KEYS[2]: pedding task zset
+#   ARGV[1..12]: RETRY_TASKS와 같음 (ARGV[6]: 현재 timestamp까지 기한이 지난 task를 꺼낸다)
+#   ARGV[13]: 최대 개수
+# 리턴: {pending에서 제거한 개수, 다시 queue에 넣은 개수, dead letter로 보낸 task의 taskinfo}
+REAP_TASKS = _RETRY_TASKS + """
+local tokens = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[6], 'LIMIT', 0, tonumber(ARGV[13]))
+for i = 1, #tokens, 1000 do
+    redis.call('ZREM', KEYS[2], unpack(tokens, i, math.min(i + 999, #tokens)))
+end
+local result = retry_tasks(tokens, KEYS[1], ARGV)
+return {#tokens, result[1], result[2]}
+"""
+
+# dead letter queue의 task를 다시 queue에 넣는 script
+#   KEYS[1]: dead letter zset (DEAD_TASK_ZSET)
+#   ARGV[1]: task 정보 key prefix (TASK_INFO_PREFIX)
+#   ARGV[2]: 완료 event key prefix (META_EVENT_PREFIX)
+#   ARGV[3]: queue key prefix
+#   ARGV[4]: queue backend ('list' 또는 'stream')
+#   ARGV[5]: STATUS.CREATE
+#   ARGV[6]: lane 목록 key prefix (TASK_LANE_PREFIX)
+#   ARGV[7]: stream 목록 (TASK_STREAM_SET)
+#   ARGV[8]: 현재 timestamp
+#   ARGV[9..]: token
+# 리턴: 다시 queue에 넣은 token 리스트
+REQUEUE_DEAD_TASKS = _PUSH_TASK + """
+local requeued = {}
+for i = 9, #ARGV do
+    local token = ARGV[i]
+    local task_key = ARGV[1] .. token
+    if redis.call('ZREM', KEYS[1], token) == 1 then
+        local ftpid = redis.call('HGET', task_key, 'ftpid')
+        if ftpid then
+            redis.call('HSET', task_key, 'status', ARGV[5], 'attempts', 0)
+            -- ABORT event를 지워서 info의 wait가 다시 완료를 기다리도록 한다
+            redis.call('DEL', ARGV[2] .. token)
+            push_task(ARGV[3], ARGV[4], ftpid, task_key, ARGV[6], ARGV[7], ARGV[8])
+            requeued[#requeued + 1] = token
+        end
+    end
+end
+return requeued
+"""
+
+# hash 형식 task를 packed 형식으로 변환하는 script (python manage.py taskstorage --migrate)
+# 이미지 id가 연속이고 ftpid, create_time이 task와 같은 경우만 변환하고 나머지는 그대로 둔다
+#   ARGV[1]: 이미지 정보 key prefix (FTP_IMAGE_PREFIX)
+#   ARGV[2..]: task key
+# 리턴: {변환한 개수, 건너뛴 개수}
+PACK_TASKS = """
+local migrated, skipped = 0, 0
+for i = 2, #ARGV do
+    local task_key = ARGV[i]
+    local task = redis.call('HMGET', task_key, 'imgstr', 'ftpid', 'create_time')
+    if task[1] then
+        local ok = task[2] ~= false
+        local first_id, next_id = nil, nil
+        local parts, img_keys = {}, {}
+        for imgid in string.gmatch(task[1], '[^#]+') do
+            local img_key = ARGV[1] .. imgid
+            local img = redis.call('HMGET', img_key, 'path', 'ftpid', 'create_time')
+            if not img[1] or img[2] ~= task[2] or img[3] ~= task[3]
+                    or (next_id and tonumber(imgid) ~= next_id) then
+                ok = false
+                break
+            end
+            first_id = first_id or imgid
+            next_id = tonumber(imgid) + 1
+            parts[#parts + 1] = img[1]
+            img_keys[#img_keys + 1] = img_key
+        end
+        if ok then
+            local packed = ''
+            if first_id then
+                packed = first_id .. '\\0' .. table.concat(parts, '\\0')
+            end
+            redis.call('HSET', task_key, 'imgs', packed)
+            redis.call('HDEL', task_key, 'imgstr')
+            for j = 1, #img_keys, 1000 do
+                redis.call('DEL', unpack(img_keys, j, math.min(j + 999, #img_keys)))
+            end
+            migrated = migrated + 1
+        else
+            skipped = skipped + 1
+        end
+    end
+end
+return {migrated, skipped}
+"""
+
+# lease 연장 script: 소유자가 맞으면 PEXPIRE
+#   KEYS[1]: lease key, ARGV[1]: 소유자 id, ARGV[2]: ttl(ms)
+RENEW_LEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# lease 반납 script: 소유자가 맞으면 DEL
+#   KEYS[1]: lease key, ARGV[1]: 소유자 id
+RELEASE_LEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_registered = {}
+
+
+def run_script(conn, source, keys=(), args=()):
+    """ source에 해당하는 script를 실행한다. (process당 한 번만 등록)
+
+    Args:
+        conn: redis connection 또는 pipeline
+        source: Lua script 소스
+        keys: KEYS 목록
+        args: ARGV 목록
+
+    Returns: script의 리턴 값
+    """
+    script = _registered.get(source)
+    if script is None:
+        script = conn.register_script(source)
+        _registered[source] = script
+    return script(keys=list(keys), args=list(args), client=conn)
+
+
+_registered_async = {}
+
+
+async def arun_script(conn, source, keys=(), args=()):
+    """ run_script의 asyncio 버전 (redis.asyncio connection 용) """
+    script = _registered_async.get(source)
+    if script is None:
+        script = conn.register_script(source)
+        _registered_async[source] = script
+    return await script(keys=list(keys), args=list(args), client=conn)
+
+
+def pairs_to_dict(pairs):
+    """ HGETALL의 raw 결과([field, value, ...])를 dict로 변환 """
+    return dict(zip(pairs[::2], pairs[1::2]))
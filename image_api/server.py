@@ -0,0 +1,154 @@
+"""운영 server (python manage.py serve)
+
+gunicorn master가 WSGI(faceai_central.wsgi) 또는 ASGI(faceai_central.asgi) application을 여러 worker process로 실행한다.
+manage.py runserver는 process 하나(CPU core 하나)만 사용하고 worker 교체(recycling)가 없으므로 개발용으로만 사용한다.
+
+    - wsgi: gthread worker (worker당 settings.FACEAI_SERVER['threads']개 thread, keep-alive connection 유지)
+    - asgi: uvicorn worker (async view; long-polling / SSE connection이 많을 때)
+    - preload: master에서 application을 한 번 import한 뒤 fork (worker 시작이 빠르고 code page를 공유)
+    - max_requests(+jitter)개를 처리한 worker는 새 worker로 교체 (memory 증가 방지)
+    - pending task reaper는 worker마다가 아니라 master가 process 하나로 띄운다 (image_api.reaper; 여러 서버에서
+      띄워도 Redis lease를 가진 하나만 동작)
+
+graceful reload: `kill -HUP <master pid>` 이면 처리 중인 요청을 마친 worker부터 새 worker로 교체하고 reaper도 다시 띄운다.
+preload를 사용하면 HUP은 master가 import한 code를 그대로 쓰므로, 새 code를 배포할 때는 `kill -USR2`로 새 master를
+띄운 뒤 이전 master에 `kill -TERM`을 보낸다 (또는 --no-preload로 실행하면 HUP으로 새 code를 읽는다).
+
+gunicorn(asgi는 uvicorn-worker package도)이 필요하다. (uvicorn.workers.UvicornWorker는 uvicorn 0.30부터 deprecated이고
+uvicorn-worker package로 옮겨졌다)
+"""
+import logging
+import multiprocessing
+import signal
+import subprocess
+import sys
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+try:
+    from uvicorn_worker import UvicornWorker
+except ImportError:
+    UvicornWorker = None
+
+logger = logging.getLogger('api.custom')
+
+# settings.FACEAI_SERVER 기본값 (workers가 0이면 CPU 수)
+SERVER_DEFAULTS = {
+    'bind': '0.0.0.0:8000',
+    'interface': 'wsgi',
+    'workers': 0,
+    'threads': 8,
+    'keepalive': 30,
+    'max_requests': 10000,
+    'max_requests_jitter': 1000,
+    'timeout': 60,
+    'graceful_timeout': 30,
+    'backlog': 2048,
+    'preload': True,
+    'reaper': True,
+}
+ASGI_APPLICATION = 'faceai_central.asgi.application'
+
+
+if UvicornWorker is not None:
+    class AsgiWorker(UvicornWorker):
+        """ AsyncApiApplication은 lifespan event를 사용하지 않는다 """
+        CONFIG_KWARGS = dict(UvicornWorker.CONFIG_KWARGS, lifespan='off')
+
+
+def get_server_config(**overrides):
+    """ settings.FACEAI_SERVER에 overrides(None이 아닌 값)를 덮어쓴 설정 """
+    config = dict(SERVER_DEFAULTS, **getattr(settings, 'FACEAI_SERVER', {}))
+    config.update((key, value) for key, value in overrides.items() if value is not None)
+    if not config['workers']:
+        config['workers'] = multiprocessing.cpu_count()
+    return config
+
+
+class ReaperProcess:
+    """ master에서 `manage.py reaper` process 하나를 관리 (gunicorn server hook) """
+
+    def __init__(self):
+        self.process = None
+
+    def start(self, server=None):
+        if self.process is not None and self.process.poll() is None:
+            return
+        self.process = subprocess.Popen([sys.executable, '-m', 'django', 'reaper'], cwd=settings.BASE_DIR)
+        logger.info("reaper started (pid: %s)", self.process.pid)
+
+    def stop(self, server=None):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            # SIGINT이면 reaper가 lease를 반납하고 끝나므로 다른 서버의 reaper가 바로 이어받는다
+            self.process.send_signal(signal.SIGINT)
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    def restart(self, server=None):
+        self.stop()
+        self.start()
+
+    def check(self, server, worker):
+        """ worker를 띄울 때마다 reaper가 죽었으면 다시 띄운다 """
+        self.start()
+
+
+if BaseApplication is not None:
+    class ApiServer(BaseApplication):
+
+        def __init__(self, config):
+            self.config = config
+            self.reaper = ReaperProcess() if config['reaper'] else None
+            super().__init__()
+
+        def gunicorn_config(self):
+            config = self.config
+            asgi = config['interface'] == 'asgi'
+            options = {
+                'bind': [address.strip() for address in config['bind'].split(',')],
+                'workers': config['workers'],
+                'worker_class': 'image_api.server.AsgiWorker' if asgi else 'gthread',
+                'threads': 1 if asgi else config['threads'],
+                'keepalive': config['keepalive'],
+                'max_requests': config['max_requests'],
+                'max_requests_jitter': config['max_requests_jitter'],
+                'timeout': config['timeout'],
+                'graceful_timeout': config['graceful_timeout'],
+                'backlog': config['backlog'],
+                'preload_app': config['preload'],
+            }
+            if config.get('pidfile'):
+                options['pidfile'] = config['pidfile']
+            if self.reaper is not None:
+                options.update(when_ready=self.reaper.start, pre_fork=self.reaper.check,
+                               on_reload=self.reaper.restart, on_exit=self.reaper.stop)
+            return options
+
+        def load_config(self):
+            for key, value in self.gunicorn_config().items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            if self.config['interface'] == 'asgi':
+                return import_string(getattr(settings, 'ASGI_APPLICATION', ASGI_APPLICATION))
+            return import_string(settings.WSGI_APPLICATION)
+
+
+def run(config):
+    """ get_server_config()의 설정으로 server를 실행한다 (master가 끝날 때까지 리턴하지 않음) """
+    if BaseApplication is None:
+        raise ImproperlyConfigured('manage.py serve requires gunicorn')
+    if config['interface'] == 'asgi' and UvicornWorker is None:
+        raise ImproperlyConfigured("FACEAI_SERVER interface 'asgi' requires uvicorn-worker")
+    ApiServer(config).run()
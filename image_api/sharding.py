@@ -0,0 +1,112 @@
+"""Redis sharding
+
+settings.FACEAI_REDIS_SHARDS에 지정한 Redis node 사이에 key를 나눈다. node는 (CACHES alias, raw CACHES alias) 쌍이다.
+    - task, 이미지, metainfo, 완료 event: token 기준
+    - ftpid별 queue와 pedding/dead letter zset: ftpid 기준
+
+token은 ftpid와 같은 node에 배치되는 값으로 생성하므로(ShardRing.create_token) task 배분/재시도 script가 읽는
+task, 이미지 정보는 항상 queue와 같은 node에 있다. node 배치는 consistent hashing(node당 SHARD_VNODES개의
+virtual node)으로 정하고, 이미지 id는 node별 counter로 할당한다. (id = node index * SHARD_ID_SPAN + counter)
+
+node를 추가하면 일부 token/ftpid의 배치가 바뀌므로 기존 task가 처리(최대 TASK_INFO_AGE)된 후에 추가한다.
+reaper lease 등 cluster에 하나만 있어야 하는 key는 첫 번째 node(control)에 둔다.
+"""
+import bisect
+import hashlib
+from uuid import uuid1
+from django.conf import settings
+from django_redis import get_redis_connection
+from image_api.async_redis import get_async_redis_connection
+from image_api.constants import *
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class Shard:
+
+    def __init__(self, index, alias, raw_alias):
+        self.index = index
+        self.alias = alias
+        self.raw_alias = raw_alias
+
+    def __repr__(self):
+        return 'Shard(%s, %r)' % (self.index, self.alias)
+
+    def conn(self):
+        return get_redis_connection(self.alias)
+
+    def raw_conn(self):
+        """ binary 값을 decode 없이 읽는 connection """
+        return get_redis_connection(self.raw_alias)
+
+    def aconn(self):
+        return get_async_redis_connection(self.alias)
+
+    def araw_conn(self):
+        return get_async_redis_connection(self.raw_alias)
+
+    def image_ids(self, last_id, count):
+        """ 이 node의 counter를 INCRBY count 한 결과(last_id)로 이미지 id 리스트를 만든다 """
+        base = self.index * SHARD_ID_SPAN
+        return [str(base + img_id) for img_id in range(last_id - count + 1, last_id + 1)]
+
+
+class ShardRing:
+
+    def __init__(self, shards, vnodes=SHARD_VNODES):
+        self.shards = shards
+        ring = sorted((_hash('%s#%s' % (shard.alias, i)), shard.index) for shard in shards for i in range(vnodes))
+        self._points = [point for point, _ in ring]
+        self._owners = [index for _, index in ring]
+
+    @property
+    def control(self):
+        return self.shards[0]
+
+    def _lookup(self, key):
+        if len(self.shards) == 1:
+            return self.shards[0]
+        pos = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self.shards[self._owners[pos]]
+
+    def for_token(self, token):
+        return self._lookup(token)
+
+    def for_ftpid(self, ftpid):
+        return self._lookup('ftpid:%s' % ftpid)
+
+    def create_token(self, ftpid):
+        """ ftpid의 queue와 같은 node에 배치되는 token을 생성 (node가 N개이면 평균 N번 생성) """
+        shard = self.for_ftpid(ftpid)
+        while True:
+            token = str(uuid1())
+            if self.for_token(token) is shard:
+                return token
+
+    def _group(self, keys, lookup):
+        groups = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(lookup(key), []).append(i)
+        return list(groups.items())
+
+    def group_tokens(self, tokens):
+        """ Returns: [(shard, [tokens에서의 index, ...]), ...] """
+        return self._group(tokens, self.for_token)
+
+    def group_ftpids(self, ftpids):
+        """ Returns: [(shard, [ftpids에서의 index, ...]), ...] """
+        return self._group(ftpids, self.for_ftpid)
+
+
+_shard_ring = None
+
+
+def get_shard_ring():
+    """ settings.FACEAI_REDIS_SHARDS로 구성한 ShardRing을 리턴 (process당 하나) """
+    global _shard_ring
+    if _shard_ring is None:
+        specs = getattr(settings, 'FACEAI_REDIS_SHARDS', [('default', RAW_REDIS_ALIAS)])
+        _shard_ring = ShardRing([Shard(index, alias, raw_alias) for index, (alias, raw_alias) in enumerate(specs)])
+    return _shard_ring
@@ -0,0 +1,93 @@
+"""ftpid 사이의 work stealing
+
+자기 queue가 빈 FTP서버(worker)가 이미지에 접근할 수 있는 다른 ftpid의 queue에서 task를 가져간다.
+settings.FACEAI_WORK_STEALING에 ftpid별로 이미지에 접근 가능한 ftpid 목록을 지정한 경우만 사용한다. (opt-in)
+
+    FACEAI_WORK_STEALING = {'2': ['1', '3'], '3': ['1']}   # 2번은 1, 3번의 이미지를, 3번은 1번의 이미지를 읽을 수 있다
+
+대기 task가 많은 queue부터, queue마다 대기 task의 최대 절반까지 가져간다. 가져간 task는 원래 ftpid의
+queue/pending에 그대로 속하므로 처리 기한, 재시도, ack는 원래 ftpid 기준으로 처리된다.
+"""
+import asyncio
+from django.conf import settings
+from image_api.constants import *
+from image_api.queues import get_task_queue
+from image_api.sharding import get_shard_ring
+from image_api.validation import normalize_ftpid
+
+
+def get_steal_sources(ftpid):
+    """ ftpid가 task를 가져갈 수 있는 ftpid 목록 (settings.FACEAI_WORK_STEALING) """
+    sources = getattr(settings, 'FACEAI_WORK_STEALING', {}).get(str(ftpid), [])
+    sources = [normalize_ftpid(source) for source in sources]
+    return [source for source in sources if source != str(ftpid)]
+
+
+def plan_steal(depths, limit):
+    """ 가져올 queue와 개수를 정한다
+
+    Args:
+        depths: [(ftpid, 대기 task 개수), ...]
+        limit: 가져올 최대 task 개수
+
+    Returns: 대기 task가 많은 순서로 [(ftpid, 가져올 개수), ...]
+    """
+    min_backlog = getattr(settings, 'FACEAI_STEAL_MIN_BACKLOG', STEAL_MIN_BACKLOG)
+    plan = []
+    for ftpid, depth in sorted(depths, key=lambda item: -item[1]):
+        if limit <= 0 or depth < max(1, min_backlog):
+            break
+        count = min(limit, max(1, depth // 2))
+        plan.append((ftpid, count))
+        limit -= count
+    return plan
+
+
+def steal_tasks(ftpid, limit, consumer=None, budget=None):
+    """ ftpid의 worker가 다른 ftpid의 queue에서 최대 limit개의 task를 가져간다 (budget: queues.TaskBudget)
+
+    Returns: [(원래 ftpid, token, [imginfo, ...]), ...]
+    """
+    sources = get_steal_sources(ftpid)
+    if not sources:
+        return []
+    ring = get_shard_ring()
+    queue = get_task_queue()
+    depths = []
+    for shard, indexes in ring.group_ftpids(sources):
+        shard_sources = [sources[i] for i in indexes]
+        depths.extend(zip(shard_sources, queue.depths(shard.conn(), shard_sources)))
+
+    # stream backend에서는 가져간 worker의 consumer로 배분한다
+    consumer = consumer or 'ftp' + ftpid
+    stolen = []
+    for source, count in plan_steal(depths, limit):
+        if budget is not None and budget.full:
+            break
+        tasklist = queue.dispatch(ring.for_ftpid(source).conn(), source, count, consumer, budget=budget)
+        stolen.extend((source, token, imglist) for token, imglist in tasklist)
+    return stolen
+
+
+async def asteal_tasks(ftpid, limit, consumer=None, budget=None):
+    """ steal_tasks의 asyncio 버전 """
+    sources = get_steal_sources(ftpid)
+    if not sources:
+        return []
+    ring = get_shard_ring()
+    queue = get_task_queue()
+    groups = ring.group_ftpids(sources)
+    replies = await asyncio.gather(*[queue.adepths(shard.aconn(), [sources[i] for i in indexes])
+                                     for shard, indexes in groups])
+    depths = []
+    for (shard, indexes), shard_depths in zip(groups, replies):
+        depths.extend(zip([sources[i] for i in indexes], shard_depths))
+
+    consumer = consumer or 'ftp' + ftpid
+    stolen = []
+    for source, count in plan_steal(depths, limit):
+        if budget is not None and budget.full:
+            break
+        tasklist = await queue.adispatch(ring.for_ftpid(source).aconn(), source, count, consumer, budget=budget)
+        stolen.extend((source, token, imglist) for token, imglist in tasklist)
+    return stolen
@@ -0,0 +1,195 @@
+"""image_api test 공통 부분
+
+API는 benchmarks.lifecycle과 같이 HTTP server 없이 process 안에서 WSGI(ApiWSGIApplication) 또는
+ASGI(AsyncApiApplication) application을 직접 호출하고, Redis는 process 안의 fakeredis를 사용한다
+(benchmarks.lifecycle.configure). FACEAI_TEST_REDIS_URL 환경 변수를 지정하면 fakeredis 대신 그 Redis를 사용한다.
+(test마다 FLUSHDB 하므로 test 전용 Redis/DB를 지정한다)
+
+test class의 backend('list', 'stream')와 interface('wsgi', 'asgi')를 바꾼 subclass를 만들어서 같은 test를
+queue backend와 sync/async view 모두에서 실행한다.
+
+    python manage.py test image_api faceai_client
+"""
+import asyncio
+import io
+import json
+import os
+import unittest
+from urllib.parse import urlencode
+
+from django.test import SimpleTestCase, override_settings
+
+from benchmarks import lifecycle
+from image_api import queues
+from image_api.constants import *
+
+try:
+    import fakeredis
+    from fakeredis.commands_mixins.scripting_mixin import ScriptingCommandsMixin
+    from fakeredis.commands_mixins.streams_mixin import StreamsCommandsMixin
+except ImportError:
+    fakeredis = None
+
+REDIS_URL = os.environ.get('FACEAI_TEST_REDIS_URL')
+
+_fake_server = None
+
+
+def patch_fakeredis():
+    """ fakeredis의 Lua redis.call이 Redis와 다르게 동작하는 부분을 Redis와 같게 맞춘다 (stream backend script)
+
+    - 'XGROUP CREATE', 'XINFO GROUPS' 같은 subcommand를 찾지 못한다
+    - script 안의 XREADGROUP 결과가 RESP2 형식({{key, entries}}, 읽은 entry가 없으면 nil)이 아니다
+    """
+    lua_redis_call = ScriptingCommandsMixin._lua_redis_call
+    xreadgroup_reply = StreamsCommandsMixin._xreadgroup_reply
+
+    def _lua_redis_call(self, lua_runtime, expected_globals, op, *args):
+        if op.lower() in (b'xgroup', b'xinfo') and args:
+            op, args = op + b' ' + args[0], args[1:]
+        return lua_redis_call(self, lua_runtime, expected_globals, op, *args)
+
+    def _xreadgroup_reply(self, res):
+        if getattr(self, '_script_resp', None) == 2:
+            return [[key, entries] for key, entries in res.items()] if res else None
+        return xreadgroup_reply(self, res)
+
+    ScriptingCommandsMixin._lua_redis_call = _lua_redis_call
+    StreamsCommandsMixin._xreadgroup_reply = _xreadgroup_reply
+
+
+def setup_redis():
+    """ test용 Redis로 FACEAI_REDIS_SHARDS를 구성하고 비운다 """
+    global _fake_server
+    if REDIS_URL:
+        # asyncio connection pool은 만든 event loop에서만 사용할 수 있고 test마다 event loop가 다르므로 새로 만든다
+        from image_api import async_redis
+        async_redis._clients.clear()
+        lifecycle.configure(REDIS_URL)
+    else:
+        if fakeredis is None:
+            raise unittest.SkipTest('fakeredis is not installed (or set FACEAI_TEST_REDIS_URL)')
+        if _fake_server is None:
+            patch_fakeredis()
+            _fake_server = fakeredis.FakeServer()
+        lifecycle.configure(lifecycle.FAKE_LOCATION, _fake_server)
+    from image_api.sharding import get_shard_ring
+    get_shard_ring().control.conn().flushdb()
+    queues._task_queue = None
+    queues.StreamTaskQueue._groups.clear()
+
+
+class ApiTestCase(SimpleTestCase):
+    """ Redis를 비우고 API를 직접 호출하는 test """
+    backend = 'list'
+    interface = 'wsgi'
+    # test에서 사용하는 settings (backend와 함께 override_settings로 적용)
+    overrides = {}
+
+    def setUp(self):
+        override = override_settings(FACEAI_TASK_QUEUE_BACKEND=self.backend, **self.overrides)
+        override.enable()
+        self.addCleanup(override.disable)
+        setup_redis()
+        if self.interface == 'asgi':
+            from django.core.asgi import get_asgi_application
+            from image_api.async_app import AsyncApiApplication
+            self.app = AsyncApiApplication(get_asgi_application())
+            self.loop = asyncio.new_event_loop()
+            self.addCleanup(self.loop.close)
+        else:
+            from django.core.wsgi import get_wsgi_application
+            from image_api.wsgi_app import ApiWSGIApplication
+            self.app = ApiWSGIApplication(get_wsgi_application())
+
+    def conn(self):
+        from image_api.sharding import get_shard_ring
+        return get_shard_ring().control.conn()
+
+    def request(self, method, path, params=None, headers=None):
+        """ Returns: (HTTP status, response headers, json 응답 (body가 없으면 None)) """
+        status, response_headers, content = self.raw_request(method, path, params, headers)
+        return status, response_headers, json.loads(content) if content else None
+
+    def raw_request(self, method, path, params=None, headers=None):
+        """ Returns: (HTTP status, response headers, body bytes) """
+        query = urlencode(params or {}) if method == 'GET' else ''
+        body = urlencode(params or {}).encode() if method == 'POST' else b''
+        if self.interface == 'asgi':
+            return self.loop.run_until_complete(self._asgi_request(method, path, query, body, headers or {}))
+        return self._wsgi_request(method, path, query, body, headers or {})
+
+    def _wsgi_request(self, method, path, query, body, headers):
+        environ = {'REQUEST_METHOD': method, 'PATH_INFO': path, 'SCRIPT_NAME': '', 'QUERY_STRING': query,
+                   'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'REMOTE_ADDR': '127.0.0.1',
+                   'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(body),
+                   'CONTENT_TYPE': 'application/x-www-form-urlencoded', 'CONTENT_LENGTH': str(len(body))}
+        for name, value in headers.items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        started = []
+        response = self.app(environ, lambda status, response_headers: started.append((status, response_headers)))
+        try:
+            content = b''.join(response)
+        finally:
+            response.close()
+        status, response_headers = started[0]
+        return int(status.split(' ', 1)[0]), dict(response_headers), content
+
+    async def _asgi_request(self, method, path, query, body, headers):
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(), 'root_path': '',
+                 'client': ('127.0.0.1', 50000),
+                 'headers': [(b'content-type', b'application/x-www-form-urlencoded'),
+                             (b'content-length', str(len(body)).encode())]
+                            + [(name.lower().encode(), value.encode()) for name, value in headers.items()]}
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        await self.app(scope, receive, send)
+        response_headers = {name.decode(): value.decode() for name, value in sent[0]['headers']}
+        return sent[0]['status'], response_headers, b''.join(message.get('body', b'') for message in sent[1:])
+
+    def api(self, method, path, params=None, headers=None):
+        """ code 200 응답의 data """
+        status, _, payload = self.request(method, path, params, headers)
+        self.assertEqual((status, payload['code']), (200, 200), payload)
+        return payload['data']
+
+    def upload(self, ftpid='1', images=1, headers=None, **params):
+        """ Returns: token """
+        imglist = [{'path': '/data/ftp/%s/%04d.jpg' % (ftpid, i)} for i in range(images)]
+        return self.api('POST', '/ftp/imginfo/', dict(params, ftpid=ftpid, imglist=json.dumps(imglist)),
+                        headers)['token']
+
+    def dispatch(self, ftpid='1', **params):
+        """ Returns: /ftp/tasks/ 응답 [{'token', 'imglist', ('ftpid')}, ...] """
+        return self.api('GET', '/ftp/tasks/', dict(params, ftpid=ftpid))
+
+    def tokens(self, tasks):
+        return [task['token'] for task in tasks]
+
+    def submit(self, task, headers=None):
+        metainfos = [{'id': img['id'], 'metainfo': {'age': 30}} for img in task['imglist']]
+        return self.api('POST', '/metainfo/', {'token': task['token'], 'metainfos': json.dumps(metainfos)}, headers)
+
+    def status(self, token):
+        """ Returns: (status, data) """
+        _, _, payload = self.request('GET', '/info/', {'token': token})
+        return str(payload['status']), payload['data']
+
+    def reap(self):
+        """ 처리 기한이 지난 task를 reaper로 한 번 정리한다. Returns: (pending에서 제거, 다시 queue에 넣음, dead letter) """
+        from image_api.reaper import PendingTaskReaper
+        if not hasattr(self, 'reaper'):
+            self.reaper = PendingTaskReaper()
+        return self.reaper.run_once()
+
+
+def status_value(status):
+    """ /info/ 응답의 status 값 (STATUS) """
+    return str(status.value)
@@ -0,0 +1,81 @@
+"""업로드 admission control: token bucket, queue quota (image_api.admission)"""
+from unittest import mock
+from image_api import admission
+from image_api.tests.base import ApiTestCase
+from image_api.constants import INGEST_DEFAULT_RETRY_AFTER
+
+
+class AdmissionTests(ApiTestCase):
+
+    def assertThrottled(self, reason, images=1, ftpid='1'):
+        status, headers, payload = self.request('POST', '/ftp/imginfo/', {
+            'ftpid': ftpid, 'imglist': '[%s]' % ', '.join(['{"path": "/a.jpg"}'] * images)})
+        self.assertEqual((status, payload['code']), (429, 429))
+        self.assertEqual(payload['data']['reason'], reason)
+        self.assertEqual(headers['Retry-After'], str(payload['data']['retry_after']))
+        return payload['data']['retry_after']
+
+    def test_no_limit(self):
+        for _ in range(5):
+            self.upload('1', images=10)
+
+    def test_ftpid_rate(self):
+        with self.settings(FACEAI_INGEST_LIMITS={'1': {'rate': 1, 'burst': 3}}):
+            self.upload('1', images=3)
+            self.assertThrottled('rate')
+            # 다른 ftpid는 제한하지 않는다
+            self.upload('2', images=3)
+
+    def test_client_rate(self):
+        with self.settings(FACEAI_CLIENT_INGEST_LIMIT={'rate': 1, 'burst': 2}):
+            self.upload('1', images=2)
+            self.assertThrottled('client_rate', ftpid='2')
+
+    def test_queue_quota(self):
+        with self.settings(FACEAI_INGEST_LIMIT={'max_queue': 2}):
+            self.upload('1')
+            self.upload('1')
+            self.assertThrottled('queue')
+            self.dispatch('1', limit=1)
+            self.upload('1')
+
+    def test_queue_quota_retry_after_without_drain_sample(self):
+        # 배분 속도를 아직 모르면 최대값(INGEST_MAX_RETRY_AFTER)이 아니라 기본값을 알려준다
+        with self.settings(FACEAI_INGEST_LIMIT={'max_queue': 1}):
+            self.upload('1')
+            self.assertEqual(self.assertThrottled('queue'), INGEST_DEFAULT_RETRY_AFTER)
+        with self.settings(FACEAI_INGEST_LIMIT={'max_queue': 1, 'retry_after': 2}):
+            self.assertEqual(self.assertThrottled('queue'), 2)
+        # rate가 있으면 token bucket이 업로드 이미지 수만큼 다시 차는 시간
+        with self.settings(FACEAI_INGEST_LIMIT={'max_queue': 1, 'rate': 1, 'burst': 10}):
+            self.assertEqual(self.assertThrottled('queue', images=3), 3)
+
+    def test_rejected_upload_is_not_saved(self):
+        with self.settings(FACEAI_INGEST_LIMIT={'max_queue': 1}):
+            token = self.upload('1')
+            self.assertThrottled('queue')
+        self.assertEqual(self.tokens(self.dispatch('1')), [token])
+
+    def test_rejection_refunds_earlier_shards(self):
+        uploads = [('1', [{'path': '/a.jpg'}] * 3, None), ('2', [{'path': '/a.jpg'}] * 2, None)]
+        with self.settings(FACEAI_INGEST_LIMITS={'1': {'rate': 1, 'burst': 3}, '2': {'rate': 1, 'burst': 1}}):
+            self.upload('2')
+            # ftpid 1, 2가 서로 다른 Redis node에 있으면 1을 허용한 후 2에서 거절된다
+            shard_args = [admission.admission_args([upload], '')[0] for upload in uploads]
+            with mock.patch.object(admission, 'admission_args', return_value=shard_args):
+                if self.interface == 'asgi':
+                    rejected = self.loop.run_until_complete(admission.aadmit_uploads(uploads))
+                else:
+                    rejected = admission.admit_uploads(uploads)
+            self.assertEqual((rejected.reason, rejected.subject), ('rate', '2'))
+            # ftpid 1에서 차감한 token은 되돌려졌다
+            self.upload('1', images=3)
+            self.assertThrottled('rate')
+
+
+class StreamAdmissionTests(AdmissionTests):
+    backend = 'stream'
+
+
+class AsyncAdmissionTests(AdmissionTests):
+    interface = 'asgi'
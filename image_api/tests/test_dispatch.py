@@ -0,0 +1,187 @@
+"""업로드 → 배분(/ftp/tasks/) → 결과 저장(ack) → 조회 lifecycle, lane, budget, work stealing"""
+import json
+import time
+from django.test import SimpleTestCase
+from image_api.tests.base import ApiTestCase, status_value
+from image_api.constants import *
+from image_api.queues import DispatchBatch, ListTaskQueue, StreamTaskQueue
+
+
+class DispatchTests(ApiTestCase):
+
+    def test_lifecycle(self):
+        token = self.upload('1', images=2)
+        self.assertEqual(self.status(token), (status_value(STATUS.CREATE), []))
+
+        tasks = self.dispatch('1')
+        self.assertEqual(self.tokens(tasks), [token])
+        imglist = tasks[0]['imglist']
+        self.assertEqual([img['path'] for img in imglist], ['/data/ftp/1/0000.jpg', '/data/ftp/1/0001.jpg'])
+        self.assertEqual([img['ftpid'] for img in imglist], ['1', '1'])
+        self.assertEqual(int(imglist[1]['id']), int(imglist[0]['id']) + 1)
+        self.assertEqual(self.status(token)[0], status_value(STATUS.PENDDING))
+        self.assertEqual([task['token'] for task in self.api('GET', '/ftp/peddingtasks/')], [token])
+
+        self.submit(tasks[0])
+        status, data = self.status(token)
+        self.assertEqual(status, status_value(STATUS.COMPLETE))
+        self.assertEqual(data, [{'id': img['id'], 'metainfo': {'age': 30}} for img in imglist])
+        self.assertEqual(self.api('GET', '/ftp/peddingtasks/'), [])
+        self.assertEqual(self.dispatch('1'), [])
+
+    def test_limit_keeps_queue_order(self):
+        tokens = [self.upload('1') for _ in range(5)]
+        self.assertEqual(self.tokens(self.dispatch('1', limit=2)), tokens[:2])
+        self.assertEqual(self.tokens(self.dispatch('1', limit=10)), tokens[2:])
+
+    def test_ftpids_have_separate_queues(self):
+        token1 = self.upload('1')
+        token2 = self.upload('2')
+        self.assertEqual(self.tokens(self.dispatch('2')), [token2])
+        self.assertEqual(self.tokens(self.dispatch('1')), [token1])
+
+    def test_packed_storage_returns_same_imglist(self):
+        self.upload('1', images=3)
+        hash_imglist = self.dispatch('1')[0]['imglist']
+        with self.settings(FACEAI_TASK_STORAGE='packed'):
+            self.upload('1', images=3)
+            packed_imglist = self.dispatch('1')[0]['imglist']
+        self.assertEqual([sorted(img) for img in packed_imglist], [sorted(img) for img in hash_imglist])
+        self.assertEqual([img['path'] for img in packed_imglist], [img['path'] for img in hash_imglist])
+
+    def test_bulk_results(self):
+        for _ in range(3):
+            self.upload('1')
+        tasks = self.dispatch('1')
+        results = [{'token': task['token'], 'metainfos': [{'id': img['id']} for img in task['imglist']]}
+                   for task in tasks] + [{'token': 'unknown'}]
+        data = self.api('POST', '/metainfo/bulk/', {'results': json.dumps(results)})
+        self.assertEqual(data['saved'], 3)
+        self.assertEqual([item['saved'] for item in data['results']], [True, True, True, False])
+        statuses = self.api('POST', '/info/bulk/', {'tokens': ','.join(self.tokens(tasks)), 'status_only': 'true'})
+        self.assertEqual([item['status'] for item in statuses.values()], [status_value(STATUS.COMPLETE)] * 3)
+        self.assertEqual(self.api('GET', '/ftp/peddingtasks/'), [])
+
+
+class LaneTests(ApiTestCase):
+
+    def test_priority_weight(self):
+        low = [self.upload('1', priority='low') for _ in range(4)]
+        high = [self.upload('1', priority='high') for _ in range(4)]
+        # high:low = 8:1 이므로 high lane이 빌 때까지 high를 먼저 배분한다
+        self.assertEqual(self.tokens(self.dispatch('1', limit=4)), high)
+        self.assertEqual(self.tokens(self.dispatch('1', limit=4)), low)
+
+    def test_tenants_share_priority(self):
+        tenant_a = [self.upload('1', tenant='a') for _ in range(4)]
+        tenant_b = [self.upload('1', tenant='b') for _ in range(4)]
+        tokens = self.tokens(self.dispatch('1', limit=4))
+        self.assertEqual(sorted(tokens), sorted(tenant_a[:2] + tenant_b[:2]))
+
+    def test_default_lane_with_lanes(self):
+        default = self.upload('1')
+        high = self.upload('1', priority='high')
+        self.assertEqual(sorted(self.tokens(self.dispatch('1'))), sorted([default, high]))
+
+
+class BudgetTests(ApiTestCase):
+
+    def test_max_images(self):
+        tokens = [self.upload('1', images=images) for images in (3, 2, 4, 1)]
+        self.assertEqual(self.tokens(self.dispatch('1', max_images=5)), tokens[:2])
+        # 첫 task는 budget보다 커도 배분한다 (token은 나누지 않는다)
+        self.assertEqual(self.tokens(self.dispatch('1', max_images=2)), tokens[2:3])
+        self.assertEqual(self.tokens(self.dispatch('1', max_images=5)), tokens[3:])
+
+    def test_max_images_with_limit(self):
+        tokens = [self.upload('1', images=1) for _ in range(4)]
+        self.assertEqual(self.tokens(self.dispatch('1', max_images=10, limit=3)), tokens[:3])
+
+    def test_max_bytes(self):
+        # 이미지 path는 모두 20 byte
+        tokens = [self.upload('1', images=images) for images in (1, 2, 1)]
+        self.assertEqual(self.tokens(self.dispatch('1', max_bytes=60)), tokens[:2])
+        self.assertEqual(self.tokens(self.dispatch('1', max_bytes=60)), tokens[2:])
+
+    def test_budget_across_lanes(self):
+        high = [self.upload('1', images=2, priority='high') for _ in range(3)]
+        self.upload('1', images=2, priority='low')
+        self.assertEqual(self.tokens(self.dispatch('1', max_images=4)), high[:2])
+
+
+class WorkStealingTests(ApiTestCase):
+    overrides = {'FACEAI_WORK_STEALING': {'2': ['1']}, 'FACEAI_STEAL_MIN_BACKLOG': 2}
+
+    def test_steal_from_other_ftpid(self):
+        tokens = [self.upload('1') for _ in range(4)]
+        stolen = self.dispatch('2')
+        # 대기 task의 최대 절반까지 원래 ftpid와 함께 가져온다
+        self.assertEqual(self.tokens(stolen), tokens[:2])
+        self.assertEqual([task['ftpid'] for task in stolen], ['1', '1'])
+        self.submit(stolen[0])
+        self.assertEqual(self.status(tokens[0])[0], status_value(STATUS.COMPLETE))
+        self.assertEqual(self.tokens(self.dispatch('1')), tokens[2:])
+
+    def test_own_queue_first(self):
+        for _ in range(4):
+            self.upload('1')
+        own = self.upload('2')
+        self.assertEqual(self.tokens(self.dispatch('2')), [own])
+
+    def test_steal_sources_are_normalized(self):
+        tokens = [self.upload('1') for _ in range(4)]
+        with self.settings(FACEAI_WORK_STEALING={'2': ['01']}):
+            self.assertEqual(self.tokens(self.dispatch('2')), tokens[:2])
+
+    def test_steal_disabled(self):
+        for _ in range(4):
+            self.upload('1')
+        self.assertEqual(self.dispatch('2', steal=0), [])
+
+
+class BlockTimeTests(SimpleTestCase):
+    """ long-poll block 시간은 남은 wait에서 계산하고, 0(무한히 기다림)이 되지 않는다 """
+
+    def test_stream_block_from_deadline(self):
+        batch = DispatchBatch(10, 0.0005, None)
+        self.assertEqual(StreamTaskQueue()._deadline_ms(batch), 1)
+        batch.deadline = time.time() + 2
+        self.assertTrue(1000 < StreamTaskQueue()._deadline_ms(batch) <= 2000)
+
+    def test_list_block_time(self):
+        self.assertEqual(ListTaskQueue()._block_time([], 0.0004), 0.001)
+        self.assertEqual(ListTaskQueue()._block_time(['high|'], 0.0004), 0.001)
+
+
+class StreamDispatchTests(DispatchTests):
+    backend = 'stream'
+
+
+class StreamLaneTests(LaneTests):
+    backend = 'stream'
+
+
+class StreamBudgetTests(BudgetTests):
+    backend = 'stream'
+
+
+class StreamWorkStealingTests(WorkStealingTests):
+    backend = 'stream'
+
+
+class AsyncDispatchTests(DispatchTests):
+    interface = 'asgi'
+
+
+class AsyncStreamDispatchTests(DispatchTests):
+    backend = 'stream'
+    interface = 'asgi'
+
+
+class AsyncBudgetTests(BudgetTests):
+    interface = 'asgi'
+
+
+class AsyncStreamBudgetTests(BudgetTests):
+    backend = 'stream'
+    interface = 'asgi'
@@ -0,0 +1,107 @@
+"""Idempotency-Key로 재시도한 업로드/metainfo 요청 (image_api.idempotency)"""
+import json
+from image_api.tests.base import ApiTestCase, status_value
+from image_api.constants import *
+
+
+class IdempotencyTests(ApiTestCase):
+
+    def test_upload_retry_returns_first_token(self):
+        headers = {'Idempotency-Key': 'upload-1'}
+        token = self.upload('1', images=2, headers=headers)
+        self.assertEqual(self.upload('1', images=2, headers=headers), token)
+        self.assertEqual(self.tokens(self.dispatch('1')), [token])
+
+    def test_upload_without_key_is_not_deduplicated(self):
+        self.assertNotEqual(self.upload('1'), self.upload('1'))
+
+    def test_bulk_upload_retry(self):
+        batches = json.dumps([{'ftpid': 1, 'imglist': [{'path': '/a.jpg'}]},
+                              {'ftpid': 2, 'imglist': [{'path': '/b.jpg'}]}])
+        headers = {'Idempotency-Key': 'bulk-1'}
+        tokens = self.api('POST', '/ftp/imginfo/bulk/', {'batches': batches}, headers)['tokens']
+        self.assertEqual(self.api('POST', '/ftp/imginfo/bulk/', {'batches': batches}, headers)['tokens'], tokens)
+        self.assertEqual(self.tokens(self.dispatch('1')) + self.tokens(self.dispatch('2')), tokens)
+
+    def test_content_hash(self):
+        with self.settings(FACEAI_IDEMPOTENCY_CONTENT_HASH=True):
+            token = self.upload('1')
+            self.assertEqual(self.upload('1'), token)
+            self.assertNotEqual(self.upload('1', images=2), token)
+
+    def test_metainfo_retry(self):
+        self.upload('1')
+        task = self.dispatch('1')[0]
+        headers = {'Idempotency-Key': 'meta-1'}
+        self.submit(task, headers)
+        self.submit(task, headers)
+        self.assertEqual(self.status(task['token'])[0], status_value(STATUS.COMPLETE))
+
+    def test_bulk_metainfo_retry_marks_duplicates(self):
+        self.upload('1')
+        task = self.dispatch('1')[0]
+        params = {'results': json.dumps([{'token': task['token'], 'metainfos': []}])}
+        headers = {'Idempotency-Key': 'meta-bulk-1'}
+        self.assertEqual(self.api('POST', '/metainfo/bulk/', params, headers)['results'],
+                         [{'token': task['token'], 'saved': True}])
+        self.assertEqual(self.api('POST', '/metainfo/bulk/', params, headers),
+                         {'saved': 0, 'results': [{'token': task['token'], 'saved': True, 'duplicate': True}]})
+
+    def assertConflict(self, payload):
+        self.assertEqual(payload['code'], 422, payload)
+        self.assertEqual(list(payload['data']), ['Idempotency-Key'])
+
+    def test_upload_key_reused_with_different_content(self):
+        headers = {'Idempotency-Key': 'upload-1'}
+        token = self.upload('1', headers=headers)
+        _, _, payload = self.request('POST', '/ftp/imginfo/', {'ftpid': '1', 'imglist': '[{"path": "/other.jpg"}]'},
+                                     headers)
+        self.assertConflict(payload)
+        self.assertEqual(self.upload('1', headers=headers), token)
+        self.assertEqual(self.tokens(self.dispatch('1')), [token])
+
+    def test_bulk_upload_conflict_releases_new_keys(self):
+        headers = {'Idempotency-Key': 'bulk-1'}
+        first = json.dumps([{'ftpid': 1, 'imglist': [{'path': '/a.jpg'}]}])
+        self.api('POST', '/ftp/imginfo/bulk/', {'batches': first}, headers)
+        changed = json.dumps([{'ftpid': 1, 'imglist': [{'path': '/b.jpg'}]},
+                              {'ftpid': 1, 'imglist': [{'path': '/c.jpg'}]}])
+        _, _, payload = self.request('POST', '/ftp/imginfo/bulk/', {'batches': changed}, headers)
+        self.assertConflict(payload)
+        # 거절된 요청에서 새로 등록한 key(두 번째 batch)는 남지 않는다
+        self.assertEqual(self.conn().keys(IDEMPOTENCY_PREFIX + '*'), [IDEMPOTENCY_PREFIX + 'upload:1:bulk-1:0'])
+        self.assertEqual(len(self.dispatch('1')), 1)
+
+    def test_metainfo_key_reused_with_different_content(self):
+        self.upload('1')
+        task = self.dispatch('1')[0]
+        headers = {'Idempotency-Key': 'meta-1'}
+        self.submit(task, headers)
+        params = {'token': task['token'], 'metainfos': json.dumps([{'id': task['imglist'][0]['id'], 'age': 99}])}
+        _, _, payload = self.request('POST', '/metainfo/', params, headers)
+        self.assertConflict(payload)
+        self.assertEqual(self.status(task['token'])[1][0]['metainfo'], {'age': 30})
+
+    def test_bulk_metainfo_conflict_is_item_error(self):
+        self.upload('1')
+        task = self.dispatch('1')[0]
+        headers = {'Idempotency-Key': 'meta-bulk-1'}
+        self.api('POST', '/metainfo/bulk/', {'results': json.dumps([{'token': task['token'], 'metainfos': []}])},
+                 headers)
+        data = self.api('POST', '/metainfo/bulk/',
+                        {'results': json.dumps([{'token': task['token'], 'metainfos': [{'id': 1}]}])}, headers)
+        self.assertEqual(data['saved'], 0)
+        self.assertEqual([(item['saved'], list(item['errors'])) for item in data['results']],
+                         [(False, ['Idempotency-Key'])])
+
+    def test_key_too_long(self):
+        status, _, payload = self.request('POST', '/ftp/imginfo/', {'imglist': '[]'}, {'Idempotency-Key': 'k' * 256})
+        self.assertEqual(payload['code'], 422)
+
+
+class StreamIdempotencyTests(IdempotencyTests):
+    backend = 'stream'
+
+
+class AsyncIdempotencyTests(IdempotencyTests):
+    interface = 'asgi'
@@ -0,0 +1,23 @@
+"""JSON 응답 형식: raw/streaming 응답도 json_response와 같은 bytes (image_api.utils)"""
+from django.test import SimpleTestCase
+
+from image_api.utils import orjson, json_dumps, json_response, json_raw_response, iter_json_list
+
+
+class JsonResponseTests(SimpleTestCase):
+    backends = ('orjson', 'json') if orjson is not None else ('json',)
+
+    def test_raw_response_matches_json_response(self):
+        data = [{'id': '1', 'metainfo': {'age': 30}}]
+        for backend in self.backends:
+            with self.settings(FACEAI_JSON_BACKEND=backend):
+                self.assertEqual(json_raw_response(json_dumps(data), status='2').content,
+                                 json_response(data, status='2').content)
+                self.assertEqual(json_raw_response(json_dumps(data)).content, json_response(data).content)
+
+    def test_streamed_list_matches_json_response(self):
+        items = [{'token': str(i)} for i in range(250)]
+        for backend in self.backends:
+            with self.settings(FACEAI_JSON_BACKEND=backend):
+                self.assertEqual(b''.join(iter_json_list(items)), json_response(items).content)
+                self.assertEqual(b''.join(iter_json_list([])), json_response([]).content)
@@ -0,0 +1,103 @@
+"""처리 기한이 지난 task의 재시도, dead letter queue (image_api.reaper)"""
+import json
+from unittest import mock
+from redis.exceptions import ConnectionError
+from image_api.tests.base import ApiTestCase, status_value
+from image_api.constants import *
+
+
+class ReaperTests(ApiTestCase):
+    # 배분 즉시 처리 기한이 지난다
+    overrides = {'FACEAI_VISIBILITY_TIMEOUT': {'1': 0}, 'FACEAI_MAX_TASK_ATTEMPTS': 2}
+
+    def test_requeue_expired_task(self):
+        token = self.upload('1')
+        self.dispatch('1')
+        self.assertEqual(self.reap(), (1, 1, 0))
+        self.assertEqual(self.status(token)[0], status_value(STATUS.CREATE))
+        self.assertEqual(self.conn().hget(TASK_INFO_PREFIX + token, 'attempts'), '1')
+
+        tasks = self.dispatch('1')
+        self.assertEqual(self.tokens(tasks), [token])
+        self.submit(tasks[0])
+        self.assertEqual(self.status(token)[0], status_value(STATUS.COMPLETE))
+
+    def test_requeue_keeps_lane(self):
+        token = self.upload('1', priority='high')
+        self.dispatch('1')
+        self.reap()
+        self.upload('1', priority='low')
+        self.assertEqual(self.tokens(self.dispatch('1', limit=1)), [token])
+
+    def test_late_result_after_requeue(self):
+        token = self.upload('1')
+        task = self.dispatch('1')[0]
+        self.reap()
+        # 다시 queue에 넣은 후 처음 배분한 worker의 결과가 늦게 저장된다
+        self.submit(task)
+        self.assertEqual(self.dispatch('1'), [])
+        status, data = self.status(token)
+        self.assertEqual(status, status_value(STATUS.COMPLETE))
+        self.assertEqual(len(data), 1)
+        self.assertEqual(self.reap(), (0, 0, 0))
+
+    def test_completed_task_is_not_requeued(self):
+        self.upload('1')
+        self.submit(self.dispatch('1')[0])
+        self.assertEqual(self.reap(), (0, 0, 0))
+        self.assertEqual(self.dispatch('1'), [])
+
+    def test_unexpired_task_is_not_reaped(self):
+        self.upload('2')
+        self.dispatch('2')
+        self.assertEqual(self.reap(), (0, 0, 0))
+        self.assertEqual(len(self.api('GET', '/ftp/peddingtasks/')), 1)
+
+    def test_dead_letter(self):
+        token = self.upload('1')
+        for _ in range(2):
+            self.assertEqual(self.tokens(self.dispatch('1')), [token])
+            self.reap()
+        self.assertEqual(self.status(token)[0], status_value(STATUS.ABORT))
+        self.assertEqual(self.dispatch('1'), [])
+        dead = self.api('GET', '/ftp/deadtasks/')
+        self.assertEqual([(task['token'], task['ftpid'], task['attempts']) for task in dead], [(token, '1', '2')])
+
+        self.assertEqual(self.api('POST', '/ftp/deadtasks/', {'tokens': json.dumps([token])}), {'requeued': [token]})
+        self.assertEqual(self.api('GET', '/ftp/deadtasks/'), [])
+        self.assertEqual(self.status(token)[0], status_value(STATUS.CREATE))
+        self.assertEqual(self.tokens(self.dispatch('1')), [token])
+
+    def test_requeue_all_dead_tasks(self):
+        tokens = [self.upload('1') for _ in range(3)]
+        for _ in range(2):
+            self.dispatch('1')
+            self.reap()
+        self.assertEqual(sorted(self.api('POST', '/ftp/deadtasks/', {'all': '1'})['requeued']), sorted(tokens))
+        self.assertEqual(sorted(self.tokens(self.dispatch('1'))), sorted(tokens))
+
+    def test_single_leader(self):
+        from image_api.reaper import PendingTaskReaper
+        leader, follower = PendingTaskReaper(), PendingTaskReaper()
+        follower.owner += ':follower'
+        self.assertIsNotNone(leader.run_once())
+        self.assertIsNone(follower.run_once())
+        leader.release_lease(self.conn())
+        self.assertIsNotNone(follower.run_once())
+
+
+class StreamReaperTests(ReaperTests):
+    backend = 'stream'
+
+    def test_requeued_before_ack(self):
+        token = self.upload('1')
+        self.dispatch('1')
+        # 다시 queue에 넣은 후 entry의 ACK/XDEL이 실패해도 task는 queue에 있다
+        with mock.patch('redis.client.Pipeline.execute', side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                self.reap()
+        self.assertEqual(self.tokens(self.dispatch('1')), [token])
+
+
+class AsyncReaperTests(ReaperTests):
+    interface = 'asgi'
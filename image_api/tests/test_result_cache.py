@@ -0,0 +1,52 @@
+"""process 안의 result cache: 조회 중 무효화, hit/miss metrics (image_api.result_cache)"""
+from image_api.result_cache import ResultCache, get_result_cache
+from image_api.tests.base import ApiTestCase
+
+
+class ResultCacheTests(ApiTestCase):
+
+    def test_put_after_invalidation_is_ignored(self):
+        cache = ResultCache(invalidation=False)
+        generation = cache.generation()
+        # Redis 조회 중에 다른 process가 저장해서 무효화 message가 온다
+        cache.invalidate(['t1'])
+        cache.put('t1', b'old', 60, generation)
+        self.assertIsNone(cache.get('t1'))
+        cache.put('t1', b'new', 60, cache.generation())
+        self.assertEqual(cache.get('t1'), b'new')
+
+    def test_other_token_invalidation(self):
+        cache = ResultCache(invalidation=False)
+        generation = cache.generation()
+        cache.invalidate(['t2'])
+        cache.put('t1', b'payload', 60, generation)
+        self.assertEqual(cache.get('t1'), b'payload')
+
+    def test_evicted_invalidation_record(self):
+        cache = ResultCache(max_size=1, invalidation=False)
+        generation = cache.generation()
+        cache.invalidate(['t1'])
+        cache.invalidate(['t2'])
+        # t1의 무효화 기록은 밀려났지만 조회 중에 무효화되었을 수 있으므로 넣지 않는다
+        cache.put('t1', b'old', 60, generation)
+        self.assertIsNone(cache.get('t1'))
+
+    def test_clear_ignores_reads_in_flight(self):
+        cache = ResultCache(invalidation=False)
+        generation = cache.generation()
+        cache.clear()
+        cache.put('t1', b'old', 60, generation)
+        self.assertIsNone(cache.get('t1'))
+
+    def test_lookups_exported(self):
+        token = self.upload('1')
+        self.submit(self.dispatch('1')[0])
+        # 저장한 process의 cache에 있다
+        self.status(token)
+        get_result_cache().clear()
+        self.status(token)
+        self.status(token)
+        status, _, content = self.raw_request('GET', '/metrics')
+        self.assertEqual(status, 200)
+        self.assertIn(b'faceai_result_cache_lookups_total{result="hit"} 2', content)
+        self.assertIn(b'faceai_result_cache_lookups_total{result="miss"} 1', content)
@@ -0,0 +1,57 @@
+"""API 경로별 middleware 적용: /info*만 CorsMiddleware 적용 (image_api.wsgi_app, image_api.async_app)"""
+import unittest
+
+from django.test import SimpleTestCase
+
+from image_api.tests.base import ApiTestCase
+
+try:
+    import corsheaders
+except ImportError:
+    corsheaders = None
+
+ORIGIN = 'http://dashboard.example'
+
+
+@unittest.skipIf(corsheaders is None, 'django-cors-headers is not installed')
+class CorsTests(ApiTestCase):
+    overrides = {'MIDDLEWARE': ['corsheaders.middleware.CorsMiddleware'], 'CORS_ORIGIN_ALLOW_ALL': True}
+
+    def test_info_cors_headers(self):
+        token = self.upload('1')
+        for path, params in (('/info/', {'token': token}), ('/info/bulk/', {'tokens': token})):
+            status, headers, payload = self.request('GET', path, params, {'Origin': ORIGIN})
+            self.assertEqual((status, payload['code']), (200, 200), payload)
+            self.assertEqual(headers['Access-Control-Allow-Origin'], '*')
+
+    def test_info_events_cors_headers(self):
+        token = self.upload('1')
+        self.submit(self.dispatch('1')[0])
+        status, headers, _ = self.raw_request('GET', '/info/events/', {'token': token, 'wait': '1'}, {'Origin': ORIGIN})
+        self.assertEqual(headers['Access-Control-Allow-Origin'], '*')
+
+    def test_preflight(self):
+        status, headers, payload = self.request('OPTIONS', '/info/', headers={
+            'Origin': ORIGIN, 'Access-Control-Request-Method': 'GET'})
+        self.assertEqual((status, payload), (200, None))
+        self.assertEqual(headers['Access-Control-Allow-Origin'], '*')
+        self.assertIn('GET', headers['Access-Control-Allow-Methods'])
+
+    def test_machine_routes_skip_cors(self):
+        self.upload('1')
+        status, headers, _ = self.request('GET', '/ftp/tasks/', {'ftpid': '1'}, {'Origin': ORIGIN})
+        self.assertNotIn('Access-Control-Allow-Origin', headers)
+
+
+@unittest.skipIf(corsheaders is None, 'django-cors-headers is not installed')
+class AsyncCorsTests(CorsTests):
+    interface = 'asgi'
+
+
+class RouteTableTests(SimpleTestCase):
+
+    def test_wsgi_and_asgi_routes_match(self):
+        from image_api.async_app import async_routes
+        from image_api.wsgi_app import wsgi_routes
+        self.assertEqual(set(wsgi_routes()), set(async_routes()))
+        self.assertNotIn('/metrics', async_routes())
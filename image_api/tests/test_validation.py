@@ -0,0 +1,65 @@
+"""요청 파라미터 검증: 잘못된 값은 422 (image_api.validation)"""
+from image_api.tests.base import ApiTestCase
+
+
+class ParameterTests(ApiTestCase):
+
+    def assertInvalid(self, method, path, params, field):
+        status, _, payload = self.request(method, path, params)
+        self.assertEqual((status, payload['code']), (200, 422), payload)
+        self.assertEqual(list(payload['data']), [field])
+
+    def test_task_limit(self):
+        for limit in ('abc', '', '-1', '0', '1.5'):
+            self.assertInvalid('GET', '/ftp/tasks/', {'limit': limit}, 'limit')
+        tokens = [self.upload('1') for _ in range(2)]
+        self.assertEqual(self.tokens(self.dispatch('1', limit='1.0')), tokens[:1])
+        self.assertEqual(self.tokens(self.dispatch('1', limit=5000)), tokens[1:])
+
+    def test_task_wait(self):
+        for wait in ('abc', '-0.5', 'nan', 'inf'):
+            self.assertInvalid('GET', '/ftp/tasks/', {'wait': wait}, 'wait')
+        self.assertEqual(self.dispatch('1', wait='0.01'), [])
+
+    def test_task_budget(self):
+        for field, value in (('max_images', '-1'), ('max_images', '2.5'), ('max_bytes', 'x'),
+                             ('linger', '-1'), ('linger', 'nan')):
+            self.assertInvalid('GET', '/ftp/tasks/', {field: value}, field)
+        status, _, payload = self.request('GET', '/ftp/tasks/', {'max_images': 'x', 'max_bytes': '-1'})
+        self.assertEqual(sorted(payload['data']), ['max_bytes', 'max_images'])
+        tokens = [self.upload('1', images=2) for _ in range(2)]
+        self.assertEqual(self.tokens(self.dispatch('1', max_images='2', linger='0')), tokens[:1])
+
+    def test_task_ftpid_is_normalized(self):
+        token = self.upload('01')
+        self.assertEqual(self.tokens(self.dispatch('1.0')), [token])
+        token = self.upload('2')
+        self.assertEqual(self.tokens(self.dispatch('02')), [token])
+        for ftpid in ('abc', '0'):
+            self.assertInvalid('GET', '/ftp/tasks/', {'ftpid': ftpid}, 'ftpid')
+
+    def test_peddingtasks_limit(self):
+        self.assertInvalid('GET', '/ftp/peddingtasks/', {'limit': 'x'}, 'limit')
+        self.assertEqual(self.api('GET', '/ftp/peddingtasks/', {'limit': '5'}), [])
+
+    def test_info_wait(self):
+        token = self.upload('1')
+        self.assertInvalid('GET', '/info/', {'token': token, 'wait': 'x'}, 'wait')
+        self.assertInvalid('GET', '/info/', {'token': token, 'wait': '-1'}, 'wait')
+
+
+class DeadTaskParameterTests(ApiTestCase):
+
+    def test_deadtasks_limit(self):
+        for method, params in (('GET', {'limit': '-1'}), ('POST', {'all': '1', 'limit': 'x'})):
+            status, _, payload = self.request(method, '/ftp/deadtasks/', params)
+            self.assertEqual(payload['code'], 422, payload)
+            self.assertEqual(list(payload['data']), ['limit'])
+
+
+class AsyncParameterTests(ParameterTests):
+    interface = 'asgi'
+
+
+class AsyncDeadTaskParameterTests(DeadTaskParameterTests):
+    interface = 'asgi'
@@ -1,21 +1,89 @@
-from django.shortcuts import render
-from rest_framework.views import APIView
-from django.http import HttpResponse, HttpRequest
-# Create your views here.
-
-from django.http import JsonResponse
+from django.http import HttpResponse
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+import json
 import time
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# json_list_response가 streaming할 때 한 번에 encode하는 item 개수
+JSON_STREAM_CHUNK = 100
+# json_raw_response, iter_json_list에서 응답의 data 자리를 표시하는 값
+_RAW_DATA = '\x00data\x00'
+
+def _json_backend():
+    """ settings.FACEAI_JSON_BACKEND: 'auto' (orjson이 있으면 orjson), 'orjson', 'json' """
+    backend = getattr(settings, 'FACEAI_JSON_BACKEND', 'auto')
+    if backend == 'orjson' and orjson is None:
+        raise ImproperlyConfigured("FACEAI_JSON_BACKEND = 'orjson' requires the orjson package")
+    if backend == 'json' or orjson is None:
+        return 'json'
+    return 'orjson'
+
+def _orjson_default(obj):
+    return DjangoJSONEncoder().default(obj)
+
+def json_dumps(data):
+    """ 응답 data를 JSON bytes로 encode (JsonResponse와 같은 값 변환, orjson은 공백 없는 compact 형식) """
+    if _json_backend() == 'orjson':
+        try:
+            return orjson.dumps(data, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # 64bit를 넘는 정수 등 orjson이 지원하지 않는 값
+            pass
+    return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
 def json_response(data, code=200, **extra):
     data = {"code": code, "msg": "success", "data": data,}
     for k, v in extra.items():
         data[k] = v
-    return JsonResponse(data)
+    return HttpResponse(json_dumps(data), content_type='application/json')
 
 def json_error(error_string="", code=500, **kwargs):
     data = {"code": code, "msg": error_string, "data": {}}
     data.update(kwargs)
-    return JsonResponse(data)
+    return HttpResponse(json_dumps(data), content_type='application/json')
+
+def _json_envelope(code, extra):
+    """ json_response의 JSON을 data 앞(head)과 뒤(tail)로 나눈 bytes (json_dumps 형식) """
+    data = {"code": code, "msg": "success", "data": _RAW_DATA}
+    data.update(extra)
+    head, _, tail = json_dumps(data).partition(json_dumps(_RAW_DATA))
+    return head, tail
+
+def json_raw_response(raw_data, code=200, **extra):
+    """ json_response와 같은 형식의 응답, data에는 이미 JSON으로 encode된 bytes를 decode 없이 그대로 넣는다 """
+    head, tail = _json_envelope(code, extra)
+    return HttpResponse(head + raw_data + tail, content_type='application/json')
+
+def json_list_response(items, code=200):
+    """ data가 list인 json_response; item이 FACEAI_JSON_STREAM_MIN개 이상이면 전체 응답을 한 번에 만들지 않고
+    JSON_STREAM_CHUNK개씩 encode해서 streaming 한다 (0이면 항상 json_response)
+    """
+    stream_min = getattr(settings, 'FACEAI_JSON_STREAM_MIN', 0)
+    if not stream_min or len(items) < stream_min:
+        return json_response(items, code=code)
+    return StreamingHttpResponse(iter_json_list(items, code), content_type='application/json')
+
+def iter_json_list(items, code=200):
+    head, tail = _json_envelope(code, {})
+    # item 구분자도 json_dumps 형식을 따른다
+    separator = json_dumps([0, 0])[2:-2]
+    yield head + b'['
+    for i in range(0, len(items), JSON_STREAM_CHUNK):
+        chunk = json_dumps(items[i: i + JSON_STREAM_CHUNK])[1:-1]
+        yield separator + chunk if i else chunk
+    yield b']' + tail
+
+
+def sse_event(event, data):
+    """ Server-Sent Events 형식의 event 문자열 """
+    return "event: %s\ndata: %s\n\n" % (event, data)
 
 
 def timetamp_formatter(t):
@@ -0,0 +1,285 @@
+"""업로드/metainfo API의 요청 검증 (DRF serializer를 사용하지 않는 fast path)
+
+/ftp/imginfo/, /metainfo/ 등 FTP서버와 단말기가 계속 호출하는 API는 요청마다 serializer를 만들지 않고
+모듈에서 미리 compile한 규칙으로 검증한다. imglist, metainfos의 JSON은 여기서 한 번만 parse하고
+parse된 값을 view에 넘긴다.
+
+검증 실패 시 ValidationFailed.errors는 DRF serializer.errors와 같은 형식({field: [message, ...]})과 message를 사용한다.
+"""
+import json
+import math
+import re
+from image_api.compression import normalize_metainfo
+from image_api.constants import MAX_BULK_RESULTS
+from image_api.queues import get_lane_weights, make_lane
+
+# DRF IntegerField가 받는 형식 ('1', '1.0')
+INTEGER_RE = re.compile(r'^-?\d+(\.0*)?$')
+TENANT_RE = re.compile(r'^[A-Za-z0-9_.:-]{1,64}$')
+PRIORITY_MAX_LENGTH = 32
+
+REQUIRED = 'This field is required.'
+BLANK = 'This field may not be blank.'
+
+
+class ValidationFailed(Exception):
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def _string(value, errors, field, required=True):
+    """ DRF CharField와 같은 검증; 앞뒤 공백을 제거한 문자열 (없으면 None) """
+    if value is None:
+        if required:
+            errors[field] = [REQUIRED]
+        return None
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        errors[field] = ['Not a valid string.']
+        return None
+    value = str(value).strip()
+    if not value:
+        errors[field] = [BLANK]
+        return None
+    return value
+
+
+def _integer(value, errors, field, min_value):
+    """ DRF IntegerField(min_value)와 같은 검증 ('1', '1.0', 1) """
+    if isinstance(value, int) and not isinstance(value, bool):
+        number = value
+    elif isinstance(value, str) and INTEGER_RE.match(value.strip()):
+        number = int(value.strip().split('.')[0])
+    else:
+        errors[field] = ['A valid integer is required.']
+        return None
+    if number < min_value:
+        errors[field] = ['Ensure this value is greater than or equal to %s.' % min_value]
+        return None
+    return number
+
+
+def _number(value, errors, field, min_value):
+    """ DRF FloatField(min_value)와 같은 검증 (nan, inf는 받지 않는다) """
+    if isinstance(value, bool):
+        number = None
+    else:
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            number = None
+    if number is None or not math.isfinite(number):
+        errors[field] = ['A valid number is required.']
+        return None
+    if number < min_value:
+        errors[field] = ['Ensure this value is greater than or equal to %s.' % min_value]
+        return None
+    return number
+
+
+def _ftpid(value, errors):
+    """ ftpid (생략 시 '1'); queue key에 사용하므로 '01', '1.0'도 '1'로 변환 """
+    if value is None:
+        return '1'
+    ftpid = _integer(value, errors, 'ftpid', 1)
+    return None if ftpid is None else str(ftpid)
+
+
+def normalize_ftpid(value):
+    """ settings 등에 지정된 ftpid를 업로드/배분과 같은 형식으로 ('01' -> '1', 정수가 아니면 그대로) """
+    ftpid = _ftpid(value, {})
+    return str(value) if ftpid is None else ftpid
+
+
+def _lane(data, errors):
+    """ priority/tenant를 검증하고 make_lane의 lane 이름을 리턴 """
+    priority = _string(data.get('priority'), errors, 'priority', required=False)
+    if priority is not None:
+        if len(priority) > PRIORITY_MAX_LENGTH:
+            errors['priority'] = ['Ensure this field has no more than %s characters.' % PRIORITY_MAX_LENGTH]
+        elif priority not in get_lane_weights():
+            errors['priority'] = ['priority must be one of: %s' % ', '.join(get_lane_weights())]
+    tenant = data.get('tenant')
+    if tenant is not None and not (isinstance(tenant, str) and TENANT_RE.match(tenant)):
+        errors['tenant'] = ['This value does not match the required pattern.']
+    return make_lane(priority, tenant)
+
+
+def _imglist(value, errors, encoded):
+    """ imglist: json 문자열(encoded, form 요청) 또는 list(bulk API의 json 값), item마다 path 필수 """
+    if value is None:
+        errors['imglist'] = [REQUIRED]
+        return None
+    if encoded and isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            errors['imglist'] = ['imglist must be a json array']
+            return None
+    if not isinstance(value, list):
+        errors['imglist'] = ['Expected a list of items but got type "%s".' % type(value).__name__]
+        return None
+    for img in value:
+        if not isinstance(img, dict):
+            errors['imglist'] = ['Expected a dictionary of items but got type "%s".' % type(img).__name__]
+            return None
+        if 'path' not in img:
+            errors['imglist'] = ["imglist item must have 'path'"]
+            return None
+    return value
+
+
+def _json_array(value, field):
+    """ bulk API의 json array 파라미터를 parse """
+    if value is None:
+        raise ValidationFailed({field: [REQUIRED]})
+    if isinstance(value, (str, bytes)):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValidationFailed({field: ['Value must be valid JSON.']})
+    if not isinstance(value, list) or len(value) == 0:
+        raise ValidationFailed({field: ['%s must be a non-empty json array' % field]})
+    return value
+
+
+def _upload_errors(data, encoded):
+    """ Returns: ((ftpid, imglist, lane), errors) """
+    errors = {}
+    if not isinstance(data, dict):
+        return None, {'non_field_errors': ['Invalid data. Expected a dictionary, but got %s.' % type(data).__name__]}
+    ftpid = _ftpid(data.get('ftpid'), errors)
+    lane = _lane(data, errors)
+    imglist = _imglist(data.get('imglist'), errors, encoded)
+    return (ftpid, imglist, lane), errors
+
+
+def validate_upload(data):
+    """ IF-FACEAI-001 요청 (ftpid, imglist, priority, tenant)
+
+    Returns: save_uploads에 넘길 (ftpid, imglist, lane)
+    """
+    upload, errors = _upload_errors(data, True)
+    if errors:
+        raise ValidationFailed(errors)
+    return upload
+
+
+def validate_uploads(data):
+    """ IF-FACEAI-006 요청 (batches)
+
+    Returns: batch 순서대로 [(ftpid, imglist, lane), ...]
+    """
+    batches = _json_array(data.get('batches'), 'batches')
+    uploads, batch_errors = [], []
+    for batch in batches:
+        upload, errors = _upload_errors(batch, False)
+        uploads.append(upload)
+        batch_errors.append(errors)
+    if any(batch_errors):
+        raise ValidationFailed({'batches': batch_errors})
+    return uploads
+
+
+def _metainfo_errors(data):
+    """ Returns: ({'token', 'metainfos': 정규화된 JSON 문자열}, errors) """
+    errors = {}
+    if not isinstance(data, dict):
+        return None, {'non_field_errors': ['Invalid data. Expected a dictionary, but got %s.' % type(data).__name__]}
+    token = _string(data.get('token'), errors, 'token')
+    metainfos = data.get('metainfos')
+    if metainfos is None:
+        errors['metainfos'] = [REQUIRED]
+    elif not isinstance(metainfos, str):
+        # bulk API에서 json 값으로 받은 metainfos는 다시 parse하지 않는다
+        metainfos = json.dumps(metainfos)
+    elif not metainfos.strip():
+        errors['metainfos'] = [BLANK]
+    else:
+        try:
+            metainfos = normalize_metainfo(metainfos)
+        except ValueError:
+            errors['metainfos'] = ['metainfos must be valid json']
+    return {'token': token, 'metainfos': metainfos}, errors
+
+
+def validate_metainfo(data):
+    """ IF-FACEAI-004 요청 (token, metainfos)
+
+    Returns: {'token': token, 'metainfos': 정규화된 JSON 문자열}
+    """
+    item, errors = _metainfo_errors(data)
+    if errors:
+        raise ValidationFailed(errors)
+    return item
+
+
+def validate_metainfos(data):
+    """ IF-FACEAI-009 요청 (results)
+
+    잘못된 item이 있어도 전체를 거절하지 않고 item별 errors로 돌려준다.
+
+    Returns: [(item, errors), ...] (검증을 통과한 item은 정규화된 item과 errors=None, 실패한 item은 원래 item과 errors)
+    """
+    results = _json_array(data.get('results'), 'results')
+    if len(results) > MAX_BULK_RESULTS:
+        raise ValidationFailed({'results': ['results must have at most %s items' % MAX_BULK_RESULTS]})
+    validated = []
+    for item in results:
+        valid_item, errors = _metainfo_errors(item)
+        validated.append((item, errors) if errors else (valid_item, None))
+    return validated
+
+
+def validate_ftpid(data):
+    """ 배분 요청의 ftpid (생략 시 '1'); 업로드와 같은 queue key를 사용하도록 '01', '1.0'도 '1'로 변환 """
+    errors = {}
+    ftpid = _ftpid(data.get('ftpid'), errors)
+    if errors:
+        raise ValidationFailed(errors)
+    return ftpid
+
+
+def validate_limit(data, default, max_value=None, field='limit'):
+    """ 조회/배분 개수 파라미터 (1 이상, max_value보다 크면 max_value)
+
+    Returns: 생략하면 default
+    """
+    value = data.get(field)
+    if value is None:
+        return default
+    errors = {}
+    limit = _integer(value, errors, field, 1)
+    if errors:
+        raise ValidationFailed(errors)
+    return limit if max_value is None else min(max_value, limit)
+
+
+def validate_seconds(data, field, default, max_value):
+    """ 대기 시간(초) 파라미터 (0 이상, max_value보다 크면 max_value)
+
+    Returns: 생략하면 default
+    """
+    value = data.get(field)
+    if value is None:
+        return default
+    errors = {}
+    seconds = _number(value, errors, field, 0)
+    if errors:
+        raise ValidationFailed(errors)
+    return min(max_value, seconds)
+
+
+def validate_budget(data):
+    """ task_provider의 budget 파라미터 (max_images, max_bytes: 0 이상 정수, linger: 0 이상 초)
+
+    Returns: (max_images, max_bytes, linger), 생략한 값은 0
+    """
+    errors = {}
+    max_images = _integer(data.get('max_images', 0), errors, 'max_images', 0)
+    max_bytes = _integer(data.get('max_bytes', 0), errors, 'max_bytes', 0)
+    linger = _number(data.get('linger', 0), errors, 'linger', 0)
+    if errors:
+        raise ValidationFailed(errors)
+    return max_images, max_bytes, linger
@@ -1,49 +1,26 @@
 import json
-import multiprocessing
 import logging
 from image_api.utils import *
-from uuid import uuid1
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django_redis import get_redis_connection
-from image_api.FieldValidators import MetainfoValidator, ImageinfoValidator
-from enum import Enum
+from image_api.FieldValidators import BulkInfoValidator
+from image_api.validation import ValidationFailed, validate_upload, validate_uploads, validate_metainfo, \
+    validate_metainfos, validate_limit, validate_seconds, validate_ftpid, validate_budget
+from image_api.constants import *
+from image_api.queues import get_task_queue, TaskBudget
+from image_api.scripts import run_script, REQUEUE_DEAD_TASKS
+from image_api.compression import encode_metainfo, decode_metainfo
+from image_api.result_cache import get_result_cache
+from image_api.sharding import get_shard_ring
+from image_api.stealing import get_steal_sources, steal_tasks
+from image_api.metrics import get_metrics, metrics_response
+from image_api.admission import admit_uploads, client_id, memory_rejected, throttled_response
+from image_api.idempotency import upload_keys, metainfo_keys, upload_digests, metainfo_digests, queue_claims, \
+    claimed, IdempotencyConflict
+from redis.exceptions import ResponseError
 
 logger = logging.getLogger('api.custom')
-logger_pedding = logging.getLogger('pedding.custom')
-
-#Redis에 Metainfo를 저장하는 Key의 prefix
-META_RESULT_PREFIX = 'm_'
-#Redis에 이미지 정보를 저장하는 Key의 prefix
-FTP_IMAGE_PREFIX = 'ftp_img:'
-#Redis에 순서대로 Task정보를 저장하는 queue
-TASK_QUEUE_PREFIX = 'task_queue'
-#Redis에 처리중인 Task정보를 저장하는 queue
-PEDDING_TASK_ZSET = 'pedding_task_zset'
-#Redis에 Task정보를 저장하는 Key의 Prefix
-TASK_INFO_PREFIX = 'taskinfo:'
-
-#해당 시간내에 task를 처리 못하면 abort를 한다
-PEDDING_TASK_AGE = 60 * 20 #20분
-# TASK정보 보유 기간
-TASK_INFO_AGE = 60 * 60 * 24 # 24 Hours
-# 이미지 정보 보유 기간
-IMG_INFO_AGE = 60 * 60 * 24 # 24 Hours
-# 메타 정보 보유 기간
-META_RESULT_AGE = 60 * 60 * 24 # 24 Hours
-
-class STATUS(Enum):
-    """ Task 처리 상태
-    CREATE: 생성됨
-    PENDDING: 처리 중
-    COMPLETE: 완성
-    ABORT: 장기간 동안 처리를 못하여 강제로 작업을 종료됨
-    EMPTY: 해당 task정보 없음
-    """
-    CREATE = 0
-    PENDDING = 1
-    COMPLETE = 2
-    ABORT = 3
-    EMPTY = 4
 
 @csrf_exempt
 def create_ftpimginfo(request):
@@ -55,6 +32,10 @@ def create_ftpimginfo(request):
             - 데이터 형식 Hash--> key = ftp_img:id
         2. token에 해당하는 task정보 생성 및 저장.
         3. Ftpid에 해당하는 task_queue에 task정보를 추가
+        (1~3은 save_uploads에서 pipeline으로 한꺼번에 처리, token과 모든 정보는 ftpid의 queue와 같은 Redis node에 저장)
+        저장 전에 ftpid/client별 업로드 제한(image_api.admission)을 확인하고, 넘으면 저장하지 않고
+        HTTP 429와 Retry-After(초)를 리턴한다
+        Idempotency-Key header가 있으면 같은 key의 재시도는 저장하지 않고 처음 요청의 token을 리턴한다 (image_api.idempotency)
 
     주의: 이미지 및 task정보는 TASK_INFO_AGE 시간 후 삭제됨 (Redis expire)
 
@@ -62,30 +43,65 @@ def create_ftpimginfo(request):
         request (HTTP REQUEST):
             - method: POST
             - ftpid를 default값 1
+            - priority: settings.FACEAI_LANE_WEIGHTS의 priority; default value = DEFAULT_PRIORITY
+            - tenant: 같은 priority 안에서 공평하게 배분할 단위 (단말기 그룹 등); 생략 가능
+              priority/tenant별로 별도 lane에 넣고 task_provider가 weight 비율로 배분한다
 
     Returns: token를 리턴
 
     """
     if request.method == 'POST':
-        valid_ser = ImageinfoValidator(data=request.POST)
-        if not valid_ser.is_valid():
-            return json_error('Data Invalid', code=422, data=valid_ser.errors)
-
-        conn = get_redis_connection('default')
-        token = create_token()
-        imglist = request.POST['imglist']
-        ftpid = request.POST.get('ftpid', '1')
-        imglist = json.loads(imglist)
-        logger.info("%s token: %s, imgid_list: %s", 'IF-FACEAI-001', ftpid, imglist)
-
-        #1. 이미지 정보 저장
-        imgid_list = save_imginfos(conn,ftpid, imglist)
-        # 2. token에 해당하는 taskinfo 저장, expire시간 지정
-        save_taskinfo(conn, token, imgid_list)
-        #3. Ftpid에 해당하는 task_queue에 task정보를 추가
-        push_task(conn, ftpid, token)
-
-        return json_response({'token': token})
+        try:
+            uploads = [validate_upload(request.POST)]
+            keys = upload_keys(request, uploads)
+        except ValidationFailed as e:
+            return json_error('Data Invalid', code=422, data=e.errors)
+        logger.info("%s token: %s, imgid_list: %s", 'IF-FACEAI-001', uploads[0][0], uploads[0][1])
+
+        #이미지 정보, taskinfo 저장 및 task_queue에 추가
+        try:
+            tokens, rejected = admit_and_save_uploads(request, uploads, keys)
+        except IdempotencyConflict as e:
+            return json_error('Data Invalid', code=422, data=e.errors)
+        if rejected is not None:
+            return throttled_response(rejected)
+        return json_response({'token': tokens[0]})
+    else:
+        return json_error('HTTP METHOD ERROR', 405)
+
+@csrf_exempt
+def create_ftpimginfos(request):
+    """ IF-FACEAI-006: 여러 업로드 batch(여러 token)의 이미지정보를 한 번에 전달받는 함수
+
+    create_ftpimginfo와 동일한 처리를 batch 단위로 수행한다. Redis node별로 전체 batch의 이미지 id는 한 번에
+    할당되고 모든 정보는 pipeline 한 번으로 저장된다.
+
+    Args:
+        request (HTTP REQUEST):
+            - method: POST
+            - batches (json array): [{"ftpid": 1, "imglist": [{"path": "..."}, ...]}, ...]
+              ftpid를 생략하면 default값 1, batch별로 priority, tenant 지정 가능 (create_ftpimginfo 참고)
+            - Idempotency-Key header: batch 순서를 붙여 batch별 멱등성 key로 사용
+
+    Returns: batch 순서대로 token 리스트를 리턴
+
+    """
+    if request.method == 'POST':
+        try:
+            uploads = validate_uploads(request.POST)
+            keys = upload_keys(request, uploads)
+        except ValidationFailed as e:
+            return json_error('Data Invalid', code=422, data=e.errors)
+        logger.info("%s batches: %s, images: %s", 'IF-FACEAI-006',
+                    len(uploads), sum(len(imglist) for _, imglist, _ in uploads))
+
+        try:
+            tokens, rejected = admit_and_save_uploads(request, uploads, keys)
+        except IdempotencyConflict as e:
+            return json_error('Data Invalid', code=422, data=e.errors)
+        if rejected is not None:
+            return throttled_response(rejected)
+        return json_response({'tokens': tokens})
     else:
         return json_error('HTTP METHOD ERROR', 405)
 
@@ -95,70 +111,139 @@ def task_provider(request):
     """ IF-FACEAI-002: FTP서버에서 처리할 이미지 정보를 제공하는 함수; 큐(Redis List)를 통해 단말기로 부터 전달받은 이미지 정보를 순서대로 제공
 
     구현 로직은 다음과 같다:
-    1. ftpid에 해당하는 큐(TASK_QUEUE_PREFIX + ftpid)에서 task 정보를 얽어온다
-    2. 읽어온 tasks를 pedding_task큐에 저장한다. (예외처리 용도)
-    3. Task의 Status를 STATUS.PENDDING로 업데이트
-    3. Pipeline방식으로 tasks에 속한 img 정보를 한꺼번에 읽어 온다
-    4. 읽어온 img정보로 json data생성
+    1. task queue backend(get_task_queue)를 통해 아래 작업을 Lua script 한 번으로 atomic하게 처리한다
+        - ftpid에 해당하는 큐(TASK_QUEUE_PREFIX + ftpid, lane별 큐)에서 task 정보를 얽어온다
+          lane이 여러 개이면 오래 기다린 lane을 먼저, 나머지는 priority weight 비율로 고른다
+        - 읽어온 tasks를 pedding_task큐에 저장한다. (예외처리 용도)
+        - Task의 Status를 STATUS.PENDDING로 업데이트
+        - tasks에 속한 img 정보를 읽어 온다
+    2. (work stealing) 자기 큐가 비었으면 settings.FACEAI_WORK_STEALING에 지정된 다른 ftpid의 큐 중
+       대기 task가 많은 큐에서 가져온다 (image_api.stealing); 가져올 task가 없으면 자기 큐를 wait초 동안 기다린다
+    3. 읽어온 img정보로 json data생성 (task가 FACEAI_JSON_STREAM_MIN개 이상이면 streaming 응답)
 
     Args:
         request (HTTP REQUEST):
             - limit: 읽어올 개수 지정 max=1000; defqult value=100
-            - ftpid: default value = 1
-    Returns: token별 이미지 리스트 정보
+            - ftpid: default value = 1 (업로드와 같이 '01', '1.0'은 '1'로 변환)
+            - consumer: stream backend에서 사용하는 consumer 이름; default value = 'ftp' + ftpid
+            - wait: queue가 비어 있을 때 task를 기다리는 최대 시간(초) max=MAX_POLL_WAIT; default value=0
+              task가 하나라도 들어오면 바로 limit개까지 읽어서 리턴한다
+            - steal: 0이면 work stealing을 사용하지 않는다; default value = 1
+            - max_images: 리턴할 task의 이미지 수 합계 상한; 생략하면 limit(token 개수)만 적용
+              queue 순서대로 꺼내다가 다음 task가 남은 개수를 넘으면 멈춘다 (task는 queue에 그대로 남음)
+              token은 나누지 않으므로 첫 task의 이미지가 max_images보다 많으면 그 task 하나만 리턴한다
+            - max_bytes: 리턴할 이미지 path 크기(byte) 합계 상한; max_images와 같은 방식으로 적용
+            - linger: 첫 task를 꺼낸 후 max_images(또는 limit)가 찰 때까지 더 기다리는 시간(초) max=MAX_DISPATCH_LINGER;
+              default value=0
+    Returns: token별 이미지 리스트 정보 (다른 ftpid에서 가져온 task는 원래 ftpid를 함께 리턴)
 
     """
-    ftpid = request.GET.get('ftpid', '1')
-    limit = int(request.GET.get('limit', '100'))
-    limit = min(1000, limit)
+    try:
+        ftpid = validate_ftpid(request.GET)
+        limit = validate_limit(request.GET, 100, 1000)
+        wait = validate_seconds(request.GET, 'wait', 0.0, MAX_POLL_WAIT)
+        budget = task_budget(request)
+    except ValidationFailed as e:
+        return json_error('Data Invalid', code=422, data=e.errors)
+    consumer = request.GET.get('consumer')
+    steal = request.GET.get('steal', '1') != '0' and bool(get_steal_sources(ftpid))
     #logger.info("%s ftpid %s, limit %s", 'IF-FACEAI-002', ftpid, limit)
 
-    conn = get_redis_connection('default')
-    # 1. ftpid에 해당하는 큐(TASK_QUEUE_PREFIX + ftpid)에서 task 정보를 얽어온다
-    tasklist = pop_task(conn, ftpid, limit)
+    conn = get_shard_ring().for_ftpid(ftpid).conn()
+    queue = get_task_queue()
+    # 1. pop + pedding 등록 + status 업데이트 + img 정보 조회 (Redis 왕복 1회)
+    tasklist = queue.dispatch(conn, ftpid, limit, consumer, 0 if steal else wait, budget)
 
-    # 2. 읽어온 tasks를 pedding_task큐에 저장한다
-    add_peddingtask(conn, tasklist)
+    # 3. 읽어온 img정보로 json data생성
+    result_list = [{'token': token, 'imglist': imglist} for token, imglist in tasklist]
+    if steal and not result_list:
+        # 2. 다른 ftpid의 큐에서 가져오고, 없으면 자기 큐를 기다린다
+        result_list = stolen_results(ftpid, steal_tasks(ftpid, limit, consumer, budget))
+        if not result_list and wait > 0:
+            tasklist = queue.dispatch(conn, ftpid, limit, consumer, wait, budget)
+            result_list = [{'token': token, 'imglist': imglist} for token, imglist in tasklist]
 
-    #3 Task의 Status를 STATUS.PENDDING로 업데이트
-    update_status_tasklist(conn, tasklist, STATUS.PENDDING.value)
-
-    # 4. Pipeline방식으로 tasks에 속한 img 정보를 한꺼번에 읽어 온다
-    imglist = imglist_pipelie(conn, tasklist)
-    # 5. 읽어온 img정보로 json data생성
-    result_list = []
-    start_index = 0
-    for taskinfo in tasklist:
-        imgids = taskinfo.get('imgstr').split('#')
-        end_index = start_index + len(imgids)
-        info = {}
-        info['token'] = taskinfo.get('token')
-        info['imglist'] = imglist[start_index : end_index]
-        result_list.append(info)
-        start_index = end_index
-
-    return json_response(result_list)
+    record_dispatch(result_list)
+    return json_list_response(result_list)
 
 @csrf_exempt
 def get_peddingtasks(request):
     """ IF-FACEAI-003: 처리된 이미지 meta정보를 저장하는 함수
     """
-    limit = request.GET.get('limit', 100)
-    conn = get_redis_connection('default')
-    pedding_tasks = conn.zrange(PEDDING_TASK_ZSET, 0, int(limit), desc=False, withscores=True)
+    try:
+        limit = validate_limit(request.GET, 100)
+    except ValidationFailed as e:
+        return json_error('Data Invalid', code=422, data=e.errors)
+    pedding_tasks = merge_shard_results([get_task_queue().pending(shard.conn(), limit)
+                                         for shard in get_shard_ring().shards], lambda task: task[1], limit + 1)
     #timestamp를 datetime로 변경
     #pedding_tasks = list(map(lambda task: (task[0], timetamp_formatter(task[1])), pedding_tasks))
     pedding_tasks = list(map(lambda task: {'token': task[0], 'createtime': timetamp_formatter(task[1])}, pedding_tasks))
-    return json_response(pedding_tasks)
+    return json_list_response(pedding_tasks)
+
+@csrf_exempt
+def dead_tasks(request):
+    """ IF-FACEAI-008: dead letter queue 조회 및 재처리
+
+    최대 시도 횟수(FACEAI_MAX_TASK_ATTEMPTS)를 넘어서 ABORT된 task를 조회하거나 다시 queue에 넣는다.
+    다시 넣은 task는 status가 CREATE로, 시도 횟수는 0으로 초기화된다.
+
+    Args:
+        request (HTTP REQUEST):
+            - GET: limit; default value=100
+                   dead letter로 이동한 시간 순서로 [{token, ftpid, attempts, deadtime}, ...] 리턴
+            - POST: tokens (json array) 또는 all=1 (오래된 순서로 limit개; default value=1000)
+                   다시 queue에 넣은 token 리스트 리턴
+    """
+    ring = get_shard_ring()
+    if request.method == 'POST':
+        if request.POST.get('all') == '1':
+            try:
+                limit = validate_limit(request.POST, 1000)
+            except ValidationFailed as e:
+                return json_error('Data Invalid', code=422, data=e.errors)
+            requeued = []
+            for shard in ring.shards:
+                conn = shard.conn()
+                requeued.extend(requeue_dead_tasks(conn, conn.zrange(DEAD_TASK_ZSET, 0, limit - len(requeued) - 1)))
+                if len(requeued) >= limit:
+                    break
+        else:
+            try:
+                tokens = dead_task_tokens(request.POST)
+            except ValidationFailed as e:
+                return json_error('Data Invalid', code=422, data=e.errors)
+            requeued = []
+            for shard, indexes in ring.group_tokens(tokens):
+                requeued.extend(requeue_dead_tasks(shard.conn(), [tokens[i] for i in indexes]))
+        logger.info("%s requeued: %s", 'IF-FACEAI-008', len(requeued))
+        return json_response({'requeued': requeued})
+
+    try:
+        limit = validate_limit(request.GET, 100)
+    except ValidationFailed as e:
+        return json_error('Data Invalid', code=422, data=e.errors)
+    shard_results = []
+    for shard in ring.shards:
+        conn = shard.conn()
+        dead = conn.zrange(DEAD_TASK_ZSET, 0, limit - 1, withscores=True)
+        pipline = conn.pipeline(False)
+        for token, _ in dead:
+            pipline.hmget(TASK_INFO_PREFIX + token, 'ftpid', 'attempts')
+        shard_results.append([(token, deadtime, ftpid, attempts)
+                              for (token, deadtime), (ftpid, attempts) in zip(dead, pipline.execute())])
+    return json_response(dead_task_list(shard_results, limit))
 
 @csrf_exempt
 def metainfo(request):
     """ IF-FACEAI-004: 처리된 이미지 meta정보를 저장하는 함수
 
     처리 로직
-    1. Redis Map에다 metainfo를 저장 (HashMap-> key:token, value: json_list)
+    1. Redis Map에다 metainfo를 저장 (HashMap-> key:token, value: 정규화/압축된 json_list)
     2. Task의 Status를 STATUS.COMPLETE로 업데이트
-    3. 처리된 token정보를 pedding_task에서 삭제
+    3. 처리된 token정보를 pedding_task에서 삭제 (stream backend: XACK)
+    4. 완료 event 기록 (info의 wait, info/events에서 사용)
+    Idempotency-Key header가 있으면 이미 COMPLETE된 task에 같은 key로 다시 보낸 요청은 저장하지 않고 성공한다
 
     Args: request (HTTP REQUEST):
             - token 필수
@@ -167,63 +252,246 @@ def metainfo(request):
     Returns: json_result
 
     """
-    valid_ser = MetainfoValidator(data=request.POST)
-    if valid_ser.is_valid():
-        token = request.POST['token']
-        metainfos = request.POST['metainfos']
-        logger.info("%s token: %s", 'IF-FACEAI-004', token)
-
-        conn = get_redis_connection('default')
-        meta_result_key = META_RESULT_PREFIX + token
-        conn.set(meta_result_key, metainfos)
-        conn.expire(meta_result_key + token, META_RESULT_AGE)  # 24시간 후 삭제
-        update_status_task(conn, token, STATUS.COMPLETE.value)
-        conn.zrem(PEDDING_TASK_ZSET, token)
+    try:
+        results = [(validate_metainfo(request.POST), None)]
+        keys = metainfo_keys(request, results)
+    except ValidationFailed as e:
+        logger.error("Data Invalid [detail_info]: %s", e.errors)
+        return json_error('Data Invalid', code=422, data=e.errors)
+
+    token, metainfos = results[0][0]['token'], results[0][0]['metainfos']
+    logger.info("%s token: %s", 'IF-FACEAI-004', token)
+
+    duplicates, conflicts, claims = claim_metainfos(results, keys)
+    if conflicts:
+        return json_error('Data Invalid', code=422, data=IdempotencyConflict().errors)
+    if duplicates:
+        get_metrics().record_replay('metainfo', 1)
         return json_response({})
+    conn = get_shard_ring().for_token(token).conn()
+    pipline = conn.pipeline(False)
+    save_metainfo(pipline, token, metainfos)
+    get_result_cache().publish_invalidation(pipline, [token])
+    try:
+        pipline.execute()
+    except Exception:
+        release_claims(claims)
+        raise
+    cache_metainfos([(token, metainfos)])
+    get_task_queue().ack(conn, [token])
+    get_metrics().record_status(STATUS.COMPLETE, 1)
+    return json_response({})
+
+@csrf_exempt
+def metainfo_bulk(request):
+    """ IF-FACEAI-009: 여러 token의 처리된 이미지 meta정보를 한 번에 저장하는 함수
+
+    metainfo와 동일한 처리를 item 단위로 수행한다. 모든 item은 serializer 한 번으로 검증하고, 검증을 통과한 item의
+    저장은 Redis node별로 pipeline 한 번, pending 삭제는 ZREM 한 번(stream backend: script 한 번)으로 처리한다.
+
+    Args:
+        request (HTTP REQUEST):
+            - method: POST
+            - results (json array): [{"token": "...", "metainfos": [...] 또는 "json 문자열"}, ...]
+              최대 MAX_BULK_RESULTS개
+            - Idempotency-Key header: item 순서를 붙여 item별 멱등성 key로 사용 (metainfo 참고)
+
+    Returns: {'saved': 저장된 개수, 'results': item 순서대로 [{'token', 'saved', 'errors'(실패 시),
+              'duplicate'(이미 저장된 재시도)}, ...]}
+    """
+    if request.method == 'POST':
+        try:
+            results = validate_metainfos(request.POST)
+            keys = metainfo_keys(request, results)
+        except ValidationFailed as e:
+            return json_error('Data Invalid', code=422, data=e.errors)
+
+        duplicates, conflicts, claims = claim_metainfos(results, keys)
+        new_results = [result for i, result in enumerate(results) if i not in duplicates and i not in conflicts]
+        tokens = []
+        try:
+            for shard, shard_results in group_valid_results(new_results):
+                conn = shard.conn()
+                pipline = conn.pipeline(False)
+                shard_tokens = queue_metainfos(pipline, shard_results)
+                pipline.execute()
+                get_task_queue().ack(conn, shard_tokens)
+                tokens.extend(shard_tokens)
+        except Exception:
+            release_claims(claims)
+            raise
+        cache_metainfos([(item['token'], item['metainfos']) for item, errors in new_results if errors is None])
+        get_metrics().record_status(STATUS.COMPLETE, len(tokens))
+        get_metrics().record_replay('metainfo', len(duplicates))
+        logger.info("%s results: %s, saved: %s, duplicate: %s", 'IF-FACEAI-009', len(results), len(tokens),
+                    len(duplicates))
+        return json_response({'saved': len(tokens),
+                              'results': bulk_metainfo_results(results, duplicates, conflicts)})
     else:
-        logger.error("Data Invalid [detail_info]: %s", valid_ser.errors)
-        return json_error('Data Invalid', code=422, data=valid_ser.errors)
+        return json_error('HTTP METHOD ERROR', 405)
 
 @csrf_exempt
 def info(request):
     """ IF-FACEAI-005: token에 해당하는 meta 정보 제공
     주의: token의 유효 시간은 META_RESULT_AGE에서 설정
+
+    Args:
+        request (HTTP REQUEST):
+            - token 필수
+            - wait: 처리중(CREATE/PENDDING)이면 완료 event를 기다리는 최대 시간(초) max=MAX_INFO_WAIT; default value=0
     """
     token = request.GET['token']
+    try:
+        wait = validate_seconds(request.GET, 'wait', 0.0, MAX_INFO_WAIT)
+    except ValidationFailed as e:
+        return json_error('Data Invalid', code=422, data=e.errors)
+    response = cached_info_response(token)
+    if response is not None:
+        return response
     status = get_status(token)
+    if wait > 0 and is_waiting_status(status):
+        status = wait_status_event(get_shard_ring().for_token(token).conn(), token, wait) or status
     logger.info("%s token: %s, status: %s", 'IF-FACEAI-005', token, status)
 
+    return info_response(token, status)
+
+@csrf_exempt
+def info_bulk(request):
+    """ IF-FACEAI-010: 여러 token의 status와 meta 정보를 한 번에 제공
+
+    모든 token의 status(HGET)와 meta 정보(MGET)를 Redis node별로 pipeline 한 번으로 조회하고,
+    저장된 meta 정보는 parse하지 않고 응답에 그대로 넣는다.
+
+    Args:
+        request (HTTP REQUEST):
+            - method: GET 또는 POST
+            - tokens 필수: json array 또는 콤마로 구분된 token 목록, 최대 MAX_BULK_INFO개
+            - status_only: true이면 meta 정보(data)는 조회하지 않는다; default value=false
+
+    Returns: {token: {'status': status, 'data': meta 정보 (COMPLETE가 아니면 [])}, ...}
+    """
+    valid_ser = BulkInfoValidator(data=request.POST if request.method == 'POST' else request.GET)
+    if not valid_ser.is_valid():
+        return json_error('Data Invalid', code=422, data=valid_ser.errors)
+
+    tokens = valid_ser.validated_data['tokens']
+    status_only = valid_ser.validated_data['status_only']
+    logger.info("%s tokens: %s, status_only: %s", 'IF-FACEAI-010', len(tokens), status_only)
+
+    statuses, metainfos = [None] * len(tokens), [None] * len(tokens)
+    for shard, indexes in get_shard_ring().group_tokens(tokens):
+        pipline = shard.raw_conn().pipeline(False)
+        queue_bulk_info(pipline, [tokens[i] for i in indexes], status_only)
+        fill_bulk_info(statuses, metainfos, indexes, pipline.execute(), status_only)
+    return bulk_info_response(tokens, statuses, metainfos, status_only)
+
+@csrf_exempt
+def info_events(request):
+    """ IF-FACEAI-007: token 처리 완료를 Server-Sent Events로 전달
+
+    처리중이면 SSE_HEARTBEAT초마다 keepalive comment를 보내면서 완료(COMPLETE/ABORT) event를 기다리고,
+    완료되거나 wait 시간이 지나면 info와 동일한 json을 'status' event로 한 번 보내고 종료한다.
+
+    Args:
+        request (HTTP REQUEST):
+            - token 필수
+            - wait: 최대 대기 시간(초) max=SSE_MAX_DURATION; default value=SSE_MAX_DURATION
+    """
+    token = request.GET['token']
+    try:
+        wait = validate_seconds(request.GET, 'wait', SSE_MAX_DURATION, SSE_MAX_DURATION)
+    except ValidationFailed as e:
+        return json_error('Data Invalid', code=422, data=e.errors)
+    response = StreamingHttpResponse(status_event_stream(token, wait), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+@csrf_exempt
+def prometheus_metrics(request):
+    """ IF-FACEAI-011: Prometheus 형식 metrics (image_api.metrics)
+
+    요청별 처리 시간/Redis 사용량, Redis 명령별 왕복 시간, task status 변경 횟수(모든 process의 합계)와
+    ftpid별 queue 길이, pending 개수/가장 오래된 task의 처리 시간, dead letter 개수(FACEAI_METRICS_SAMPLE_INTERVAL초마다 조회)
+    """
+    if not get_metrics().enabled:
+        return json_error('Not Found', 404)
+    return metrics_response()
+
+def info_response(token, status):
     if str(STATUS.COMPLETE.value) != status:
         return json_response([], status=status)
     else:
-        metainfo = get_info(token)
-        metainfo = metainfo.replace("\'", "\"")
-        return json_response(json.loads(metainfo), status=status)
-
-#Pipline방식으로 Redis List에서 item를 여러개를 한꺼번에 읽어오다
-def multi_pop(r, q, n):
-  p = r.pipeline()
-  p.multi()
-  p.lrange(q, 0, n - 1)
-  p.ltrim(q, n, -1)
-  return p.execute()
-
-#이미지 정보를 한꺼번에 읽어오다.
-def imglist_pipelie(conn, tasklist):
-    pipline = conn.pipeline(False)
-    for task in tasklist:
-        imgids = task.get('imgstr').split('#')
-        for imgid in imgids:
-            pipline.hgetall(FTP_IMAGE_PREFIX + imgid)
-    imglist = pipline.execute()
-    return imglist
-
-def tasklist_pipelie(conn, tasklist):
-    pipline = conn.pipeline(False)
-    for taskinfo_hashkey in tasklist:
-        pipline.hgetall(taskinfo_hashkey)
-    tasklist = pipline.execute()
-    return tasklist
+        generation = get_result_cache().generation()
+        pipline = get_shard_ring().for_token(token).raw_conn().pipeline(False)
+        queue_get_result(pipline, token)
+        return json_raw_response(cache_result(token, generation, *pipline.execute()), status=status)
+
+def cached_info_response(token):
+    """ result cache에 있는 COMPLETE token이면 Redis 조회 없이 info 응답을 만든다. 없으면 None """
+    payload = get_result_cache().get(token)
+    if payload is None:
+        return None
+    return json_raw_response(payload, status=str(STATUS.COMPLETE.value))
+
+def queue_get_result(pipline, token):
+    """ meta 정보와 남은 보관 시간 조회 명령을 pipeline에 추가 (raw connection, sync/async pipeline 공용) """
+    pipline.get(META_RESULT_PREFIX + token)
+    pipline.pttl(META_RESULT_PREFIX + token)
+
+def cache_result(token, generation, stored, pttl):
+    """ queue_get_result 결과를 JSON bytes로 변환하고 result cache에 넣는다 (generation: 조회 전의 generation()) """
+    if stored is None:
+        return b'[]'
+    payload = decode_metainfo(stored)
+    get_result_cache().put(token, payload, pttl / 1000.0 if pttl > 0 else META_RESULT_AGE, generation)
+    return payload
+
+def cache_metainfos(items):
+    """ 저장한 meta 정보로 이 process의 result cache를 갱신 (items: [(token, 정규화된 metainfos), ...]) """
+    result_cache = get_result_cache()
+    for token, metainfos in items:
+        result_cache.put(token, metainfos.encode('utf-8'), META_RESULT_AGE)
+
+def queue_bulk_info(pipline, tokens, status_only):
+    """ info_bulk 조회 명령을 pipeline에 추가 (raw connection, sync/async pipeline 공용) """
+    for token in tokens:
+        pipline.hget(TASK_INFO_PREFIX + token, 'status')
+    if not status_only:
+        pipline.mget([META_RESULT_PREFIX + token for token in tokens])
+
+def fill_bulk_info(statuses, metainfos, indexes, replies, status_only):
+    """ Redis node 하나의 queue_bulk_info 결과를 전체 token 순서(indexes)의 statuses, metainfos에 채운다 """
+    for i, status in zip(indexes, replies):
+        statuses[i] = status
+    if not status_only:
+        for i, metainfo in zip(indexes, replies[len(indexes)]):
+            metainfos[i] = metainfo
+
+def bulk_info_response(tokens, statuses, metainfos, status_only):
+    """ token별 status, meta 정보로 {token: {status, data}} 응답을 만든다 (meta 정보는 decode 없이 그대로 사용) """
+    items = []
+    for token, status, metainfo in zip(tokens, statuses, metainfos):
+        status = STATUS.EMPTY.value if status is None else status.decode()
+        item = b'{"status": ' + json.dumps(status).encode()
+        if not status_only:
+            if metainfo is not None and str(STATUS.COMPLETE.value) == status:
+                item += b', "data": ' + decode_metainfo(metainfo)
+            else:
+                item += b', "data": []'
+        items.append(json.dumps(token).encode() + b': ' + item + b'}')
+    return json_raw_response(b'{' + b', '.join(items) + b'}')
+
+def status_event_stream(token, wait):
+    conn = get_shard_ring().for_token(token).conn()
+    deadline = time.time() + wait
+    status = get_status(token)
+    while is_waiting_status(status):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        yield ': keepalive\n\n'
+        status = wait_status_event(conn, token, min(SSE_HEARTBEAT, remaining)) or status
+    yield sse_event('status', info_response(token, status).content.decode())
 
 #빈 스트림 여부를 체크하는 함수.
 def isEmpty(str):
@@ -231,117 +499,385 @@ def isEmpty(str):
         return True
     return False
 
-def create_token():
-    return str(uuid1())
+def create_token(ftpid):
+    """ ftpid의 queue와 같은 Redis node에 배치되는 token """
+    return get_shard_ring().create_token(ftpid)
+
+def task_budget(request):
+    """ task_provider의 max_images, max_bytes, linger 파라미터 (모두 생략하면 None, 잘못된 값이면 ValidationFailed) """
+    max_images, max_bytes, linger = validate_budget(request.GET)
+    linger = min(MAX_DISPATCH_LINGER, linger)
+    if not (max_images or max_bytes or linger):
+        return None
+    return TaskBudget(max_images, max_bytes, linger)
+
+def stolen_results(ftpid, stolen):
+    """ steal_tasks 결과를 task_provider 응답 형식으로 변환 (원래 ftpid 포함) """
+    if stolen:
+        logger.info("%s ftpid %s stole %s tasks from %s", 'IF-FACEAI-002', ftpid, len(stolen),
+                    sorted(set(source for source, _, _ in stolen)))
+    return [{'token': token, 'imglist': imglist, 'ftpid': source} for source, token, imglist in stolen]
+
+def record_dispatch(result_list):
+    """ task_provider에서 배분한 task 개수를 metrics에 기록 """
+    metrics = get_metrics()
+    metrics.observe('faceai_dispatch_batch_size', len(result_list))
+    metrics.observe('faceai_dispatch_batch_images', sum(len(result['imglist']) for result in result_list))
+    metrics.record_status(STATUS.PENDDING, len(result_list))
+
+def merge_shard_results(shard_results, key, limit):
+    """ Redis node별로 정렬된 결과를 key 순서로 합쳐서 limit개를 리턴 (node가 하나이면 그대로) """
+    if len(shard_results) == 1:
+        return shard_results[0][:limit]
+    return sorted([row for rows in shard_results for row in rows], key=key)[:limit]
 
 def redis_hemset(conn, hashname, mappings, expire=None):
-    conn.hmset(hashname, mappings)
+    conn.hset(hashname, mapping=mappings)
     if expire is not None:
         conn.expire(hashname, expire)  # 24시간 후 삭제
 
-def save_imginfo(conn, ftpid, img):
-    img_id = str(conn.incr('ftp_img:'))
-    now = time.time()
+def alloc_imgids(shard, count):
+    """ shard(Redis node)의 counter에서 count개의 이미지 id를 INCRBY 한 번으로 할당한다 """
+    if count == 0:
+        return []
+    return shard.image_ids(shard.conn().incrby(FTP_IMAGE_PREFIX, count), count)
+
+def save_imginfo(pipline, ftpid, img, img_id, now):
     imginfo = FTP_IMAGE_PREFIX + img_id
-    redis_hemset(conn, imginfo, {
+    redis_hemset(pipline, imginfo, {
         'id': img_id,
         'path': img['path'],
         'ftpid': ftpid,
         'create_time': now
     }, IMG_INFO_AGE)
-    return img_id
 
-def save_imginfos(conn, ftpid, imglist):
-    imgid_list = []
-    for img in imglist:
-        img_id = save_imginfo(conn, ftpid, img)
-        imgid_list.append(img_id)
-    return imgid_list
+def save_imginfos(pipline, ftpid, imglist, imgid_list, now):
+    for img, img_id in zip(imglist, imgid_list):
+        save_imginfo(pipline, ftpid, img, img_id, now)
 
-def save_taskinfo(conn, token, imgid_list):
+def save_taskinfo(pipline, token, ftpid, imgid_list, now, lane=None):
     imgstr = '#'.join([str(el) for el in imgid_list])
     taskinfo = TASK_INFO_PREFIX + token
-    conn.hmset(taskinfo, {
+    redis_hemset(pipline, taskinfo, with_lane({
         'token': token,
+        'ftpid': ftpid,
         'imgstr': imgstr,
-        'create_time': time.time(),
+        'create_time': now,
         'status': STATUS.CREATE.value
-    })
-    conn.expire(taskinfo, TASK_INFO_AGE)
-
-def push_task(conn, ftpid, token):
-    taskinfo_key = TASK_INFO_PREFIX + token
-    conn.rpush(TASK_QUEUE_PREFIX + ftpid, taskinfo_key)
-
-def pop_task(conn, ftpid, limit):
-    result = multi_pop(conn, TASK_QUEUE_PREFIX + ftpid, limit)
-    k_list = list(filter(None, result[0]))
-    tasklist = tasklist_pipelie(conn, k_list)
-    return tasklist
-
-def add_peddingtask(conn, tasklist):
-    if len(tasklist) > 0:
-        # conn.rpush(PEDDING_TASK_QUEUE_PREFIX + ftpid, *tasklist)
-        timestamp = time.time()
-        for task in tasklist:
-            token = task.get('token')
-            conn.zadd(PEDDING_TASK_ZSET, {token: timestamp})
-
-def update_status_tasklist(conn, tasklist, status):
-    pipline = conn.pipeline(False)
-    for task in tasklist:
-        token = task.get('token')
-        pipline.hset(TASK_INFO_PREFIX + token, 'status', status)
-    pipline.execute()
+    }, lane), TASK_INFO_AGE)
+
+def with_lane(taskinfo, lane):
+    """ 기본 lane이 아니면 재시도 시 같은 lane에 다시 넣을 수 있도록 taskinfo에 lane을 기록 """
+    if lane is not None:
+        taskinfo['lane'] = lane
+    return taskinfo
+
+def pack_images(imglist, imgid_list):
+    """ 이미지 목록을 packed 형식 문자열로 변환: '첫 이미지 id\\0path\\0path...' (이미지 id는 연속) """
+    if not imgid_list:
+        return ''
+    return '\0'.join([str(imgid_list[0])] + [img['path'] for img in imglist])
+
+def save_packed_taskinfo(pipline, token, ftpid, imglist, imgid_list, now, lane=None):
+    """ 이미지 정보를 별도 key(ftp_img:<id>) 없이 taskinfo의 imgs 필드에 함께 저장 (FACEAI_TASK_STORAGE = 'packed')
+
+    이미지의 ftpid, create_time은 task와 같으므로 task에만 저장하고, task 배분 시 Lua script에서
+    hash 형식과 같은 이미지 정보로 풀어서 리턴한다.
+    """
+    redis_hemset(pipline, TASK_INFO_PREFIX + token, with_lane({
+        'token': token,
+        'ftpid': ftpid,
+        'imgs': pack_images(imglist, imgid_list),
+        'create_time': now,
+        'status': STATUS.CREATE.value
+    }, lane), TASK_INFO_AGE)
+
+def is_packed_storage():
+    return getattr(settings, 'FACEAI_TASK_STORAGE', 'hash') == 'packed'
+
+def save_uploads(uploads, keys=None):
+    """ 업로드 batch 여러 개를 한꺼번에 등록한다
+
+    ftpid의 Redis node별로 이미지 id는 node의 이미지 수만큼 INCRBY 한 번으로 할당하고,
+    이미지 정보, task 정보, expire, task_queue 추가는 pipeline 한 번으로 저장한다. (node당 Redis 왕복 2회)
+    멱등성 key가 있으면 INCRBY와 같은 pipeline에서 key를 등록(SET NX)하고, 이미 등록된 batch는 저장하지 않고
+    처음 요청의 token을 리턴한다. (Redis 왕복 횟수는 같음) 처음 요청과 내용이 다르면 IdempotencyConflict
+
+    Args:
+        uploads: [(ftpid, imglist, lane), ...] (lane: make_lane의 리턴값, 기본 lane이면 None)
+        keys: idempotency.upload_keys의 batch별 멱등성 key (None이면 사용하지 않음)
+
+    Returns: batch 순서대로 token 리스트
+    """
+    tokens = [None] * len(uploads)
+    created = 0
+    for shard, indexes in get_shard_ring().group_ftpids([upload[0] for upload in uploads]):
+        conn = shard.conn()
+        shard_uploads = [uploads[i] for i in indexes]
+        shard_keys = [keys[i] for i in indexes] if keys else None
+        if shard_keys:
+            pipline = conn.pipeline(False)
+            new_tokens = queue_upload_claims(pipline, shard_uploads, shard_keys)
+            try:
+                shard_tokens, new, imgids = claimed_uploads(shard, shard_uploads, shard_keys, new_tokens,
+                                                            pipline.execute())
+            except IdempotencyConflict as e:
+                if e.created_keys:
+                    conn.delete(*e.created_keys)
+                raise
+        else:
+            shard_tokens = new_tokens = None
+            new = list(range(len(shard_uploads)))
+            imgids = alloc_imgids(shard, sum(len(imglist) for _, imglist, _ in shard_uploads))
+        if new:
+            pipline = conn.pipeline(False)
+            new_tokens = queue_uploads(pipline, [shard_uploads[j] for j in new], imgids,
+                                       new_tokens and [new_tokens[j] for j in new])
+            try:
+                pipline.execute()
+            except Exception:
+                # 저장하지 못한 batch의 key가 남아 있으면 재시도가 저장되지 않은 token을 받게 된다
+                if shard_keys:
+                    conn.delete(*[shard_keys[j] for j in new])
+                raise
+        for i, token in zip(indexes, shard_tokens or new_tokens):
+            tokens[i] = token
+        created += len(new)
+    get_metrics().record_status(STATUS.CREATE, created)
+    get_metrics().record_replay('upload', len(tokens) - created)
+    return tokens
+
+def queue_upload_claims(pipline, uploads, keys):
+    """ batch별 멱등성 key 등록(SET NX, GET)과 전체 이미지 id 할당(INCRBY) 명령을 pipeline에 추가 (sync/async 공용)
+
+    Returns: batch 순서대로 새로 만든 token 리스트 (key에 등록할 값)
+    """
+    tokens = [create_token(ftpid) for ftpid, _, _ in uploads]
+    queue_claims(pipline, keys, tokens, upload_digests(uploads))
+    pipline.incrby(FTP_IMAGE_PREFIX, sum(len(imglist) for _, imglist, _ in uploads))
+    return tokens
+
+def claimed_uploads(shard, uploads, keys, tokens, replies):
+    """ queue_upload_claims의 pipeline 결과
+
+    중복 batch에 할당된 이미지 id는 사용하지 않는다. (저장할 batch가 앞에서부터 차례로 사용)
+    처음 요청과 내용이 다른 batch가 있으면 IdempotencyConflict (created_keys: 새로 등록한 key)
+
+    Returns: (batch 순서대로 token (중복이면 처음 요청의 token), 저장할 batch의 index 리스트, 이미지 id 리스트)
+    """
+    claims = claimed(keys, tokens, upload_digests(uploads), replies)
+    if any(conflict for _, _, conflict in claims):
+        raise IdempotencyConflict([key for key, (created, _, _) in zip(keys, claims) if created])
+    imgids = shard.image_ids(replies[-1], sum(len(imglist) for _, imglist, _ in uploads))
+    return [token for _, token, _ in claims], [j for j, (created, _, _) in enumerate(claims) if created], imgids
+
+def admit_and_save_uploads(request, uploads, keys=None):
+    """ admission control을 통과한 업로드만 save_uploads로 저장
+
+    Returns: (token 리스트, None) 또는 거절되면 (None, admission.Rejected)
+    """
+    try:
+        rejected = admit_uploads(uploads, client_id(request))
+        if rejected is not None:
+            return None, rejected
+        return save_uploads(uploads, keys), None
+    except ResponseError as e:
+        return None, memory_rejected(e)
+
+def queue_uploads(pipline, uploads, imgids, tokens=None):
+    """ 업로드 batch 저장 명령을 pipeline에 추가하고 token 리스트를 리턴 (sync/async pipeline 공용)
+
+    Args:
+        pipline: redis pipeline
+        uploads: [(ftpid, imglist, lane), ...]
+        imgids: alloc_imgids로 할당된 전체 이미지 id (pipeline과 같은 Redis node)
+        tokens: batch별로 사용할 token (멱등성 key에 먼저 등록한 token); None이면 새로 만든다
+    """
+    now = time.time()
+    packed = is_packed_storage()
+    new_tokens = []
+    offset = 0
+    for index, (ftpid, imglist, lane) in enumerate(uploads):
+        token = tokens[index] if tokens else create_token(ftpid)
+        imgid_list = imgids[offset: offset + len(imglist)]
+        offset += len(imglist)
+        if packed:
+            #1-2. 이미지 정보를 포함한 taskinfo 저장, expire시간 지정
+            save_packed_taskinfo(pipline, token, ftpid, imglist, imgid_list, now, lane)
+        else:
+            #1. 이미지 정보 저장
+            save_imginfos(pipline, ftpid, imglist, imgid_list, now)
+            #2. token에 해당하는 taskinfo 저장, expire시간 지정
+            save_taskinfo(pipline, token, ftpid, imgid_list, now, lane)
+        #3. Ftpid(lane)에 해당하는 task_queue에 task정보를 추가
+        get_task_queue().push(pipline, ftpid, token, lane)
+        new_tokens.append(token)
+    return new_tokens
+
+def save_metainfo(pipline, token, metainfos):
+    """ metainfo 저장, status를 COMPLETE로 변경 및 완료 event 기록 명령을 pipeline에 추가 (sync/async pipeline 공용)
+
+    metainfos는 validate_metainfo에서 정규화된 JSON 문자열
+    """
+    pipline.set(META_RESULT_PREFIX + token, encode_metainfo(metainfos), ex=META_RESULT_AGE)  # 24시간 후 삭제
+    pipline.hset(TASK_INFO_PREFIX + token, 'status', STATUS.COMPLETE.value)
+    publish_status_event(pipline, token, STATUS.COMPLETE.value)
+
+def queue_metainfos(pipline, results):
+    """ validate_metainfos에서 검증을 통과한 item의 저장 명령을 pipeline에 추가 (sync/async pipeline 공용)
+
+    Returns: 저장한 token 리스트
+    """
+    tokens = []
+    for item, errors in results:
+        if errors is None:
+            save_metainfo(pipline, item['token'], item['metainfos'])
+            tokens.append(item['token'])
+    get_result_cache().publish_invalidation(pipline, tokens)
+    return tokens
+
+def group_valid_results(results):
+    """ 검증을 통과한 item을 token의 Redis node별로 나눈다. Returns: [(shard, [(item, None), ...]), ...] """
+    valid = [(item, errors) for item, errors in results if errors is None]
+    return [(shard, [valid[i] for i in indexes])
+            for shard, indexes in get_shard_ring().group_tokens([item['token'] for item, _ in valid])]
+
+def group_metainfo_claims(results, keys):
+    """ 멱등성 key가 있는 item을 token의 Redis node별로 나눈다. Returns: [(shard, [(results에서의 index, key), ...]), ...] """
+    keyed = [(i, key) for i, key in enumerate(keys or []) if key is not None]
+    return [(shard, [keyed[j] for j in indexes])
+            for shard, indexes in get_shard_ring().group_tokens([results[i][0]['token'] for i, _ in keyed])]
+
+def queue_metainfo_claims(pipline, results, shard_keys):
+    """ item별 멱등성 key 등록(SET NX, GET)과 task status 조회 명령을 pipeline에 추가 (sync/async 공용) """
+    items = [results[i][0] for i, _ in shard_keys]
+    tokens = [item['token'] for item in items]
+    queue_claims(pipline, [key for _, key in shard_keys], tokens, metainfo_digests(items))
+    for token in tokens:
+        pipline.hget(TASK_INFO_PREFIX + token, 'status')
+
+def claimed_metainfos(results, shard_keys, replies):
+    """ queue_metainfo_claims의 pipeline 결과
+
+    key가 이미 등록되어 있어도 task가 COMPLETE가 아니면 (처음 요청이 저장 전에 실패) 중복으로 보지 않고 다시 저장한다.
+    처음 요청과 metainfos가 다르면 저장하지 않는다. (conflict)
+
+    Returns: (중복 item의 index 리스트, conflict item의 index 리스트, 새로 등록한 key 리스트)
+    """
+    keys = [key for _, key in shard_keys]
+    items = [results[i][0] for i, _ in shard_keys]
+    claims = claimed(keys, [item['token'] for item in items], metainfo_digests(items), replies)
+    statuses = replies[2 * len(keys):]
+    duplicates, conflicts, new_keys = [], [], []
+    for (i, key), (created, _, conflict), status in zip(shard_keys, claims, statuses):
+        if created:
+            new_keys.append(key)
+        elif conflict:
+            conflicts.append(i)
+        elif str(status) == str(STATUS.COMPLETE.value):
+            duplicates.append(i)
+    return duplicates, conflicts, new_keys
+
+def claim_metainfos(results, keys):
+    """ item별 멱등성 key를 token의 Redis node에 등록한다 (key가 있으면 node당 pipeline 한 번)
+
+    Returns: (중복 item의 index set, conflict item의 index set, [(shard, 새로 등록한 key 리스트), ...])
+    """
+    duplicates, conflicts, claims = set(), set(), []
+    for shard, shard_keys in group_metainfo_claims(results, keys):
+        pipline = shard.conn().pipeline(False)
+        queue_metainfo_claims(pipline, results, shard_keys)
+        shard_duplicates, shard_conflicts, new_keys = claimed_metainfos(results, shard_keys, pipline.execute())
+        duplicates.update(shard_duplicates)
+        conflicts.update(shard_conflicts)
+        claims.append((shard, new_keys))
+    return duplicates, conflicts, claims
+
+def release_claims(claims):
+    """ 저장에 실패한 요청의 멱등성 key를 삭제해서 재시도가 다시 저장하게 한다 """
+    for shard, keys in claims:
+        if keys:
+            shard.conn().delete(*keys)
+
+def bulk_metainfo_results(results, duplicates=(), conflicts=()):
+    result_list = []
+    for index, (item, errors) in enumerate(results):
+        token = item.get('token') if isinstance(item, dict) else None
+        if index in duplicates:
+            result_list.append({'token': token, 'saved': True, 'duplicate': True})
+        elif index in conflicts:
+            result_list.append({'token': token, 'saved': False, 'errors': IdempotencyConflict().errors})
+        elif errors is None:
+            result_list.append({'token': token, 'saved': True})
+        else:
+            result_list.append({'token': token, 'saved': False, 'errors': errors})
+    return result_list
+
+def publish_status_event(pipline, token, status):
+    """ token의 처리 완료(COMPLETE/ABORT) event를 token별 stream(META_EVENT_PREFIX + token)에 기록
+
+    stream에 남아 있으므로 event가 기록된 후에 기다리기 시작한 client도 바로 받을 수 있다.
+    """
+    event_key = META_EVENT_PREFIX + token
+    pipline.xadd(event_key, {'status': status}, maxlen=1, approximate=False)
+    pipline.expire(event_key, META_RESULT_AGE)
+
+def wait_status_event(conn, token, timeout):
+    """ 최대 timeout초 동안 token의 완료 event를 기다린다
+
+    Returns: event의 status, timeout이면 None
+    """
+    found = conn.xread({META_EVENT_PREFIX + token: '0'}, count=1, block=max(1, int(timeout * 1000)))
+    if not found:
+        return None
+    return found[0][1][-1][1]['status']
+
+def is_waiting_status(status):
+    return str(status) in (str(STATUS.CREATE.value), str(STATUS.PENDDING.value))
+
+def dead_task_tokens(data):
+    """ IF-FACEAI-008 POST의 tokens (json array) """
+    try:
+        tokens = json.loads(data.get('tokens', ''))
+    except ValueError:
+        tokens = None
+    if not isinstance(tokens, list):
+        raise ValidationFailed({'tokens': ['tokens must be a json array']})
+    return [str(token) for token in tokens]
+
+def dead_task_list(shard_results, limit):
+    """ shard별 [(token, deadtime, ftpid, attempts), ...]를 dead letter로 이동한 시간 순서의 IF-FACEAI-008 GET 응답으로 """
+    return [{'token': token, 'ftpid': ftpid, 'attempts': attempts, 'deadtime': timetamp_formatter(deadtime)}
+            for token, deadtime, ftpid, attempts in merge_shard_results(shard_results, lambda task: task[1], limit)]
+
+def requeue_dead_args(tokens):
+    queue = get_task_queue()
+    return [
+        TASK_INFO_PREFIX, META_EVENT_PREFIX, queue.queue_prefix, queue.name, STATUS.CREATE.value,
+        TASK_LANE_PREFIX, TASK_STREAM_SET, time.time(),
+    ] + [str(token) for token in tokens]
+
+def requeue_dead_tasks(conn, tokens):
+    """ dead letter queue의 task를 다시 queue에 넣는다. Returns: 다시 넣은 token 리스트 """
+    if not tokens:
+        return []
+    requeued = run_script(conn, REQUEUE_DEAD_TASKS, keys=[DEAD_TASK_ZSET], args=requeue_dead_args(tokens))
+    get_metrics().record_status(STATUS.CREATE, len(requeued))
+    return requeued
 
 def update_status_task(conn, token, status):
     pipline = conn.pipeline(False)
     pipline.hset(TASK_INFO_PREFIX + token, 'status', status)
     pipline.execute()
 
-def get_info(token):
-    conn = get_redis_connection('default')
-    metainfo = conn.get(META_RESULT_PREFIX + token)
-    return metainfo
-
 def get_status(token):
-    conn = get_redis_connection('default')
+    conn = get_shard_ring().for_token(token).conn()
     status = conn.hget(TASK_INFO_PREFIX + token, 'status')
     if status is None:
         return STATUS.EMPTY.value
     return status
 
 def get_taskinfo(token):
-    conn = get_redis_connection('default')
+    conn = get_shard_ring().for_token(token).conn()
     taskinfo = conn.hgetall(TASK_INFO_PREFIX + token)
     return taskinfo
-
-def process_exception():
-    """ 장기간 동안 처리결과를 받지 못하는 pedding task를 처리하는 Process
-
-    20분 동안 처리결과가 안오면, PEDDING_TASK_ZSET 해당 정보를 삭제 후 taskinfo를 pedding.log 파일에 기록
-
-    """
-    while True:
-        try:
-            time.sleep(10)
-            conn = get_redis_connection('default')
-            pedding_task = conn.zrange(PEDDING_TASK_ZSET, 0, 100, desc=False, withscores=True)
-            for task in pedding_task:
-                token, timestamp = task
-                diff = time.time() - timestamp
-                if diff > PEDDING_TASK_AGE:
-                    tokeninfo = get_taskinfo(token)
-                    tokeninfo_str = json.dumps(tokeninfo)
-                    logger_pedding.error(tokeninfo_str)
-                    conn.zrem(PEDDING_TASK_ZSET, token)
-                    update_status_task(conn,token,STATUS.ABORT.value)
-        except Exception as e:
-            logger.error("exception occured: %s", e)
-
-exception_processor = multiprocessing.Process(
-    name='exception_processor',
-    target=process_exception,
-)
-exception_processor.daemon = True
-exception_processor.start()
\ No newline at end of file
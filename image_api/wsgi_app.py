@@ -0,0 +1,81 @@
+"""image_api의 API view를 Django middleware 없이 실행하는 WSGI application
+
+FTP서버와 단말기가 호출하는 API(API_ROUTES: /ftp/*, /metainfo*)는 session, auth, messages, CSRF, clickjacking,
+CORS middleware를 사용하지 않으므로 이 application이 URL resolve와 middleware 없이 view를 바로 호출한다.
+browser/dashboard에서도 조회하는 /info* (CORS_ROUTES)는 settings.MIDDLEWARE의 CorsMiddleware만 적용해서 호출하고
+나머지 경로(admin, /metrics 등)는 Django application으로 넘긴다. (async_app.AsyncApiApplication의 WSGI 버전)
+settings.FACEAI_WSGI_API = False 이면 모든 요청을 Django application으로 넘긴다.
+"""
+import logging
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.utils.module_loading import import_string
+from image_api.metrics import get_metrics
+from image_api.utils import json_error
+
+logger = logging.getLogger('api.custom')
+
+# middleware 없이 호출하는 경로: view 이름 (views, async_views 공통)
+API_ROUTES = {
+    '/ftp/imginfo/': 'create_ftpimginfo',
+    '/ftp/imginfo/bulk/': 'create_ftpimginfos',
+    '/ftp/tasks/': 'task_provider',
+    '/ftp/peddingtasks/': 'get_peddingtasks',
+    '/ftp/deadtasks/': 'dead_tasks',
+    '/metainfo/': 'metainfo',
+    '/metainfo/bulk/': 'metainfo_bulk',
+}
+# CorsMiddleware만 적용해서 호출하는 경로: view 이름
+CORS_ROUTES = {
+    '/info/': 'info',
+    '/info/bulk/': 'info_bulk',
+    '/info/events/': 'info_events',
+}
+CORS_MIDDLEWARE = 'corsheaders.middleware.CorsMiddleware'
+
+
+def cors_middleware():
+    """ settings.MIDDLEWARE에 CorsMiddleware가 있으면 그 class, 없으면 None """
+    if CORS_MIDDLEWARE in settings.MIDDLEWARE:
+        return import_string(CORS_MIDDLEWARE)
+    return None
+
+
+def wsgi_routes():
+    """ Returns: {경로: (view 이름, handler)} """
+    from image_api import views
+    routes = {path: (name, getattr(views, name)) for path, name in API_ROUTES.items()}
+    cors = cors_middleware()
+    for path, name in CORS_ROUTES.items():
+        view = getattr(views, name)
+        routes[path] = (name, view if cors is None else cors(view))
+    return routes
+
+
+class ApiWSGIApplication:
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.enabled = getattr(settings, 'FACEAI_WSGI_API', True)
+        self.routes = wsgi_routes() if self.enabled else {}
+
+    def __call__(self, environ, start_response):
+        route = self.routes.get(environ.get('PATH_INFO'))
+        if route is None:
+            return self.fallback(environ, start_response)
+
+        name, handler = route
+        request = WSGIRequest(environ)
+        tracker = get_metrics().start_request()
+        try:
+            response = handler(request)
+        except Exception as e:
+            logger.exception("exception occured: %s", e)
+            response = json_error('Internal Server Error', 500)
+            response.status_code = 500
+        if tracker is not None:
+            tracker.finish(name, response.status_code)
+
+        start_response('%d %s' % (response.status_code, response.reason_phrase), list(response.items()))
+        # response를 그대로 리턴하면 server가 body 전송 후 close()를 호출한다 (streaming response 포함)
+        return response
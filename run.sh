@@ -1,2 +1,5 @@
 #!/bin/bash
-python3 manage.py runserver 0.0.0.0:8000
\ No newline at end of file
+# 운영 server: worker process 여러 개 + pending task reaper 하나 (image_api.server, settings.FACEAI_SERVER 참고)
+# graceful reload: kill -HUP <master pid>
+# 개발 중에는 python3 manage.py runserver 0.0.0.0:8000 (reaper는 python3 manage.py reaper)
+exec python3 manage.py serve --settings=faceai_central.settings_production "$@"